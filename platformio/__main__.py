@@ -19,9 +19,8 @@ from sys import exit as sys_exit
 from traceback import format_exc
 
 import click
-import requests
 
-from platformio import __version__, exception, maintenance
+from platformio import __version__, exception
 from platformio.util import get_source_dir
 
 
@@ -69,6 +68,7 @@ class PlatformioCLI(click.MultiCommand):  # pylint: disable=R0904
 @click.option("--caller", "-c", help="Caller ID (service).")
 @click.pass_context
 def cli(ctx, force, caller):
+    from platformio import maintenance
     if not caller and getenv("PLATFORMIO_CALLER"):
         caller = getenv("PLATFORMIO_CALLER")
     maintenance.on_platformio_start(ctx, force, caller)
@@ -77,23 +77,19 @@ def cli(ctx, force, caller):
 @cli.resultcallback()
 @click.pass_context
 def process_result(ctx, result, force, caller):  # pylint: disable=W0613
+    from platformio import maintenance
     maintenance.on_platformio_end(ctx, result)
 
 
 def main():
+    if getenv("PLATFORMIO_TRACE_IMPORTS"):
+        from platformio.importtrace import ImportTracer
+        ImportTracer().install()
+
     try:
         if "cygwin" in system().lower():
             raise exception.CygwinEnvDetected()
 
-        # https://urllib3.readthedocs.org
-        # /en/latest/security.html#insecureplatformwarning
-        try:
-            requests.packages.urllib3.disable_warnings()
-        except AttributeError:
-            raise exception.PlatformioException(
-                "Invalid installation of Python `requests` package`. See "
-                "< https://github.com/platformio/platformio/issues/252 >")
-
         # handle PLATFORMIO_FORCE_COLOR
         if str(getenv("PLATFORMIO_FORCE_COLOR", "")).lower() == "true":
             try:
@@ -105,6 +101,7 @@ def main():
         cli(None, None, None)
     except Exception as e:  # pylint: disable=W0703
         if not isinstance(e, exception.ReturnErrorCode):
+            from platformio import maintenance
             maintenance.on_platformio_exception(e)
             error_str = "Error: "
             if isinstance(e, exception.PlatformioException):
@@ -12,13 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import atexit
 import json
+import os
 from copy import deepcopy
 from os import environ, getenv
-from os.path import getmtime, isfile, join
-from time import time
-
-from lockfile import LockFile
+from os.path import isfile, join
+from threading import RLock
 
 from platformio import __version__, util
 from platformio.exception import InvalidSettingName, InvalidSettingValue
@@ -48,6 +48,30 @@ DEFAULT_SETTINGS = {
         "description": "Force verbose output when processing environments",
         "value": False
     },
+    "build_jobs": {
+        "description":
+        ("The total number of parallel build jobs shared by all "
+         "PlatformIO processes (0 - the number of CPUs)"),
+        "value": 0
+    },
+    "skip_unchanged_builds": {
+        "description":
+        ("Skip the build system when project sources, libraries and "
+         "options were not changed since the last successful build (Yes/No)"),
+        "value": False
+    },
+    "enable_build_log": {
+        "description":
+        ("Save the whole output of the build system to the rotating log "
+         "file in the build folder of the environment (Yes/No)"),
+        "value": False
+    },
+    "enable_build_history": {
+        "description":
+        ("Record duration, object cache hits and program size of the "
+         "processed environments to the local database (Yes/No)"),
+        "value": False
+    },
     "enable_telemetry": {
         "description":
         ("Telemetry service <http://docs.platformio.org/en/stable/"
@@ -69,49 +93,125 @@ SESSION_VARS = {"command_ctx": None, "force_option": False, "caller_id": None}
 
 
 class State(object):
+    """Application state which is stored in ``appstate.json``.
 
-    def __init__(self, path=None, lock=False):
+    The file is read once per process, the changes are kept in memory and
+    written back by :meth:`flush` (at exit at the latest). The items which
+    were changed by this process are merged into the file under the
+    advisory lock, so concurrent processes do not lose their changes.
+    """
+
+    _DELETED = object()
+
+    def __init__(self, path):
         self.path = path
-        self.lock = lock
-        if not self.path:
-            self.path = join(util.get_home_dir(), "appstate.json")
-        self._state = {}
-        self._prev_state = {}
-        self._lockfile = None
-
-    def __enter__(self):
-        try:
-            self._lock_state_file()
+        self.io_stats = {"reads": 0, "writes": 0}
+        self._data = None
+        self._changes = {}
+        self._lock = RLock()
+
+    def get(self, name, default=None):
+        with self._lock:
+            if name in self._changes:
+                value = self._changes[name]
+            else:
+                value = self._get_data().get(name, self._DELETED)
+                # the keys which were changed by `set_item`
+                for key, item in self._changes.items():
+                    if isinstance(key, tuple) and key[0] == name:
+                        value = self._merge_item(value, key[1], item)
+            return default if value is self._DELETED else deepcopy(value)
+
+    def set(self, name, value):
+        with self._lock:
+            self._drop_item_changes(name)
+            self._changes[name] = deepcopy(value)
+
+    def set_item(self, name, key, value):
+        """Change one key of the dictionary item, the rest keys of this
+        item which are changed by the concurrent processes are kept."""
+        with self._lock:
+            if name in self._changes:
+                self._changes[name] = self._merge_item(
+                    self._changes[name], key, deepcopy(value))
+            else:
+                self._changes[(name, key)] = deepcopy(value)
+
+    def delete(self, name):
+        with self._lock:
+            self._drop_item_changes(name)
+            self._changes[name] = self._DELETED
+
+    def _drop_item_changes(self, name):
+        for key in list(self._changes):
+            if isinstance(key, tuple) and key[0] == name:
+                del self._changes[key]
+
+    @staticmethod
+    def _merge_item(value, key, item):
+        value = dict(value) if isinstance(value, dict) else {}
+        value[key] = item
+        return value
+
+    def flush(self):
+        with self._lock:
+            if not self._changes:
+                return
+            with open(self.path + ".lock", "w") as lockfp:
+                util.lock_file(lockfp)
+                try:
+                    # the state could be changed by another process
+                    self._data = None
+                    data = self._get_data()
+                    for name, value in self._changes.items():
+                        if isinstance(name, tuple):
+                            data[name[0]] = self._merge_item(
+                                data.get(name[0]), name[1], value)
+                        elif value is self._DELETED:
+                            data.pop(name, None)
+                        else:
+                            data[name] = value
+                    self._write_data(data)
+                    self._changes = {}
+                finally:
+                    util.unlock_file(lockfp)
+
+    def _get_data(self):
+        if self._data is None:
+            self._data = {}
             if isfile(self.path):
-                self._state = util.load_json(self.path)
-        except ValueError:
-            self._state = {}
-        self._prev_state = deepcopy(self._state)
-        return self._state
+                self.io_stats['reads'] += 1
+                try:
+                    self._data = util.load_json(self.path)
+                except ValueError:
+                    pass
+        return self._data
+
+    def _write_data(self, data):
+        self.io_stats['writes'] += 1
+        tmp_path = "%s.%d.tmp" % (self.path, os.getpid())
+        with open(tmp_path, "w") as fp:
+            if "dev" in __version__:
+                json.dump(data, fp, indent=4)
+            else:
+                json.dump(data, fp)
+        util.replace_file(tmp_path, self.path)
+
 
-    def __exit__(self, type_, value, traceback):
-        if self._prev_state != self._state:
-            with open(self.path, "w") as fp:
-                if "dev" in __version__:
-                    json.dump(self._state, fp, indent=4)
-                else:
-                    json.dump(self._state, fp)
-        self._unlock_state_file()
+_STATES = {}
 
-    def _lock_state_file(self):
-        if not self.lock:
-            return
-        self._lockfile = LockFile(self.path)
 
-        if self._lockfile.is_locked() and \
-                (time() - getmtime(self._lockfile.lock_file)) > 10:
-            self._lockfile.break_lock()
+def get_state():
+    path = join(util.get_home_dir(), "appstate.json")
+    if path not in _STATES:
+        _STATES[path] = State(path)
+    return _STATES[path]
 
-        self._lockfile.acquire()
 
-    def _unlock_state_file(self):
-        if self._lockfile:
-            self._lockfile.release()
+@atexit.register
+def flush_state():
+    for state in _STATES.values():
+        state.flush()
 
 
 def sanitize_setting(name, value):
@@ -133,13 +233,11 @@ def sanitize_setting(name, value):
 
 
 def get_state_item(name, default=None):
-    with State() as data:
-        return data.get(name, default)
+    return get_state().get(name, default)
 
 
 def set_state_item(name, value):
-    with State(lock=True) as data:
-        data[name] = value
+    get_state().set(name, value)
 
 
 def get_setting(name):
@@ -153,24 +251,19 @@ def get_setting(name):
     if _env_name in environ:
         return sanitize_setting(name, getenv(_env_name))
 
-    with State() as data:
-        if "settings" in data and name in data['settings']:
-            return data['settings'][name]
+    settings = get_state_item("settings", {})
+    if name in settings:
+        return settings[name]
 
     return DEFAULT_SETTINGS[name]['value']
 
 
 def set_setting(name, value):
-    with State(lock=True) as data:
-        if "settings" not in data:
-            data['settings'] = {}
-        data['settings'][name] = sanitize_setting(name, value)
+    get_state().set_item("settings", name, sanitize_setting(name, value))
 
 
 def reset_settings():
-    with State(lock=True) as data:
-        if "settings" in data:
-            del data['settings']
+    get_state().delete("settings")
 
 
 def get_session_var(name, default=None):
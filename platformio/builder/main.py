@@ -15,8 +15,8 @@
 import base64
 import json
 import sys
-from os import environ
-from os.path import join, normpath
+from os import environ, makedirs
+from os.path import isdir, join, normpath
 from time import time
 
 from SCons.Script import (COMMAND_LINE_TARGETS, AllowSubstExceptions,
@@ -34,14 +34,21 @@ commonvars.AddVariables(
     ("EXTRA_SCRIPT",),
     ("PIOENV",),
     ("PIOTEST",),
+    ("TEST_TRANSPORT",),
     ("PIOPLATFORM",),
     ("PIOFRAMEWORK",),
+    ("PROFILE_FILE",),
+    ("BUILD_HISTORY_ID",),
+    ("JSON_EVENTS",),
 
     # build options
     ("BUILD_FLAGS",),
     ("SRC_BUILD_FLAGS",),
     ("BUILD_UNFLAGS",),
     ("SRC_FILTER",),
+    ("BUILD_PCH",),
+    ("BUILD_UNITY",),
+    ("BUILD_UNITY_IGNORE",),
 
     # library options
     ("LIB_LDF_MODE",),
@@ -69,7 +76,7 @@ DefaultEnvironment(
     tools=[
         "ar", "as", "gcc", "g++", "gnulink",
         "platformio", "pioplatform",
-        "piolib", "piotest", "pioupload", "pioar", "piomisc"
+        "piolib", "piotest", "pioupload", "pioar", "piomisc", "pioprofile"
     ],  # yapf: disable
     toolpath=[join(util.get_source_dir(), "builder", "tools")],
     variables=commonvars,
@@ -105,23 +112,31 @@ for k in commonvars.keys():
         env[k] = base64.b64decode(env[k])
 
 # Handle custom variables from system environment
-for var in ("BUILD_FLAGS", "SRC_BUILD_FLAGS", "SRC_FILTER", "EXTRA_SCRIPT",
-            "UPLOAD_PORT", "UPLOAD_FLAGS", "LIB_EXTRA_DIRS"):
+for var in ("BUILD_FLAGS", "SRC_BUILD_FLAGS", "BUILD_UNITY", "SRC_FILTER",
+            "EXTRA_SCRIPT", "UPLOAD_PORT", "UPLOAD_FLAGS", "LIB_EXTRA_DIRS"):
     k = "PLATFORMIO_%s" % var
     if environ.get(k):
         env[var] = environ.get(k)
 
 # Parse comma separated items
-for opt in ("LIB_IGNORE", "LIB_FORCE", "LIB_EXTRA_DIRS"):
+for opt in ("BUILD_UNITY_IGNORE", "LIB_IGNORE", "LIB_FORCE",
+            "LIB_EXTRA_DIRS"):
     if opt not in env:
         continue
     env[opt] = [l.strip() for l in env[opt].split(",") if l.strip()]
 
+if env.IsProfilingEnabled():
+    env.EnableProfiling()
+configure_start = time()
+
 env.Prepend(LIBSOURCE_DIRS=env.get("LIB_EXTRA_DIRS", []))
 env.LoadPioPlatform(commonvars)
 
+if not isdir(env.subst("$BUILD_DIR")):
+    makedirs(env.subst("$BUILD_DIR"))
+
 env.SConscriptChdir(0)
-env.SConsignFile(join("$PROJECTPIOENVS_DIR", ".sconsign.dblite"))
+env.SConsignFile(join("$BUILD_DIR", ".sconsign.dblite"))
 env.SConscript("$BUILD_SCRIPT")
 
 if "UPLOAD_FLAGS" in env:
@@ -130,6 +145,8 @@ if "UPLOAD_FLAGS" in env:
 if env.get("EXTRA_SCRIPT"):
     env.SConscript(env.get("EXTRA_SCRIPT"), exports="env")
 
+env.AddProfileEvent("Build scripts", "configure", configure_start)
+
 if "envdump" in COMMAND_LINE_TARGETS:
     print env.Dump()
     env.Exit()
@@ -19,6 +19,7 @@ from __future__ import absolute_import
 import os
 import sys
 from os.path import basename, commonprefix, isdir, isfile, join, realpath, sep
+from time import time
 
 import SCons.Scanner
 
@@ -144,6 +145,10 @@ class LibBuilderBase(object):  # pylint: disable=too-many-instance-attributes
     def lib_archive(self):
         return True
 
+    @property
+    def unity_build(self):
+        return True
+
     @property
     def depbuilders(self):
         return self._depbuilders
@@ -283,6 +288,8 @@ class LibBuilderBase(object):  # pylint: disable=too-many-instance-attributes
         if not self._built_node:
             self.env.AppendUnique(CPPPATH=self.get_inc_dirs(
                 use_build_dir=True))
+            if not self.unity_build:
+                self.env.Replace(BUILD_UNITY="no")
             if self.lib_archive:
                 self._built_node = self.env.BuildLibrary(
                     self.build_dir, self.src_dir, self.src_filter)
@@ -313,6 +320,10 @@ class ProjectAsLibBuilder(LibBuilderBase):
                     if lb not in self.depbuilders:
                         self.depend_recursive(lb, lib_builders)
                     break
+        # the sketch is converted to C++ file in the build directory
+        if self.env.get("PIOSKETCH"):
+            search_paths = (search_paths or tuple()) + (
+                self.env.subst(self.env['PIOSKETCH']), )
         return LibBuilderBase.search_deps_recursive(self, lib_builders,
                                                     search_paths)
 
@@ -418,6 +429,12 @@ class PlatformIOLibBuilder(LibBuilderBase):
             return self._manifest.get("build").get("libArchive")
         return LibBuilderBase.lib_archive.fget(self)
 
+    @property
+    def unity_build(self):
+        if "unityBuild" in self._manifest.get("build", {}):
+            return self._manifest.get("build").get("unityBuild")
+        return LibBuilderBase.unity_build.fget(self)
+
     def is_platform_compatible(self, platform):
         items = self._manifest.get("platforms")
         if not items:
@@ -496,20 +513,33 @@ def BuildDependentLibraries(env, src_dir):
             if lb.depbuilders:
                 print_deps_tree(lb, level + 1)
 
+    def get_deps_graph(root):
+        return [{
+            "name": lb.name,
+            "version": lb.version,
+            "path": lb.path,
+            "dependencies": get_deps_graph(lb)
+        } for lb in root.depbuilders]
+
+    start = time()
     lib_builders = env.GetLibBuilders()
+    env.AddProfileEvent("GetLibBuilders", "libbuilders", start)
 
     print "Collected %d compatible libraries" % len(lib_builders)
     print "Looking for dependencies..."
 
     project = ProjectAsLibBuilder(env, src_dir)
     project.env = env
+    start = time()
     project.search_deps_recursive(lib_builders)
+    env.AddProfileEvent("Dependency search", "ldf", start)
 
     if project.depbuilders:
         print "Library Dependency Graph"
         print_deps_tree(project)
     else:
         print "Project does not have dependencies"
+    env.EmitEvent("libdeps", graph=get_deps_graph(project))
 
     return project.build()
 
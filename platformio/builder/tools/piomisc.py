@@ -14,14 +14,20 @@
 
 from __future__ import absolute_import
 
-import atexit
+import json
 import re
 from glob import glob
-from os import environ, remove
-from os.path import isfile, join
+from os import devnull, environ, getpid, remove, stat
+from os.path import isfile, join, normpath, realpath
 
 from platformio import util
 
+# toolchain probes are shared by the environments of the build process
+COMPILERS_CACHE = {}
+# the flags which change the builtin include dirs of the compiler
+COMPILER_PROBE_FLAGS = ("-m", "-f", "-std=", "--sysroot", "-isysroot",
+                        "-nostdinc", "-target", "--target", "--specs")
+
 
 class InoToCPPConverter(object):
 
@@ -111,14 +117,10 @@ class InoToCPPConverter(object):
 
 
 def ConvertInoToCpp(env):
-
-    def delete_tmpcpp_file(file_):
-        try:
-            remove(file_)
-        except:  # pylint: disable=bare-except
-            if isfile(file_):
-                print("Warning: Could not remove temporary file '%s'. "
-                      "Please remove it manually." % file_)
+    # the sketch was converted into project's source folder before
+    obsolete_file = join(env.subst("$PROJECTSRC_DIR"), "tmp_ino_to.cpp")
+    if isfile(obsolete_file):
+        remove(obsolete_file)
 
     ino_nodes = (env.Glob(join("$PROJECTSRC_DIR", "*.ino")) +
                  env.Glob(join("$PROJECTSRC_DIR", "*.pde")))
@@ -129,11 +131,11 @@ def ConvertInoToCpp(env):
     if not data:
         return
 
-    tmpcpp_file = join(env.subst("$PROJECTSRC_DIR"), "tmp_ino_to.cpp")
-    with open(tmpcpp_file, "w") as f:
-        f.write(data)
-
-    atexit.register(delete_tmpcpp_file, tmpcpp_file)
+    # keep the file between builds, SCons recompiles it only when the
+    # sketch is changed
+    sketch_file = join("$BUILD_DIR", "generated", "sketch.ino.cpp")
+    env.WriteFileIfChanged(sketch_file, data)
+    env.Replace(PIOSKETCH=sketch_file)
 
 
 def DumpIDEData(env):
@@ -155,6 +157,15 @@ def DumpIDEData(env):
         for lb in env.GetLibBuilders():
             includes.extend(lb.get_inc_dirs())
 
+        # builtin includes of the compilers
+        builtin_includes = []
+        for compiler in ("$CXX", "$CC"):
+            info = env_.GetCompilerInfo(compiler) or {}
+            builtin_includes.extend([i for i in info.get("includes", [])
+                                     if i not in builtin_includes])
+        if builtin_includes:
+            return includes + builtin_includes
+
         # includes from toolchains
         p = env.PioPlatform()
         for name in p.get_installed_packages():
@@ -194,10 +205,8 @@ def DumpIDEData(env):
         "includes": get_includes(env_),
         "cc_flags": env_.subst(LINTCCOM),
         "cxx_flags": env_.subst(LINTCXXCOM),
-        "cc_path": util.where_is_program(
-            env_.subst("$CC"), env_.subst("${ENV['PATH']}")),
-        "cxx_path": util.where_is_program(
-            env_.subst("$CXX"), env_.subst("${ENV['PATH']}"))
+        "cc_path": (env_.GetCompilerInfo("$CC") or {}).get("path"),
+        "cxx_path": (env_.GetCompilerInfo("$CXX") or {}).get("path")
     }
 
     # https://github.com/platformio/platformio-atom-ide/issues/34
@@ -220,21 +229,105 @@ def DumpIDEData(env):
     return data
 
 
-def GetCompilerType(env):
+def GetCompilerInfo(env, compiler="$CC"):
+    """Type, version, builtin include dirs and predefined macros.
+
+    Probing results are cached in PlatformIO home directory by path, size
+    and modification time of the compiler executable, the language and the
+    flags of the probe. C and C++ compilers can be the same executable.
+    """
+    path = env.WhereIs(env.subst(compiler))
+    if not path:
+        return None
+    path = realpath(path)
     try:
-        sysenv = environ.copy()
-        sysenv['PATH'] = str(env['ENV']['PATH'])
-        result = util.exec_command([env.subst("$CC"), "-v"], env=sysenv)
+        st = stat(path)
+    except OSError:
+        return None
+    lang = "c++" if compiler == "$CXX" else "c"
+    flags = _get_probe_flags(env, lang)
+    key = "%s:%d:%r:%s:%s" % (path, st.st_size, st.st_mtime, lang,
+                              " ".join(flags))
+
+    cache_path = join(util.get_home_dir(), "toolchains.json")
+    if cache_path not in COMPILERS_CACHE:
+        COMPILERS_CACHE[cache_path] = {}
+        if isfile(cache_path):
+            try:
+                COMPILERS_CACHE[cache_path] = util.load_json(cache_path)
+            except ValueError:
+                pass
+    cache = COMPILERS_CACHE[cache_path]
+
+    if key not in cache:
+        data = _probe_compiler(env, path, lang, flags)
+        if not data:
+            return None
+        cache[key] = data
+        # the cache is optional, the build continues without it
+        tmp_path = "%s.%d" % (cache_path, getpid())
+        try:
+            with open(tmp_path, "w") as fp:
+                json.dump(cache, fp)
+            util.replace_file(tmp_path, cache_path)
+        except (IOError, OSError):
+            try:
+                remove(tmp_path)
+            except OSError:
+                pass
+
+    return dict(cache[key], path=path)
+
+
+def _get_probe_flags(env, lang):
+    flags = env.get("CCFLAGS", []) + env.get(
+        "CXXFLAGS" if lang == "c++" else "CFLAGS", [])
+    return [
+        str(f) for f in env.subst_list(flags)[0]
+        if str(f).startswith(COMPILER_PROBE_FLAGS)
+    ]
+
+
+def _probe_compiler(env, path, lang, flags):
+    sysenv = environ.copy()
+    sysenv['PATH'] = str(env['ENV']['PATH'])
+    try:
+        result = util.exec_command([path, "-v"], env=sysenv)
     except OSError:
         return None
     if result['returncode'] != 0:
         return None
-    output = "".join([result['out'], result['err']]).lower()
-    if "clang" in output and "LLVM" in output:
-        return "clang"
-    elif "gcc" in output:
-        return "gcc"
-    return None
+    output = "".join([result['out'], result['err']])
+    data = {"type": None, "version": None, "includes": [], "macros": []}
+    if "clang" in output.lower() and "llvm" in output.lower():
+        data['type'] = "clang"
+    elif "gcc" in output.lower():
+        data['type'] = "gcc"
+    match = re.search(r"(?:gcc|clang) version (\S+)", output, re.I)
+    if match:
+        data['version'] = match.group(1)
+
+    result = util.exec_command(
+        [path, "-E", "-x", lang, "-v"] + flags + [devnull], env=sysenv)
+    match = re.search(r"#include <\.\.\.> search starts here:(.+?)"
+                      r"End of search list", result['err'], re.S)
+    if match:
+        data['includes'] = [
+            normpath(l.strip()) for l in match.group(1).splitlines()
+            if l.strip()
+        ]
+
+    result = util.exec_command(
+        [path, "-dM", "-E", "-x", lang] + flags + [devnull], env=sysenv)
+    for line in result['out'].splitlines():
+        if line.startswith("#define "):
+            data['macros'].append(line[8:].strip().replace(" ", "=", 1))
+    return data
+
+
+def GetCompilerType(env):
+    info = env.GetCompilerInfo()
+    return info['type'] if info else None
 
 
 def GetActualLDScript(env):
@@ -272,6 +365,7 @@ def exists(_):
 def generate(env):
     env.AddMethod(ConvertInoToCpp)
     env.AddMethod(DumpIDEData)
+    env.AddMethod(GetCompilerInfo)
     env.AddMethod(GetCompilerType)
     env.AddMethod(GetActualLDScript)
     env.AddMethod(ProgressHandler)
@@ -0,0 +1,111 @@
+# Copyright 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+
+import atexit
+import json
+import threading
+from os.path import basename
+from time import time
+
+# the tool is loaded right after SCons is initialized
+STARTED = time()
+
+PROFILE_EVENTS = []
+THREAD_IDS = {}
+
+
+def _get_thread_id():
+    ident = threading.current_thread().ident
+    if ident not in THREAD_IDS:
+        THREAD_IDS[ident] = len(THREAD_IDS)
+    return THREAD_IDS[ident]
+
+
+def _classify_command(args):
+    args = [str(a) for a in args]
+    tool = basename(args[0]) if args else ""
+    target = args[args.index("-o") + 1] if "-o" in args[:-1] else None
+    if "-c" in args and target:
+        return "compile", target
+    archives = [a for a in args[1:] if a.endswith(".a")]
+    if tool.endswith(("ar", "ar.exe")) and archives:
+        return "archive", archives[0]
+    if "size" in tool:
+        return "size", tool
+    if target:
+        return "link", target
+    return "command", tool
+
+
+def EnableProfiling(env):
+    AddProfileEvent(env, "SCons startup", "startup", STARTED)
+    spawn = env['SPAWN']
+
+    def _spawn(sh, escape, cmd, args, spawn_env):
+        start = time()
+        try:
+            return spawn(sh, escape, cmd, args, spawn_env)
+        finally:
+            category, name = _classify_command(args)
+            AddProfileEvent(env, name, category, start)
+
+    env.Replace(SPAWN=_spawn)
+    atexit.register(_save_profile, env.subst("$PROFILE_FILE"))
+
+
+def IsProfilingEnabled(env):
+    return bool(env.get("PROFILE_FILE"))
+
+
+def AddProfileEvent(env, name, category, start, end=None):
+    if not IsProfilingEnabled(env):
+        return
+    PROFILE_EVENTS.append({
+        "name": name,
+        "cat": category,
+        "ts": start,
+        "dur": (end or time()) - start,
+        "tid": _get_thread_id()
+    })
+
+
+def ProfileAction(env, action, name, category):
+
+    def _wrapper(target, source, env):
+        start = time()
+        try:
+            return action(target, source, env)
+        finally:
+            AddProfileEvent(env, name, category, start)
+
+    return _wrapper if IsProfilingEnabled(env) else action
+
+
+def _save_profile(path):
+    with open(path, "w") as fp:
+        json.dump(PROFILE_EVENTS, fp)
+
+
+def exists(_):
+    return True
+
+
+def generate(env):
+    env.AddMethod(EnableProfiling)
+    env.AddMethod(IsProfilingEnabled)
+    env.AddMethod(AddProfileEvent)
+    env.AddMethod(ProfileAction)
+    return env
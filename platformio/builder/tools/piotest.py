@@ -14,11 +14,12 @@
 
 from __future__ import absolute_import
 
-import atexit
 from os import remove
 from os.path import isdir, isfile, join, sep
 from string import Template
 
+from platformio.testtransport import HOST_TRANSPORTS
+
 FRAMEWORK_PARAMETERS = {
     "arduino": {
         "framework": "Arduino.h",
@@ -43,6 +44,15 @@ FRAMEWORK_PARAMETERS = {
         "serial_flush": "Serial.flush()",
         "serial_begin": "Serial.begin(9600)",
         "serial_end": "Serial.end()"
+    },
+    # the program for the host machine, see `IsHostTest`
+    "native": {
+        "framework": "stdio.h",
+        "serial_obj": "",
+        "serial_putc": "putchar(a)",
+        "serial_flush": "fflush(stdout)",
+        "serial_begin": "",
+        "serial_end": "fflush(stdout)"
     }
 }
 
@@ -61,22 +71,61 @@ def ProcessTest(env):
     env.Prepend(LIBS=[unitylib])
 
     test_dir = env.subst("$PROJECTTEST_DIR")
-    env.GenerateOutputReplacement(test_dir)
-    src_filter = None
-    if "PIOTEST" in env:
-        src_filter = "+<output_export.cpp>"
-        src_filter += " +<%s%s>" % (env['PIOTEST'], sep)
+    if not isdir(test_dir):
+        env.Exit(
+            "Error: Test folder doesn't exist. Please put your test suite "
+            'to \"test\" folder in project\'s root directory.')
+
+    # output replacement was generated into test folder before
+    obsolete_file = join(test_dir, "output_export.cpp")
+    if isfile(obsolete_file):
+        remove(obsolete_file)
+
+    return env.CollectTestFiles(env.GetTestNames()[0])
+
+
+def GetTestNames(env):
+    """The names of the tests, the first one is linked to the program.
+
+    Multiple comma-separated names are passed by `platformio test` to build
+    all tests at once, see :func:`BuildTestPrograms`.
+    """
+    if "PIOTEST" not in env:
+        return [None]
+    return [n.strip() for n in env['PIOTEST'].split(",") if n.strip()]
+
 
+def CollectTestFiles(env, name):
+    src_filter = "+<%s%s>" % (name, sep) if name else None
     return env.CollectBuildFiles(
-        "$BUILDTEST_DIR", test_dir, src_filter=src_filter, duplicate=False)
+        "$BUILDTEST_DIR", env.subst("$PROJECTTEST_DIR"),
+        src_filter=src_filter,
+        duplicate=False) + env.BuildGeneratedSources([
+            env.GenerateOutputReplacement(join("$BUILD_DIR", "generated"))
+        ])
 
 
-def GenerateOutputReplacement(env, destination_dir):
+def BuildTestPrograms(env, src_files):
+    """Link the rest tests of the batch with the same objects.
+
+    The objects of the project sources, the frameworks, Unity and the
+    libraries are built once and are shared by all test programs.
+    """
+    return [
+        env.Program(
+            join("$BUILDTEST_DIR", name, "$PROGNAME"),
+            src_files + env.CollectTestFiles(name))
+        for name in env.GetTestNames()[1:]
+    ]
 
-    if not isdir(env.subst(destination_dir)):
-        env.Exit(
-            "Error: Test folder doesn't exist. Please put your test suite "
-            'to \"test\" folder in project\'s root directory.')
+
+def IsHostTest(env):
+    """The test program is run on the host machine, it prints to stdout."""
+    return (env.subst("$TEST_TRANSPORT").strip() in HOST_TRANSPORTS or
+            env.subst("$PIOPLATFORM") == "native")
+
+
+def GenerateOutputReplacement(env, destination_dir):
 
     TEMPLATECPP = """
 # include <$framework>
@@ -106,15 +155,9 @@ void output_complete(void)
 
 """
 
-    def delete_tmptest_file(file_):
-        try:
-            remove(file_)
-        except:  # pylint: disable=bare-except
-            if isfile(file_):
-                print("Warning: Could not remove temporary file '%s'. "
-                      "Please remove it manually." % file_)
-
     framework = env.subst("$PIOFRAMEWORK").lower()
+    if not framework and env.IsHostTest():
+        framework = "native"
     if framework not in FRAMEWORK_PARAMETERS:
         env.Exit("Error: %s framework doesn't support testing feature!" %
                  framework)
@@ -122,11 +165,10 @@ void output_complete(void)
         data = Template(TEMPLATECPP).substitute(FRAMEWORK_PARAMETERS[
             framework])
 
+        # rewrite only changed file to avoid recompilation
         tmp_file = join(destination_dir, "output_export.cpp")
-        with open(tmp_file, "w") as f:
-            f.write(data)
-
-        atexit.register(delete_tmptest_file, tmp_file)
+        env.WriteFileIfChanged(tmp_file, data)
+        return tmp_file
 
 
 def exists(_):
@@ -135,5 +177,9 @@ def exists(_):
 
 def generate(env):
     env.AddMethod(ProcessTest)
+    env.AddMethod(GetTestNames)
+    env.AddMethod(CollectTestFiles)
+    env.AddMethod(BuildTestPrograms)
+    env.AddMethod(IsHostTest)
     env.AddMethod(GenerateOutputReplacement)
     return env
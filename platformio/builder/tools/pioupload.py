@@ -24,6 +24,9 @@ from serial import Serial
 
 from platformio import util
 
+# the sizes of the programs are reused by the build history
+PROGRAM_SIZES = {}
+
 
 def FlushSerialBuffer(env, port):
     s = Serial(env.subst(port))
@@ -145,6 +148,28 @@ def UploadToDisk(_, target, source, env):  # pylint: disable=W0613,W0621
           "(Some boards may require manual hard reset)")
 
 
+def GetProgramSizes(env, program):
+    """Return the size of the program (flash) and data (RAM) in bytes."""
+    path = str(program)
+    if path in PROGRAM_SIZES:
+        return PROGRAM_SIZES[path]
+    if "SIZETOOL" not in env or not isfile(path):
+        return None
+    sysenv = environ.copy()
+    sysenv['PATH'] = str(env['ENV']['PATH'])
+    cmd = [env.subst("$SIZETOOL"), "-B", path]
+    result = util.exec_command(cmd, env=sysenv)
+    if result['returncode'] != 0:
+        return None
+
+    # text data bss dec hex filename
+    line = result['out'].strip().splitlines()[1]
+    values = [int(v.strip()) for v in line.split("\t")[:3]]
+    PROGRAM_SIZES[path] = (values[0] + values[1], values[1] + values[2],
+                           result['out'].strip())
+    return PROGRAM_SIZES[path]
+
+
 def CheckUploadSize(_, target, source, env):  # pylint: disable=W0613,W0621
     if "BOARD" not in env:
         return
@@ -153,17 +178,11 @@ def CheckUploadSize(_, target, source, env):  # pylint: disable=W0613,W0621
         return
 
     print "Check program size..."
-    sysenv = environ.copy()
-    sysenv['PATH'] = str(env['ENV']['PATH'])
-    cmd = [env.subst("$SIZETOOL"), "-B", str(target[0])]
-    result = util.exec_command(cmd, env=sysenv)
-    if result['returncode'] != 0:
+    sizes = env.GetProgramSizes(target[0])
+    if not sizes:
         return
-    print result['out'].strip()
-
-    line = result['out'].strip().splitlines()[1]
-    values = [v.strip() for v in line.split("\t")]
-    used_size = int(values[0]) + int(values[1])
+    used_size, _, output = sizes
+    print output
 
     if used_size > max_size:
         env.Exit("Error: The program size (%d bytes) is greater "
@@ -180,5 +199,6 @@ def generate(env):
     env.AddMethod(WaitForNewSerialPort)
     env.AddMethod(AutodetectUploadPort)
     env.AddMethod(UploadToDisk)
+    env.AddMethod(GetProgramSizes)
     env.AddMethod(CheckUploadSize)
     return env
@@ -14,19 +14,42 @@
 
 from __future__ import absolute_import
 
+import atexit
+import fnmatch
+import json
 import re
-from glob import glob
-from os import sep, walk
-from os.path import basename, dirname, isdir, join, realpath
-
-from SCons.Script import COMMAND_LINE_TARGETS, DefaultEnvironment, SConscript
+import sys
+from glob import glob, has_magic
+from os import makedirs, sep, walk
+from os.path import (basename, dirname, isabs, isdir, isfile, join, normcase,
+                     realpath, relpath)
+from time import time
+
+from SCons.Node import executed
+from SCons.Scanner.C import CScanner
+from SCons.Script import (COMMAND_LINE_TARGETS, DefaultEnvironment, Move,
+                          SConscript)
 from SCons.Util import case_sensitive_suffixes
 
+from platformio.events import BUILD_EVENT_PREFIX
+from platformio.history import BuildHistory
 from platformio.util import pioversion_to_intstr
 
 SRC_BUILD_EXT = ["c", "cpp", "S", "spp", "SPP", "sx", "s", "asm", "ASM"]
 SRC_HEADER_EXT = ["h", "hpp"]
 SRC_FILTER_DEFAULT = ["+<*>", "-<.git%s>" % sep, "-<svn%s>" % sep]
+UNITY_BATCH_SIZE = 8
+# file-scope definitions which leak to the next sources of unity batch
+UNITY_SYMBOLS_RE = re.compile(
+    r"^(?:static\s+[^;={}()]*?\b(\w+)\s*[\[=;(,]|"
+    r"#\s*define\s+(\w+)|"
+    r"typedef\s+[^;{]*?\b(\w+)\s*;|"
+    r"(?:struct|class|union|enum)\s+(\w+)\s*[:{])", re.M)
+FRAMEWORK_HEADERS = {
+    "arduino": "Arduino.h",
+    "energia": "Energia.h",
+    "mbed": "mbed.h"
+}
 
 
 def BuildProgram(env):
@@ -73,6 +96,11 @@ def BuildProgram(env):
     # Handle SRC_BUILD_FLAGS
     env.ProcessFlags(env.get("SRC_BUILD_FLAGS"))
 
+    # the frameworks and the libraries are declared already, the header is
+    # precompiled for the project sources only
+    if env.get("BUILD_PCH", "").lower() in ("1", "yes", "true"):
+        env.BuildFrameworkPCH()
+
     env.Append(
         CPPPATH=["$PROJECTSRC_DIR"],
         LIBS=deplibs,
@@ -83,6 +111,13 @@ def BuildProgram(env):
             src_filter=env.get("SRC_FILTER"),
             duplicate=False))
 
+    # local headers of the sketch have priority over the libraries
+    if env.get("PIOSKETCH"):
+        env.Append(PIOBUILDFILES=env.BuildGeneratedSources(
+            [env['PIOSKETCH']],
+            CPPFLAGS=["-iquote", "$PROJECTSRC_DIR", "$CPPFLAGS"]))
+
+    src_files = list(env['PIOBUILDFILES'])
     if "test" in COMMAND_LINE_TARGETS:
         env.Append(PIOBUILDFILES=env.ProcessTest())
 
@@ -92,13 +127,69 @@ def BuildProgram(env):
 
     program = env.Program(
         join("$BUILD_DIR", env.subst("$PROGNAME")), env['PIOBUILDFILES'])
+    if "test" in COMMAND_LINE_TARGETS and len(env.GetTestNames()) > 1:
+        env.Depends(program, env.BuildTestPrograms(src_files))
+
+    if not (env.GetOption("silent") or env.GetOption("clean")):
+        print ("Source folders: %(dirs)d folders with %(files)d files were "
+               "walked in %(walk_time).2f seconds, %(matches)d filter "
+               "patterns were matched" % SourceSnapshot.stats)
+
+    if env.get("BUILD_HISTORY_ID") or env.get("JSON_EVENTS"):
+        atexit.register(_report_build_stats, env, program[0])
 
     if set(["upload", "uploadlazy", "program"]) & set(COMMAND_LINE_TARGETS):
-        env.AddPostAction(program, env.CheckUploadSize)
+        env.AddPostAction(program,
+                          env.ProfileAction(env.CheckUploadSize,
+                                            "Check program size", "size"))
 
     return program
 
 
+def _report_build_stats(env, program):
+    objects_total = 0
+    objects_built = 0
+    obj_suffix = env.subst("$OBJSUFFIX")
+    lib_suffix = env.subst("$LIBSUFFIX")
+    nodes = [program]
+    visited = set()
+    while nodes:
+        node = nodes.pop()
+        if node in visited:
+            continue
+        visited.add(node)
+        path = str(node)
+        if path.endswith(obj_suffix):
+            objects_total += 1
+            objects_built += int(node.get_state() == executed)
+        elif node == program or path.endswith(lib_suffix):
+            nodes.extend(node.children())
+
+    fields = dict(objects_total=objects_total, objects_built=objects_built)
+    env.EmitEvent("cache", **fields)
+    sizes = env.GetProgramSizes(program)
+    if sizes:
+        fields.update(program_size=sizes[0], data_size=sizes[1])
+        board = env.BoardConfig() if "BOARD" in env else {}
+        env.EmitEvent(
+            "size",
+            program_size=sizes[0],
+            data_size=sizes[1],
+            program_max_size=int(board.get("upload.maximum_size", 0)),
+            data_max_size=int(board.get("upload.maximum_ram_size", 0)))
+    if env.get("BUILD_HISTORY_ID"):
+        BuildHistory().update(int(env['BUILD_HISTORY_ID']), **fields)
+
+
+def EmitEvent(env, event, **data):
+    """Pass the event to `platformio run --json-events`."""
+    if not env.get("JSON_EVENTS"):
+        return
+    data['event'] = event
+    print BUILD_EVENT_PREFIX + json.dumps(data)
+    sys.stdout.flush()
+
+
 def ProcessFlags(env, flags):
     if not flags:
         return
@@ -161,6 +252,94 @@ def IsFileWithExt(env, file_, ext):  # pylint: disable=W0613
     return False
 
 
+class SourceSnapshot(object):
+    """Directory tree which is walked once per build.
+
+    Glob patterns of the source filters are evaluated against the
+    snapshot with the same rules as `glob` module: wildcards do not match
+    hidden items, a trailing separator matches only directories.
+    """
+
+    _snapshots = {}
+    _patterns = {}
+    stats = {"dirs": 0, "files": 0, "walk_time": 0, "matches": 0}
+
+    def __init__(self, src_dir):
+        start_time = time()
+        self.tree = ({}, [])
+        self._files = {}
+        nodes = {src_dir: self.tree}
+        for root, dirs, files in walk(src_dir, followlinks=True):
+            node = nodes[root]
+            for d in dirs:
+                node[0][d] = nodes[join(root, d)] = ({}, [])
+            node[1].extend(files)
+            SourceSnapshot.stats['dirs'] += 1
+            SourceSnapshot.stats['files'] += len(files)
+        SourceSnapshot.stats['walk_time'] += time() - start_time
+
+    @staticmethod
+    def get(src_dir):
+        if src_dir not in SourceSnapshot._snapshots:
+            SourceSnapshot._snapshots[src_dir] = SourceSnapshot(src_dir)
+        return SourceSnapshot._snapshots[src_dir]
+
+    @staticmethod
+    def _compile_pattern(pattern):
+        if pattern not in SourceSnapshot._patterns:
+            SourceSnapshot._patterns[pattern] = re.compile(
+                fnmatch.translate(normcase(pattern)))
+        return SourceSnapshot._patterns[pattern]
+
+    def match(self, pattern):
+        """Return relative paths of the files matched by glob pattern"""
+        SourceSnapshot.stats['matches'] += 1
+        segments = pattern.split(sep)
+        dirs_only = not segments[-1]
+        if dirs_only:
+            segments = segments[:-1]
+
+        matches = [("", self.tree)]
+        for segment in segments:
+            if not segment:
+                continue
+            _matches = []
+            for path, node in matches:
+                if node is None:
+                    continue
+                for name in self._match_names(node, segment):
+                    _matches.append((join(path, name) if path else name,
+                                     node[0].get(name)))
+            matches = _matches
+
+        result = []
+        for path, node in matches:
+            if node is not None:
+                result.extend(self._get_files(path, node))
+            elif not dirs_only:
+                result.append(path)
+        return result
+
+    def _match_names(self, node, segment):
+        names = list(node[0]) + node[1]
+        if not has_magic(segment):
+            return [n for n in names if normcase(n) == normcase(segment)]
+        if not segment.startswith("."):
+            names = [n for n in names if not n.startswith(".")]
+        regex = self._compile_pattern(segment)
+        return [n for n in names if regex.match(normcase(n))]
+
+    def _get_files(self, path, node):
+        if path not in self._files:
+            files = [join(path, f) if path else f for f in node[1]]
+            for name, subnode in node[0].items():
+                files.extend(
+                    self._get_files(join(path, name) if path else name,
+                                    subnode))
+            self._files[path] = files
+        return self._files[path]
+
+
 def MatchSourceFiles(env, src_dir, src_filter=None):
 
     SRC_FILTER_PATTERNS_RE = re.compile(r"(\+|\-)<([^>]+)>")
@@ -170,6 +349,8 @@ def MatchSourceFiles(env, src_dir, src_filter=None):
             items.add(item.replace(src_dir + sep, ""))
 
     src_dir = env.subst(src_dir)
+    if src_dir.endswith(sep):
+        src_dir = src_dir[:-1]
     src_filter = src_filter or SRC_FILTER_DEFAULT
     if isinstance(src_filter, list) or isinstance(src_filter, tuple):
         src_filter = " ".join(src_filter)
@@ -179,13 +360,19 @@ def MatchSourceFiles(env, src_dir, src_filter=None):
     src_filter = src_filter.replace("/", sep).replace("\\", sep)
     for (action, pattern) in SRC_FILTER_PATTERNS_RE.findall(src_filter):
         items = set()
-        for item in glob(join(src_dir, pattern)):
-            if isdir(item):
-                for root, _, files in walk(item, followlinks=True):
-                    for f in files:
-                        _append_build_item(items, join(root, f), src_dir)
-            else:
-                _append_build_item(items, item, src_dir)
+        if isabs(pattern) or ".." in pattern.split(sep):
+            # pattern points outside of source folder
+            for item in glob(join(src_dir, pattern)):
+                if isdir(item):
+                    for root, _, files in walk(item, followlinks=True):
+                        for f in files:
+                            _append_build_item(items, join(root, f), src_dir)
+                else:
+                    _append_build_item(items, item, src_dir)
+        else:
+            for item in SourceSnapshot.get(src_dir).match(pattern):
+                if env.IsFileWithExt(item, SRC_BUILD_EXT + SRC_HEADER_EXT):
+                    items.add(item)
         if action == "+":
             matches |= items
         else:
@@ -202,7 +389,8 @@ def CollectBuildFiles(env,
                       variant_dir,
                       src_dir,
                       src_filter=None,
-                      duplicate=False):
+                      duplicate=False,
+                      unity=False):
     sources = []
     variants = []
 
@@ -222,6 +410,30 @@ def CollectBuildFiles(env,
         if env.IsFileWithExt(item, SRC_BUILD_EXT):
             sources.append(env.File(join(_var_dir, basename(item))))
 
+    if unity:
+        sources = env.MakeUnitySources(variant_dir, sources)
+
+    return _depend_on_pch(env, sources)
+
+
+def BuildGeneratedSources(env, paths, **overrides):
+    """Compile the sources which are generated in the build directory"""
+    return _depend_on_pch(env, [
+        env.Object(env.File(path), **overrides)[0] for path in paths
+    ], wrapped=True)
+
+
+def _depend_on_pch(env, sources, wrapped=False):
+    # C++ objects should wait for precompiled header
+    if not env.get("PIOPCH"):
+        return sources
+    for i, node in enumerate(sources):
+        name = node.sources[0].name if wrapped else node.name
+        if not env.IsFileWithExt(name, ["cpp"]):
+            continue
+        if not wrapped:
+            sources[i] = env.Object(node)
+        env.Depends(sources[i], env['PIOPCH'])
     return sources
 
 
@@ -241,21 +453,143 @@ def BuildFrameworks(env, frameworks):
             env.Exit("Error: Please specify `board` in `platformio.ini`")
 
     for f in frameworks:
-        if f in ("arduino", "energia"):
-            env.ConvertInoToCpp()
-
         if f in board_frameworks:
             SConscript(env.GetFrameworkScript(f))
         else:
             env.Exit("Error: This board doesn't support %s framework!" % f)
 
+        if f in ("arduino", "energia"):
+            env.ConvertInoToCpp()
+
+
+def BuildFrameworkPCH(env):
+    frameworks = [
+        f.lower().strip() for f in env.get("PIOFRAMEWORK", "").split(",")
+        if f.lower().strip() in FRAMEWORK_HEADERS
+    ]
+    if "PIOPCH" in env or not frameworks:
+        return
+    if env.GetCompilerType() != "gcc":
+        sys.stderr.write("Warning! Precompiled headers are supported only "
+                         "by GCC toolchains\n")
+        return
+
+    header = env.FindFile(FRAMEWORK_HEADERS[frameworks[0]],
+                          [env.subst(p) for p in env.get("CPPPATH", [])])
+    if not header:
+        return
+
+    # GCC looks for "<header>.gch" in each include directory before the
+    # header itself and silently skips a PCH built with other flags, the
+    # flags are substituted from this environment when the PCH is built
+    pch_dir = join("$BUILD_DIR", "pch")
+    pch = env.Command(
+        join(pch_dir, "%s.gch" % header.name), header, [
+            "$CXX -o ${TARGET}.tmp -x c++-header -c $CXXFLAGS $CCFLAGS "
+            "$_CCCOMCOM $SOURCE", Move("$TARGET", "${TARGET}.tmp")
+        ],
+        source_scanner=CScanner())
+    env.Prepend(CPPPATH=[pch_dir])
+    env.Replace(PIOPCH=pch)
+
+
+def GetUnityBatchSize(env, variant_dir):
+    value = str(env.get("BUILD_UNITY", "")).strip().lower()
+    if value in ("", "0", "no", "false"):
+        return 0
+    if basename(env.subst(variant_dir)) in env.get("BUILD_UNITY_IGNORE", []):
+        return 0
+    if value in ("1", "yes", "true"):
+        return UNITY_BATCH_SIZE
+    try:
+        return int(value)
+    except ValueError:
+        sys.stderr.write("Warning! Invalid `build_unity` value `%s`\n" %
+                         value)
+        return 0
+
+
+def MakeUnitySources(env, variant_dir, sources):
+    """Group C and C++ sources into the batched translation units.
+
+    Sources which define the same file-scope names (static symbols, macros,
+    types) or use anonymous namespaces are compiled separately.
+    """
+    batch_size = env.GetUnityBatchSize(variant_dir)
+    if batch_size < 2:
+        return sources
+
+    build_dir = env.subst("$BUILD_DIR")
+    variant_dir = env.subst(variant_dir)
+    unity_dir = join(build_dir, ".unity", relpath(variant_dir, build_dir)
+                     if variant_dir.startswith(build_dir) else
+                     basename(variant_dir))
+
+    result = []
+    groups = {"c": [], "cpp": []}
+    symbols = {"c": set(), "cpp": set()}
+    for node in sources:
+        ext = node.get_suffix()[1:]
+        names = None
+        if ext in groups:
+            names = _get_unity_symbols(node.srcnode().get_abspath())
+        if names is None or names & symbols[ext]:
+            result.append(node)
+            continue
+        symbols[ext] |= names
+        groups[ext].append(node)
+
+    for ext, nodes in sorted(groups.items()):
+        for i in range(0, len(nodes), batch_size):
+            batch = nodes[i:i + batch_size]
+            if len(batch) == 1:
+                result.extend(batch)
+                continue
+            path = join(unity_dir, "unity_%d.%s" % (i / batch_size, ext))
+            env.WriteFileIfChanged(path, "".join([
+                '#include "%s"\n' %
+                node.srcnode().get_abspath().replace("\\", "/")
+                for node in batch
+            ]))
+            result.append(env.File(path))
+
+    return result
+
+
+def _get_unity_symbols(path):
+    try:
+        with open(path) as fp:
+            content = fp.read()
+    except IOError:
+        return None
+    if re.search(r"\bnamespace\s*{", content):
+        return None
+    names = set()
+    for match in UNITY_SYMBOLS_RE.findall(content):
+        names.update([n for n in match if n])
+    return names
+
+
+def WriteFileIfChanged(env, path, contents):
+    """Keep timestamp of the generated file when contents is the same"""
+    path = env.subst(path)
+    if isfile(path):
+        with open(path) as fp:
+            if fp.read() == contents:
+                return False
+    elif not isdir(dirname(path)):
+        makedirs(dirname(path))
+    with open(path, "w") as fp:
+        fp.write(contents)
+    return True
+
 
 def BuildLibrary(env, variant_dir, src_dir, src_filter=None):
     lib = env.Clone()
     return lib.StaticLibrary(
         lib.subst(variant_dir),
         lib.CollectBuildFiles(
-            variant_dir, src_dir, src_filter=src_filter))
+            variant_dir, src_dir, src_filter=src_filter, unity=True))
 
 
 def BuildSources(env, variant_dir, src_dir, src_filter=None):
@@ -269,13 +603,19 @@ def exists(_):
 
 def generate(env):
     env.AddMethod(BuildProgram)
+    env.AddMethod(EmitEvent)
     env.AddMethod(ProcessFlags)
     env.AddMethod(ProcessUnFlags)
     env.AddMethod(IsFileWithExt)
     env.AddMethod(MatchSourceFiles)
     env.AddMethod(VariantDirWrap)
     env.AddMethod(CollectBuildFiles)
+    env.AddMethod(BuildGeneratedSources)
     env.AddMethod(BuildFrameworks)
+    env.AddMethod(BuildFrameworkPCH)
+    env.AddMethod(GetUnityBatchSize)
+    env.AddMethod(MakeUnitySources)
+    env.AddMethod(WriteFileIfChanged)
     env.AddMethod(BuildLibrary)
     env.AddMethod(BuildSources)
     return env
@@ -12,18 +12,24 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
+import os
 from glob import glob
+from hashlib import sha1
 from os import getenv, makedirs, remove
-from os.path import abspath, basename, expanduser, isdir, isfile, join
-from shutil import copyfile, copytree
+from os.path import (abspath, basename, dirname, expanduser, isdir, isfile,
+                     islink, join, lexists, relpath, splitext)
+from shutil import copy2
 from tempfile import mkdtemp
+from xml.etree import ElementTree
 
 import click
 
-from platformio import app, util
+from platformio import app, exception, util
 from platformio.commands.init import cli as cmd_init
 from platformio.commands.init import validate_boards
 from platformio.commands.run import cli as cmd_run
+from platformio.commands.run import print_header
 from platformio.exception import CIBuildEnvsEmpty
 
 # pylint: disable=wrong-import-order
@@ -33,6 +39,9 @@ except ImportError:
     from ConfigParser import ConfigParser
 
 
+EXAMPLE_SRC_EXTS = (".ino", ".pde", ".c", ".cc", ".cpp", ".cxx", ".s")
+
+
 def validate_path(ctx, param, value):  # pylint: disable=W0613
     invalid_path = None
     value = list(value)
@@ -58,7 +67,6 @@ def validate_path(ctx, param, value):  # pylint: disable=W0613
     "-b", "--board", multiple=True, metavar="ID", callback=validate_boards)
 @click.option(
     "--build-dir",
-    default=mkdtemp,
     type=click.Path(
         exists=True,
         file_okay=False,
@@ -66,6 +74,7 @@ def validate_path(ctx, param, value):  # pylint: disable=W0613
         writable=True,
         resolve_path=True))
 @click.option("--keep-build-dir", is_flag=True)
+@click.option("--workspace", is_flag=True)
 @click.option(
     "--project-conf",
     type=click.Path(
@@ -74,6 +83,12 @@ def validate_path(ctx, param, value):  # pylint: disable=W0613
         dir_okay=False,
         readable=True,
         resolve_path=True))
+@click.option("--examples", is_flag=True)
+@click.option("--parallel-envs", type=click.IntRange(1), default=1)
+@click.option(
+    "--junit-xml",
+    type=click.Path(
+        file_okay=True, dir_okay=False, writable=True, resolve_path=True))
 @click.option("-v", "--verbose", is_flag=True)
 @click.pass_context
 def cli(ctx,  # pylint: disable=R0913
@@ -83,31 +98,65 @@ def cli(ctx,  # pylint: disable=R0913
         board,
         build_dir,
         keep_build_dir,
+        workspace,
         project_conf,
+        examples,
+        parallel_envs,
+        junit_xml,
         verbose):
 
     if not src:
         src = getenv("PLATFORMIO_CI_SRC", "").split(":")
     if not src:
         raise click.BadParameter("Missing argument 'src'")
+    if examples:
+        # the arguments are the libraries with the examples
+        if not lib:
+            lib = [p for p in src if isdir(join(p, "examples"))]
+        src = get_examples(src)
+        if not src:
+            raise click.BadParameter("Could not find the examples")
+
+    if workspace:
+        # the sources are synchronized with the previous run and the build
+        # directory of the environments is kept, so the build is incremental
+        keep_build_dir = True
+        if not build_dir:
+            build_dir = get_workspace_dir(src, lib, exclude, board,
+                                          project_conf)
+        if isfile(join(build_dir, "platformio.ini")):
+            remove(join(build_dir, "platformio.ini"))
+    elif not build_dir:
+        build_dir = mkdtemp()
 
     try:
         app.set_session_var("force_option", True)
-        _clean_dir(build_dir)
+        if not workspace:
+            _clean_dir(build_dir)
 
-        for dir_name, patterns in dict(lib=lib, src=src).iteritems():
-            if not patterns:
-                continue
-            contents = []
-            for p in patterns:
-                contents += glob(p)
-            _copy_contents(join(build_dir, dir_name), contents)
+        contents = []
+        for p in lib:
+            contents += glob(p)
+        _mirror_contents(join(build_dir, "lib"), contents)
 
         if project_conf and isfile(project_conf):
             _copy_project_conf(build_dir, project_conf)
         elif not board:
             raise CIBuildEnvsEmpty()
 
+        if examples:
+            results = process_examples(ctx, build_dir, src, exclude, board,
+                                       parallel_envs, verbose)
+            if junit_xml:
+                write_junit_report(junit_xml, results)
+            if not all([r['succeeded'] for r in results]):
+                raise exception.ReturnErrorCode()
+            return
+
+        contents = []
+        for p in src:
+            contents += glob(p)
+        _mirror_contents(join(build_dir, "src"), contents)
         if exclude:
             _exclude_contents(build_dir, exclude)
 
@@ -115,18 +164,160 @@ def cli(ctx,  # pylint: disable=R0913
         ctx.invoke(cmd_init, project_dir=build_dir, board=board)
 
         # process project
-        ctx.invoke(cmd_run, project_dir=build_dir, verbose=verbose)
+        try:
+            ctx.invoke(
+                cmd_run,
+                project_dir=build_dir,
+                parallel_envs=parallel_envs,
+                verbose=verbose)
+        finally:
+            if junit_xml and ctx.meta.get("run_processors"):
+                write_junit_report(
+                    junit_xml, _get_results(ctx.meta['run_processors']))
     finally:
         if not keep_build_dir:
             util.rmtree_(build_dir)
 
 
+def get_examples(paths):
+    """Find the examples of the libraries, returns (name, path) pairs.
+
+    The example is a directory with the source files, its subdirectories
+    belong to the example.
+    """
+    items = []
+    for path in paths:
+        root = join(path, "examples") if isdir(join(path, "examples")) \
+            else path
+        for dirpath, dirnames, filenames in os.walk(root):
+            if any([splitext(f)[1].lower() in EXAMPLE_SRC_EXTS
+                    for f in filenames]):
+                name = relpath(dirpath, root).replace(os.sep, "/")
+                if len(paths) > 1:
+                    name = "%s/%s" % (basename(path), name)
+                items.append((name, dirpath))
+                dirnames[:] = []
+            else:
+                dirnames[:] = sorted(
+                    [d for d in dirnames if not d.startswith(".")])
+    return items
+
+
+def process_examples(  # pylint: disable=too-many-arguments
+        ctx, build_dir, examples, exclude, board, parallel_envs, verbose):
+    """Build the examples one by one in the same project.
+
+    The build directories of the environments are kept between the
+    examples, so the libraries and the frameworks are compiled only once
+    per environment and their archives are reused for each example.
+    """
+    results = []
+    for i, (name, path) in enumerate(examples):
+        if i:
+            click.echo()
+        print_header("Example %s" % click.style(name, fg="cyan", bold=True))
+        _mirror_contents(join(build_dir, "src"), [path])
+        if exclude:
+            _exclude_contents(build_dir, exclude)
+        if not i:
+            ctx.invoke(cmd_init, project_dir=build_dir, board=board)
+
+        ctx.meta['run_processors'] = []
+        try:
+            # the structure of the project is changed by each example,
+            # auto-clean would remove the archives of the libraries
+            ctx.invoke(
+                cmd_run,
+                project_dir=build_dir,
+                parallel_envs=parallel_envs,
+                disable_auto_clean=True,
+                verbose=verbose)
+        except exception.ReturnErrorCode:
+            pass
+        results.extend(_get_results(ctx.meta['run_processors'], name))
+
+    print_examples_summary(results)
+    return results
+
+
+def print_examples_summary(results):
+    click.echo()
+    print_header("[%s]" % click.style("EXAMPLES"))
+    name_max_len = max([len(r['name']) for r in results])
+    env_max_len = max([len(r['env']) for r in results])
+    for r in results:
+        click.echo(
+            "Example %s %s\t[%s]\t%.2f seconds" %
+            (click.style(r['name'].ljust(name_max_len), fg="cyan"),
+             r['env'].ljust(env_max_len), click.style(
+                 "SUCCESS", fg="green") if r['succeeded'] else click.style(
+                     "ERROR", fg="red"), r['duration']),
+            err=not r['succeeded'])
+    failed = len([r for r in results if not r['succeeded']])
+    print_header(
+        "[%s] %d of %d builds failed, took %.2f seconds" %
+        (click.style("ERROR", fg="red", bold=True) if failed else
+         click.style("SUCCESS", fg="green", bold=True), failed, len(results),
+         sum([r['duration'] for r in results])),
+        is_error=failed > 0)
+
+
+def _get_results(processors, example=None):
+    return [{
+        "name": example or ep.name,
+        "env": ep.name,
+        "platform": ep.options.get("platform", ""),
+        "succeeded": ep.succeeded,
+        "duration": ep.duration,
+        "error_output": ep.error_output
+    } for ep in processors]
+
+
+def write_junit_report(path, results):
+    """Write the results of the builds in JUnit XML format."""
+    suite = ElementTree.Element(
+        "testsuite",
+        name="platformio ci",
+        tests=str(len(results)),
+        failures=str(len([r for r in results if r['succeeded'] is False])),
+        time="%.3f" % sum([r['duration'] for r in results]))
+    for r in results:
+        case = ElementTree.SubElement(
+            suite,
+            "testcase",
+            classname="ci.%s" % (r['platform'] if r['name'] == r['env'] else
+                                 r['name'].replace("/", ".")),
+            name=r['env'],
+            time="%.3f" % r['duration'])
+        if r['succeeded'] is None:
+            ElementTree.SubElement(case, "skipped")
+        elif not r['succeeded']:
+            failure = ElementTree.SubElement(
+                case, "failure", message="Build of %s failed" % r['env'])
+            failure.text = (r['error_output'] or "").decode(
+                "utf8", "replace")
+    ElementTree.ElementTree(suite).write(
+        path, encoding="utf-8", xml_declaration=True)
+
+
 def _clean_dir(dirpath):
     util.rmtree_(dirpath)
     makedirs(dirpath)
 
 
-def _copy_contents(dst_dir, contents):
+def get_workspace_dir(src, lib, exclude, board, project_conf):
+    key = json.dumps([sorted(src), sorted(lib), sorted(exclude),
+                      sorted(board), project_conf])
+    return join(util.get_home_dir(), "ci", sha1(key).hexdigest()[:16])
+
+
+def _mirror_contents(dst_dir, contents):
+    """Mirror the files to the build directory.
+
+    The files are hardlinked (copied if the link is not possible). The
+    files which are not changed since the previous mirroring are kept as
+    they are, the removed files are removed from the build directory.
+    """
     items = {"dirs": set(), "files": set()}
 
     for path in contents:
@@ -136,22 +327,75 @@ def _copy_contents(dst_dir, contents):
             items['files'].add(path)
 
     dst_dir_name = basename(dst_dir)
+    mirror = {}
 
     if dst_dir_name == "src" and len(items['dirs']) == 1:
-        copytree(list(items['dirs']).pop(), dst_dir, symlinks=True)
+        _add_mirrored_dir(mirror, list(items['dirs']).pop(), dst_dir)
     else:
-        makedirs(dst_dir)
         for d in items['dirs']:
-            copytree(d, join(dst_dir, basename(d)), symlinks=True)
-
-    if not items['files']:
-        return
+            _add_mirrored_dir(mirror, d, join(dst_dir, basename(d)))
 
+    files_dir = dst_dir
     if dst_dir_name == "lib":
-        dst_dir = join(dst_dir, mkdtemp(dir=dst_dir))
-
+        # standalone files are the separate library
+        files_dir = join(dst_dir, "__ci_files")
     for f in items['files']:
-        copyfile(f, join(dst_dir, basename(f)))
+        mirror[join(files_dir, basename(f))] = f
+
+    _sync_mirror(dst_dir, mirror)
+
+
+def _add_mirrored_dir(mirror, src_dir, dst_dir):
+    for root, dirs, files in os.walk(src_dir):
+        for name in files + [d for d in dirs if islink(join(root, d))]:
+            path = join(root, name)
+            mirror[join(dst_dir, relpath(path, src_dir))] = path
+        # symbolic links to the directories are mirrored as links
+        dirs[:] = [d for d in dirs if not islink(join(root, d))]
+
+
+def _sync_mirror(dst_dir, mirror):
+    if isdir(dst_dir):
+        for root, dirs, files in os.walk(dst_dir, topdown=False):
+            for name in files + dirs:
+                path = join(root, name)
+                if islink(path) or isfile(path):
+                    if path not in mirror:
+                        remove(path)
+                elif not os.listdir(path):
+                    os.rmdir(path)
+
+    for dst, src in mirror.iteritems():
+        if _is_mirrored(src, dst):
+            continue
+        if lexists(dst):
+            remove(dst)
+        elif not isdir(dirname(dst)):
+            makedirs(dirname(dst))
+        if islink(src):
+            os.symlink(os.readlink(src), dst)
+            continue
+        try:
+            os.link(src, dst)
+        except (AttributeError, OSError):
+            copy2(src, dst)
+    if not isdir(dst_dir):
+        makedirs(dst_dir)
+
+
+def _is_mirrored(src, dst):
+    if not lexists(dst) or islink(src) != islink(dst):
+        return False
+    if islink(src):
+        return os.readlink(src) == os.readlink(dst)
+    src_stat = os.stat(src)
+    dst_stat = os.stat(dst)
+    if (src_stat.st_ino, src_stat.st_dev) == (dst_stat.st_ino,
+                                              dst_stat.st_dev):
+        return True
+    # the copy of the file
+    return (src_stat.st_size == dst_stat.st_size and
+            int(src_stat.st_mtime) == int(dst_stat.st_mtime))
 
 
 def _exclude_contents(dst_dir, patterns):
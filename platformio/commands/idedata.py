@@ -0,0 +1,152 @@
+# Copyright 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import sys
+import threading
+from os import getcwd
+from os.path import join
+
+import click
+
+from platformio import exception, util
+from platformio.commands.run import get_watch_paths
+from platformio.ide.projectgenerator import get_idedata
+from platformio.watcher import Watcher
+
+
+@click.command("idedata", short_help="Project data for IDE integration")
+@click.option("-e", "--environment")
+@click.option(
+    "-d",
+    "--project-dir",
+    default=getcwd,
+    type=click.Path(
+        exists=True,
+        file_okay=False,
+        dir_okay=True,
+        writable=True,
+        resolve_path=True))
+@click.option("--json-rpc", is_flag=True)
+def cli(environment, project_dir, json_rpc):
+    if json_rpc:
+        return JsonRpcServer(project_dir).serve()
+    click.echo(
+        json.dumps(
+            get_idedata(project_dir, environment or
+                        get_default_environment(project_dir))))
+
+
+def get_default_environment(project_dir):
+    config = util.load_project_config(project_dir)
+    if config.has_option("platformio", "env_default"):
+        return config.get("platformio", "env_default").split(",")[0].strip()
+    for section in config.sections():
+        if section.startswith("env:"):
+            return section[4:]
+    raise exception.PlatformioException(
+        "Project does not have any environment")
+
+
+class JsonRpcServer(object):
+    """JSON-RPC 2.0 over standard input/output, one message per line.
+
+    Methods:
+
+    * ``idedata`` ({"environment": "name"}) - IDE data of the environment,
+      the environment is subscribed to ``idedata.changed`` notifications
+    * ``shutdown`` - stop the server
+    """
+
+    def __init__(self, project_dir):
+        self.project_dir = project_dir
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def serve(self):
+        watcher = threading.Thread(target=self._watch_project)
+        watcher.daemon = True
+        watcher.start()
+
+        for line in iter(sys.stdin.readline, ""):
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                assert isinstance(request, dict) and "method" in request
+            except (ValueError, AssertionError):
+                self._send({"id": None,
+                            "error": {"code": -32700,
+                                      "message": "Parse error"}})
+                continue
+            if not self._process_request(request):
+                break
+
+    def _process_request(self, request):
+        method = request['method']
+        response = {"id": request.get("id")}
+        # the malformed request does not stop the server
+        try:
+            params = request.get("params") or {}
+            if not isinstance(params, dict):
+                response['error'] = {"code": -32602,
+                                     "message": "Invalid params"}
+            elif method == "shutdown":
+                response['result'] = None
+            elif method == "idedata":
+                env_name = (params.get("environment") or
+                            get_default_environment(self.project_dir))
+                response['result'] = get_idedata(self.project_dir, env_name)
+                with self._lock:
+                    self._subscriptions[env_name] = response['result']
+            else:
+                response['error'] = {"code": -32601,
+                                     "message": "Method not found"}
+        except exception.PlatformioException as e:
+            response['error'] = {"code": -32000, "message": str(e)}
+        except Exception as e:  # pylint: disable=broad-except
+            response['error'] = {"code": -32603,
+                                 "message": "Internal error: %s" % e}
+        if "id" in request:
+            self._send(response)
+        return method != "shutdown"
+
+    def _watch_project(self):
+        with util.cd(self.project_dir):
+            paths = get_watch_paths([]) + [util.get_projectlibdeps_dir(),
+                                           join(util.get_home_dir(), "lib")]
+        watcher = Watcher(paths)
+        snapshot = watcher.snapshot()
+        while True:
+            snapshot, _ = watcher.wait(snapshot)
+            with self._lock:
+                subscriptions = dict(self._subscriptions)
+            for env_name, data in subscriptions.items():
+                try:
+                    new_data = get_idedata(self.project_dir, env_name)
+                except Exception:  # pylint: disable=broad-except
+                    continue
+                if new_data == data:
+                    continue
+                with self._lock:
+                    self._subscriptions[env_name] = new_data
+                self._send({"method": "idedata.changed",
+                            "params": {"environment": env_name,
+                                       "data": new_data}})
+
+    def _send(self, message):
+        message['jsonrpc'] = "2.0"
+        with self._lock:
+            sys.stdout.write(json.dumps(message) + "\n")
+            sys.stdout.flush()
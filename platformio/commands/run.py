@@ -12,20 +12,33 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
+import shlex
+import threading
 from datetime import datetime
 from hashlib import sha1
-from os import getcwd, makedirs, walk
-from os.path import getmtime, isdir, isfile, join
+from os import environ, getcwd, listdir, makedirs, remove, stat, walk
+from os.path import abspath, expanduser, isabs, isdir, isfile, join
 from time import time
 
 import click
 
-from platformio import __version__, exception, telemetry, util
+from platformio import __version__, app, exception, telemetry, util
 from platformio.commands.lib import lib_install as cmd_lib_install
 from platformio.commands.platform import \
     platform_install as cmd_platform_install
+from platformio.events import EventStream
+from platformio.history import BuildHistory
 from platformio.managers.lib import LibraryManager
-from platformio.managers.platform import PlatformFactory
+from platformio.managers.platform import PlatformFactory, PlatformRunMixin
+from platformio.profiler import BuildProfiler
+from platformio.watcher import Watcher
+
+# pylint: disable=wrong-import-order
+try:
+    from configparser import Error as ConfigParserError
+except ImportError:
+    from ConfigParser import Error as ConfigParserError
 
 
 @click.command("run", short_help="Process project environments")
@@ -44,6 +57,10 @@ from platformio.managers.platform import PlatformFactory
         resolve_path=True))
 @click.option("-v", "--verbose", is_flag=True)
 @click.option("--disable-auto-clean", is_flag=True)
+@click.option("--parallel-envs", type=click.IntRange(1), default=1)
+@click.option("--watch", is_flag=True)
+@click.option("--profile", is_flag=True)
+@click.option("--json-events", is_flag=True)
 @click.pass_context
 def cli(ctx,  # pylint: disable=R0913,R0914
         environment,
@@ -51,62 +68,192 @@ def cli(ctx,  # pylint: disable=R0913,R0914
         upload_port,
         project_dir,
         verbose,
-        disable_auto_clean):
+        disable_auto_clean,
+        parallel_envs,
+        watch,
+        profile,
+        json_events):
+    options = dict(
+        environment=environment,
+        target=target,
+        upload_port=upload_port,
+        verbose=verbose,
+        disable_auto_clean=disable_auto_clean,
+        parallel_envs=parallel_envs,
+        watch=watch,
+        profile=profile)
     with util.cd(project_dir):
-        # clean obsolete .pioenvs dir
-        if not disable_auto_clean:
-            try:
-                _clean_pioenvs_dir(util.get_projectpioenvs_dir())
-            except:  # pylint: disable=bare-except
-                click.secho(
-                    "Can not remove temporary directory `%s`. Please remove "
-                    "`.pioenvs` directory from the project manually to avoid "
-                    "build issues" % util.get_projectpioenvs_dir(),
-                    fg="yellow")
-
-        config = util.load_project_config()
-        check_project_defopts(config)
-        assert check_project_envs(config, environment)
-
-        env_default = None
-        if config.has_option("platformio", "env_default"):
-            env_default = [
-                e.strip()
-                for e in config.get("platformio", "env_default").split(",")
-            ]
-
-        results = []
-        for section in config.sections():
-            # skip main configuration section
-            if section == "platformio":
-                continue
-
-            if not section.startswith("env:"):
-                raise exception.InvalidEnvName(section)
-
-            envname = section[4:]
-            skipenv = any([environment and envname not in environment,
-                           not environment and env_default and
-                           envname not in env_default])
-            if skipenv:
-                # echo("Skipped %s environment" % style(envname, fg="yellow"))
-                continue
-
-            if results:
-                click.echo()
+        if json_events:
+            # stdout is reserved for the events
+            with EventStream() as events:
+                results = _process_project(ctx, events=events, **options)
+        else:
+            results = _process_project(ctx, **options)
+
+    if not all(results):
+        raise exception.ReturnErrorCode()
+
+
+def _process_project(ctx,  # pylint: disable=R0913,R0914
+                     environment,
+                     target,
+                     upload_port,
+                     verbose,
+                     disable_auto_clean,
+                     parallel_envs,
+                     watch,
+                     profile,
+                     events=None):
+    processors = None
+    watcher = None
+    while True:
+        start_time = time()
+        if watch and not watcher:
+            # watch the project before its configuration is loaded, the
+            # broken `platformio.ini` is watched until it is fixed
+            watcher = Watcher(get_watch_paths())
+            snapshot = watcher.snapshot()
+        try:
+            if not processors:
+                processors = get_environment_processors(
+                    ctx, environment, target, upload_port, verbose)
+                for ep in processors:
+                    ep.profiler.enabled = profile
+                    ep.events = events
+                # the results are reported by the caller, see `ci`
+                ctx.meta['run_processors'] = processors
+                if watch and watcher.paths != get_watch_paths(processors):
+                    # `lib_extra_dirs` of the environments
+                    watcher.close()
+                    watcher = Watcher(get_watch_paths(processors))
+                    snapshot = watcher.snapshot()
+            results = process_environments(processors, parallel_envs,
+                                           disable_auto_clean)
+            if profile:
+                print_profile_summary(processors)
+            if events:
+                events.emit("summary", succeeded=all(results),
+                            environments=[{
+                                "env": ep.name,
+                                "succeeded": ep.succeeded,
+                                "duration": ep.duration
+                            } for ep in processors])
+        except (exception.PlatformioException, ConfigParserError) as e:
+            if not watch:
+                raise
+            click.secho("Error: %s" % e, fg="red", err=True)
+            processors = None
+            results = [False]
+
+        if not watch:
+            return results
+
+        click.secho(
+            "Iteration took %.2f seconds. Watching for changes (%s), "
+            "press Ctrl+C to stop..." % (time() - start_time,
+                                         watcher.backend),
+            fg="cyan")
+        try:
+            snapshot, changes = watcher.wait(snapshot)
+        except KeyboardInterrupt:
+            watcher.close()
+            # the exit code is the result of the last iteration
+            return results
+        click.echo("\nDetected changes in %s" % ", ".join(changes[:3] + (
+            ["..."] if len(changes) > 3 else [])))
+        if join(util.get_project_dir(), "platformio.ini") in changes:
+            # configuration was changed, start from scratch
+            processors = None
+            watcher.close()
+            watcher = None
+
+
+def get_environment_processors(ctx, environment, target, upload_port,
+                               verbose):
+    config = util.load_project_config()
+    check_project_defopts(config)
+    assert check_project_envs(config, environment)
+
+    env_default = None
+    if config.has_option("platformio", "env_default"):
+        env_default = [
+            e.strip()
+            for e in config.get("platformio", "env_default").split(",")
+        ]
+
+    processors = []
+    for section in config.sections():
+        # skip main configuration section
+        if section == "platformio":
+            continue
 
-            options = {}
-            for k, v in config.items(section):
-                options[k] = v
-            if "piotest" not in options and "piotest" in ctx.meta:
-                options['piotest'] = ctx.meta['piotest']
+        if not section.startswith("env:"):
+            raise exception.InvalidEnvName(section)
 
-            ep = EnvironmentProcessor(ctx, envname, options, target,
-                                      upload_port, verbose)
-            results.append(ep.process())
+        envname = section[4:]
+        skipenv = any([environment and envname not in environment,
+                       not environment and env_default and
+                       envname not in env_default])
+        if skipenv:
+            # echo("Skipped %s environment" % style(envname, fg="yellow"))
+            continue
 
-        if not all(results):
-            raise exception.ReturnErrorCode()
+        options = {}
+        for k, v in config.items(section):
+            options[k] = v
+        if "piotest" not in options and "piotest" in ctx.meta:
+            options['piotest'] = ctx.meta['piotest']
+
+        processors.append(
+            EnvironmentProcessor(ctx, envname, options, target, upload_port,
+                                 verbose))
+    return processors
+
+
+def process_environments(processors, parallel_envs=1,
+                         disable_auto_clean=False):
+    # project structure is shared by all environments, calculate it once
+    project_hash = None
+    if not disable_auto_clean:
+        _clean_obsolete_files(util.get_projectpioenvs_dir())
+        project_hash = calculate_project_hash()
+    for ep in processors:
+        ep.project_hash = project_hash
+
+    if parallel_envs > 1 and len(processors) > 1:
+        start_time = time()
+        results = _process_environments_parallel(processors, parallel_envs)
+        # the environments are finished out of order, sum up their results
+        print_summary(processors, start_time)
+        return results
+
+    results = []
+    for ep in processors:
+        if results:
+            click.echo()
+        results.append(ep.process())
+    return results
+
+
+def get_watch_paths(processors=None):
+    config_path = join(util.get_project_dir(), "platformio.ini")
+    try:
+        paths = [
+            util.get_projectsrc_dir(), util.get_projectlib_dir(), config_path
+        ]
+    except ConfigParserError:
+        # watch the broken configuration until it is fixed
+        return [config_path]
+    if environ.get("PLATFORMIO_LIB_EXTRA_DIRS"):
+        paths.extend(environ.get("PLATFORMIO_LIB_EXTRA_DIRS").split(","))
+    for ep in processors or []:
+        paths.extend(ep.options.get("lib_extra_dirs", "").split(","))
+    result = []
+    for path in paths:
+        path = abspath(expanduser(path.strip())) if path.strip() else None
+        if path and path not in result:
+            result.append(path)
+    return result
 
 
 class EnvironmentProcessor(object):
@@ -114,11 +261,13 @@ class EnvironmentProcessor(object):
     KNOWN_OPTIONS = ("platform", "framework", "board", "board_mcu",
                      "board_f_cpu", "board_f_flash", "board_flash_mode",
                      "build_flags", "src_build_flags", "build_unflags",
+                     "build_pch", "build_unity", "build_unity_ignore",
                      "src_filter", "extra_script", "targets", "upload_port",
                      "upload_protocol", "upload_speed", "upload_flags",
                      "upload_resetmethod", "lib_install", "lib_deps",
                      "lib_force", "lib_ignore", "lib_extra_dirs",
-                     "lib_ldf_mode", "lib_compat_mode", "piotest")
+                     "lib_ldf_mode", "lib_compat_mode", "piotest",
+                     "test_transport", "test_timeout")
 
     REMAPED_OPTIONS = {"framework": "pioframework", "platform": "pioplatform"}
 
@@ -130,13 +279,31 @@ class EnvironmentProcessor(object):
                  options,
                  targets,
                  upload_port,
-                 verbose):
+                 verbose,
+                 project_hash=None):
         self.cmd_ctx = cmd_ctx
         self.name = name
         self.options = options
         self.targets = targets
         self.upload_port = upload_port
         self.verbose = verbose
+        # auto-clean is disabled when project hash is not specified
+        self.project_hash = project_hash
+        # the number of jobs for build system, all CPUs by default
+        self.jobs = None
+
+        self.platform = None
+        self.duration = 0
+        self.succeeded = None
+        # the last lines of the error output of the failed build
+        self.error_output = None
+        self._buffer = None
+        self._idedata_key = None
+        self.profiler = BuildProfiler(name)
+        self.profile_summary = None
+        self._history_id = None
+        # stream of the machine-readable events, see `--json-events`
+        self.events = None
 
     def process(self):
         terminal_width, _ = click.get_terminal_size()
@@ -150,26 +317,68 @@ class EnvironmentProcessor(object):
             else:
                 process_opts.append((k, v))
 
-        click.echo("[%s] Processing %s (%s)" %
-                   (datetime.now().strftime("%c"), click.style(
-                       self.name, fg="cyan", bold=True),
-                    ", ".join(["%s: %s" % opts for opts in process_opts])))
-        click.secho("-" * terminal_width, bold=True)
+        self.echo("[%s] Processing %s (%s)" %
+                  (datetime.now().strftime("%c"), click.style(
+                      self.name, fg="cyan", bold=True),
+                   ", ".join(["%s: %s" % opts for opts in process_opts])))
+        self.echo("-" * terminal_width, bold=True)
+        if self.events:
+            self.events.emit("env_start", env=self.name,
+                             options=dict(process_opts))
 
-        self.options = self._validate_options(self.options)
-        result = self._run()
+        if not self.platform:
+            self.prepare()
+        self._history_id = self._add_history_record()
+        result = self.build()
 
         is_error = result['returncode'] != 0
+        self.duration = time() - start_time
+        self.error_output = result.get("err") if is_error else None
+        if self.events:
+            self.events.emit("env_end", env=self.name,
+                             succeeded=not is_error,
+                             returncode=result['returncode'],
+                             duration=self.duration)
+        if self._history_id:
+            BuildHistory().update(
+                self._history_id,
+                duration=self.duration,
+                succeeded=not is_error)
+        if self.profiler.enabled and isdir(self.get_build_dir()):
+            self.profile_summary = self.profiler.save(self.get_build_dir())
+        self.succeeded = not is_error
         if is_error or "piotest_processor" not in self.cmd_ctx.meta:
-            print_header(
-                "[%s] Took %.2f seconds" % ((click.style(
+            self.echo(
+                get_header("[%s] Took %.2f seconds" % ((click.style(
                     "ERROR", fg="red", bold=True) if is_error else click.style(
-                        "SUCCESS", fg="green", bold=True)),
-                                            time() - start_time),
-                is_error=is_error)
+                        "SUCCESS", fg="green", bold=True)), self.duration)),
+                err=is_error)
 
         return not is_error
 
+    def echo(self, message, err=False, **styles):
+        if styles:
+            message = click.style(message, **styles)
+        if self._buffer is None:
+            click.echo(message, err=err)
+        else:
+            self._buffer.append((message, err))
+
+    def start_buffering(self):
+        self._buffer = []
+
+    def flush_buffer(self):
+        for message, err in self._buffer or []:
+            click.echo(message, err=err)
+        self._buffer = None
+
+    def _on_platform_output(self, line, fg=None, err=False):
+        if self._idedata_key and not err and line.startswith('{"'):
+            self._save_idedata(self._idedata_key, line)
+        if self.events and self.events.emit_build_line(self.name, line, err):
+            return
+        self.echo(line, err=err, fg=fg)
+
     def _validate_options(self, options):
         result = {}
         for k, v in options.items():
@@ -210,7 +419,8 @@ class EnvironmentProcessor(object):
             targets = self.options['targets'].split()
         return targets
 
-    def _run(self):
+    def prepare(self):
+        self.options = self._validate_options(self.options)
         if "platform" not in self.options:
             raise exception.UndefinedEnvPlatform(self.name)
 
@@ -220,25 +430,243 @@ class EnvironmentProcessor(object):
         telemetry.on_run_environment(self.options, build_targets)
 
         # install dependent libraries
-        if "lib_install" in self.options:
-            _autoinstall_libdeps(self.cmd_ctx, [
-                int(d.strip()) for d in self.options['lib_install'].split(",")
-                if d.strip()
-            ], self.verbose)
-        if "lib_deps" in self.options:
-            _autoinstall_libdeps(self.cmd_ctx, [
-                d.strip() for d in self.options['lib_deps'].split("\n")
-                if d.strip()
-            ], self.verbose)
+        with self.profiler.phase("Library dependencies", "libdeps"):
+            if "lib_install" in self.options:
+                _autoinstall_libdeps(self.cmd_ctx, [
+                    int(d.strip())
+                    for d in self.options['lib_install'].split(",")
+                    if d.strip()
+                ], self.verbose)
+            if "lib_deps" in self.options:
+                _autoinstall_libdeps(self.cmd_ctx, [
+                    d.strip() for d in self.options['lib_deps'].split("\n")
+                    if d.strip()
+                ], self.verbose)
+
+        with self.profiler.phase("Platform packages", "packages"):
+            try:
+                p = PlatformFactory.newPlatform(self.options['platform'])
+            except exception.UnknownPlatform:
+                self.cmd_ctx.invoke(
+                    cmd_platform_install,
+                    platforms=[self.options['platform']])
+                p = PlatformFactory.newPlatform(self.options['platform'])
+
+            # install dependent packages before build system is launched
+            p.configure_default_packages(build_vars, build_targets)
+            p.install_packages(quiet=True)
+
+        self.platform = p
+
+    def build(self):
+        assert self.platform
+        p = self.platform
+        if self._buffer is not None or self.events:
+            p.set_output_callback(self._on_platform_output)
+
+        if self.project_hash is not None:
+            self._clean_build_dir(p)
+
+        if (self.project_hash is not None and
+                self._get_build_targets() == ["idedata"]):
+            self._idedata_key = self.calculate_idedata_key(p)
+            data = self.load_idedata(self._idedata_key)
+            if data:
+                self.echo(json.dumps(data))
+                return {"out": "", "err": "", "returncode": 0}
+            p.set_output_callback(self._on_platform_output)
+
+        inputs_state = None
+        if (app.get_setting("skip_unchanged_builds") and
+                not self._get_build_targets()):
+            inputs_state = self.calculate_inputs_state(p)
+            if inputs_state == self._load_inputs_state():
+                self.echo("Project sources, libraries and options are "
+                          "unchanged, build is up to date")
+                return {"out": "", "err": "", "returncode": 0}
+
+        variables = self._get_build_variables()
+        profile_file = join(self.get_build_dir(),
+                            BuildProfiler.BUILD_EVENTS_NAME)
+        if self.profiler.enabled:
+            variables['profile_file'] = profile_file
+        if self._history_id:
+            variables['build_history_id'] = str(self._history_id)
+        if self.events:
+            variables['json_events'] = "1"
+        spawn_time = time()
+        result = p.run(variables, self._get_build_targets(), self.verbose,
+                       self.jobs)
+        self.profiler.add_event("Build system", "build", spawn_time)
+        self.profiler.load_build_events(profile_file, spawn_time)
+        if self.project_hash is not None:
+            # dependent packages could be installed while processing
+            self._save_checksum(p)
+        self._save_inputs_state(inputs_state
+                                if result['returncode'] == 0 else None)
+        return result
 
+    def _add_history_record(self):
+        targets = self._get_build_targets()
+        if (not app.get_setting("enable_build_history") or
+                set(targets) & set(["clean", "envdump", "idedata"])):
+            return None
+        return BuildHistory().add(util.get_project_dir(), self.name,
+                                  self.options.get("platform"), targets)
+
+    def get_build_dir(self):
+        return join(util.get_projectpioenvs_dir(), self.name)
+
+    def calculate_checksum(self, platform):
+        packages = platform.get_installed_packages()
+        data = {
+            "version": __version__,
+            "project": self.project_hash,
+            # options which don't have an influence on the build artifacts
+            "options": sorted([(k, v) for k, v in self.options.items()
+                               if k not in ("piotest", "targets",
+                                            "test_timeout") and
+                               not k.startswith("upload_")]),
+            "platform": "%s@%s" % (platform.name, platform.version),
+            "packages": sorted(["%s@%s" % (name, manifest['version'])
+                                for name, manifest in packages.items()])
+        }
+        return sha1(json.dumps(data, sort_keys=True)).hexdigest()
+
+    def _clean_build_dir(self, platform):
+        build_dir = self.get_build_dir()
+        checksum_file = join(build_dir, "project.checksum")
+        if not isdir(build_dir):
+            return
+        if isfile(checksum_file):
+            with open(checksum_file) as fp:
+                if fp.read() == self.calculate_checksum(platform):
+                    return
+        try:
+            util.rmtree_(build_dir)
+        except:  # pylint: disable=bare-except
+            click.secho(
+                "Can not remove temporary directory `%s`. Please remove "
+                "it manually to avoid build issues" % build_dir,
+                fg="yellow")
+
+    def _save_checksum(self, platform):
+        build_dir = self.get_build_dir()
+        if not isdir(build_dir):
+            makedirs(build_dir)
+        with open(join(build_dir, "project.checksum"), "w") as fp:
+            fp.write(self.calculate_checksum(platform))
+
+    def calculate_idedata_key(self, platform):
+        state = sha1(self.calculate_checksum(platform))
+        for k, v in sorted(environ.items()):
+            if k.startswith("PLATFORMIO_"):
+                state.update("%s=%s\n" % (k, v))
+        if "extra_script" in self.options:
+            _update_dir_state(state, self.options['extra_script'])
+
+        # include folders depend on the layout of the libraries only
+        lib_dirs = [util.get_projectlib_dir(), util.get_projectlibdeps_dir(),
+                    join(util.get_home_dir(), "lib")]
+        for d in self.options.get("lib_extra_dirs", "").split(","):
+            if d.strip():
+                lib_dirs.append(expanduser(d.strip()))
+        for lib_dir in lib_dirs:
+            if not isdir(lib_dir):
+                continue
+            for name in sorted(listdir(lib_dir)):
+                path = join(lib_dir, name)
+                state.update("%s\n" % path)
+                if not isdir(path):
+                    continue
+                for item in sorted(listdir(path)):
+                    state.update("%s/%s\n" % (name, item))
+                for manifest in ("library.json", "library.properties",
+                                 "module.json"):
+                    if isfile(join(path, manifest)):
+                        _update_dir_state(state, join(path, manifest))
+        return state.hexdigest()
+
+    def load_idedata(self, key):
+        path = join(self.get_build_dir(), "idedata.json")
+        if not isfile(path):
+            return None
         try:
-            p = PlatformFactory.newPlatform(self.options['platform'])
-        except exception.UnknownPlatform:
-            self.cmd_ctx.invoke(
-                cmd_platform_install, platforms=[self.options['platform']])
-            p = PlatformFactory.newPlatform(self.options['platform'])
+            cache = util.load_json(path)
+        except ValueError:
+            return None
+        return cache.get("data") if cache.get("key") == key else None
 
-        return p.run(build_vars, build_targets, self.verbose)
+    def _save_idedata(self, key, output):
+        try:
+            data = json.loads(output)
+        except ValueError:
+            return
+        build_dir = self.get_build_dir()
+        if not isdir(build_dir):
+            makedirs(build_dir)
+        with open(join(build_dir, "idedata.json"), "w") as fp:
+            json.dump({"key": key, "data": data}, fp)
+
+    def calculate_inputs_state(self, platform):
+        """Fingerprint everything that can influence the default build.
+
+        Project and library files, including the framework packages, are
+        compared by their size and modification time. Toolchains are
+        covered by the package versions from the environment checksum.
+        """
+        state = sha1(self.calculate_checksum(platform))
+        for k, v in sorted(environ.items()):
+            if k.startswith("PLATFORMIO_"):
+                state.update("%s=%s\n" % (k, v))
+
+        dirs = [util.get_project_dir(), join(util.get_home_dir(), "lib")]
+        for d in self.options.get("lib_extra_dirs", "").split(","):
+            if d.strip():
+                dirs.append(expanduser(d.strip()))
+        # the include directories outside of the project
+        for flags in (self.options.get("build_flags"),
+                      self.options.get("src_build_flags"),
+                      environ.get("PLATFORMIO_BUILD_FLAGS"),
+                      environ.get("PLATFORMIO_SRC_BUILD_FLAGS")):
+            dirs.extend(_get_include_dirs(flags or ""))
+        for name in platform.get_installed_packages():
+            if name.startswith("framework-"):
+                dirs.append(platform.get_package_dir(name))
+        for d in dirs:
+            _update_dir_state(state, d)
+        return state.hexdigest()
+
+    def _get_outputs_state(self):
+        state = sha1()
+        build_dir = self.get_build_dir()
+        for name in sorted(listdir(build_dir)):
+            path = join(build_dir, name)
+            if (name != "inputs.state" and not name.startswith("profile.") and
+                    isfile(path)):
+                st = stat(path)
+                state.update("%s:%d:%r\n" % (name, st.st_size, st.st_mtime))
+        return state.hexdigest()
+
+    def _load_inputs_state(self):
+        path = join(self.get_build_dir(), "inputs.state")
+        if not isfile(path):
+            return None
+        with open(path) as fp:
+            inputs_state, outputs_state = (fp.read().split() + [None])[:2]
+        # build artifacts were modified or removed
+        if outputs_state != self._get_outputs_state():
+            return None
+        return inputs_state
+
+    def _save_inputs_state(self, inputs_state):
+        path = join(self.get_build_dir(), "inputs.state")
+        if not inputs_state:
+            if isfile(path):
+                remove(path)
+            return
+        with open(path, "w") as fp:
+            fp.write("%s %s" % (inputs_state, self._get_outputs_state()))
 
 
 def _autoinstall_libdeps(ctx, libraries, verbose=False):
@@ -249,35 +677,193 @@ def _autoinstall_libdeps(ctx, libraries, verbose=False):
     ctx.invoke(cmd_lib_install, libraries=libraries, quiet=not verbose)
 
 
-def _clean_pioenvs_dir(pioenvs_dir):
-    structhash_file = join(pioenvs_dir, "structure.hash")
-    proj_hash = calculate_project_hash()
-
-    # if project's config is modified
-    if (isdir(pioenvs_dir) and
-            getmtime(join(util.get_project_dir(), "platformio.ini")) >
-            getmtime(pioenvs_dir)):
-        util.rmtree_(pioenvs_dir)
-
-    # check project structure
-    if isdir(pioenvs_dir) and isfile(structhash_file):
-        with open(structhash_file) as f:
-            if f.read() == proj_hash:
-                return
-        util.rmtree_(pioenvs_dir)
-
-    if not isdir(pioenvs_dir):
-        makedirs(pioenvs_dir)
-
-    with open(structhash_file, "w") as f:
-        f.write(proj_hash)
+def _clean_obsolete_files(pioenvs_dir):
+    # global project hash and SCons database are stored per environment now
+    for name in ("structure.hash", ".sconsign.dblite"):
+        path = join(pioenvs_dir, name)
+        if not isfile(path):
+            continue
+        try:
+            remove(path)
+        except OSError:
+            pass
+
+
+def load_cached_idedata(env_name):
+    """Return IDE data of the environment without launching build system.
+
+    None is returned when the cache does not exist or is outdated.
+    """
+    config = util.load_project_config()
+    section = "env:%s" % env_name
+    if not config.has_section(section):
+        return None
+    options = dict(config.items(section))
+    if "platform" not in options:
+        return None
+    try:
+        platform = PlatformFactory.newPlatform(options['platform'])
+    except exception.PlatformioException:
+        return None
+    ep = EnvironmentProcessor(None, env_name, options, ["idedata"], None,
+                              False, calculate_project_hash())
+    ep.options = dict([(ep.RENAMED_OPTIONS.get(k, k), v)
+                       for k, v in options.items()])
+    return ep.load_idedata(ep.calculate_idedata_key(platform))
+
+
+def _update_dir_state(state, path):
+    if isfile(path):
+        st = stat(path)
+        state.update("%s:%d:%r\n" % (path, st.st_size, st.st_mtime))
+        return
+    pioenvs_dir = util.get_projectpioenvs_dir()
+    # the same as `MatchSourceFiles` of the build system
+    for root, dirs, files in walk(path, followlinks=True):
+        dirs[:] = sorted([
+            d for d in dirs
+            if d not in (".git", ".svn", ".hg") and
+            join(root, d) != pioenvs_dir
+        ])
+        for f in sorted(files):
+            path = join(root, f)
+            try:
+                st = stat(path)
+            except OSError:
+                continue
+            state.update("%s:%d:%r\n" % (path, st.st_size, st.st_mtime))
+
+
+def _get_include_dirs(flags):
+    """The absolute `-I` paths of the build flags."""
+    try:
+        args = shlex.split(flags)
+    except ValueError:
+        args = flags.split()
+    result = []
+    for i, arg in enumerate(args):
+        if arg == "-I" and i + 1 < len(args):
+            arg = args[i + 1]
+        elif arg.startswith("-I"):
+            arg = arg[2:]
+        else:
+            continue
+        # the variables of the build system and the paths in the project
+        if "$" not in arg and isabs(expanduser(arg)):
+            result.append(expanduser(arg))
+    return result
+
+
+def _process_environments_parallel(processors, parallel_envs):
+    # install dependencies and development platforms one by one
+    # platforms of the environments are kept between watch iterations
+    unprepared = [ep for ep in processors if not ep.platform]
+    for ep in unprepared:
+        click.echo("Preparing %s environment..." % click.style(
+            ep.name, fg="cyan", bold=True))
+        ep.prepare()
+    if unprepared:
+        click.echo()
+
+    # share available CPUs between concurrent build systems
+    parallel_envs = min(parallel_envs, len(processors))
+    jobs = max(1, PlatformRunMixin.get_job_nums() / parallel_envs)
+
+    queue = list(processors)
+    finished = []
+    lock = threading.Lock()
+
+    def _worker():
+        while True:
+            with lock:
+                if not queue:
+                    return
+                ep = queue.pop(0)
+            ep.jobs = jobs
+            ep.start_buffering()
+            try:
+                ep.process()
+            except Exception as e:  # pylint: disable=broad-except
+                ep.succeeded = False
+                ep.echo("Error: %s" % e, err=True, fg="red")
+            with lock:
+                if finished:
+                    click.echo()
+                ep.flush_buffer()
+                finished.append(ep)
+
+    workers = []
+    for _ in range(parallel_envs):
+        t = threading.Thread(target=_worker)
+        t.daemon = True
+        t.start()
+        workers.append(t)
+    for t in workers:
+        # join with timeout, allow to abort processing with Ctrl+C
+        while t.is_alive():
+            t.join(0.2)
+
+    return [ep.succeeded for ep in processors]
+
+
+def print_summary(processors, start_time):
+    click.echo()
+    print_header("[%s]" % click.style("SUMMARY"))
+
+    envname_max_len = max([len(ep.name) for ep in processors])
+    succeeded = True
+    for ep in processors:
+        status_str = click.style("SUCCESS", fg="green")
+        if not ep.succeeded:
+            succeeded = False
+            status_str = click.style("ERROR", fg="red")
+
+        click.echo(
+            "Environment %s\t[%s]\t%.2f seconds" % (click.style(
+                ep.name.ljust(envname_max_len), fg="cyan"), status_str,
+                                                   ep.duration),
+            err=not ep.succeeded)
+
+    print_header(
+        "[%s] Took %.2f seconds" % ((click.style(
+            "SUCCESS", fg="green", bold=True) if succeeded else click.style(
+                "ERROR", fg="red", bold=True)), time() - start_time),
+        is_error=not succeeded)
+
+
+def print_profile_summary(processors):
+    for ep in processors:
+        summary = ep.profile_summary
+        if not summary:
+            continue
+        click.echo()
+        print_header("[%s] %s" % (click.style("PROFILE"), click.style(
+            ep.name, fg="cyan")))
+        for phase in summary['phases']:
+            click.echo("%-30s %8.2f seconds (%d)" % (
+                phase['title'], phase['duration'], phase['count']))
+        for key, title in (("translation_units", "Slowest translation units"),
+                           ("libraries", "Slowest libraries")):
+            if not summary[key]:
+                continue
+            click.secho("\n%s:" % title, bold=True)
+            for item in summary[key]:
+                click.echo("%8.2f seconds  %s" %
+                           (item['duration'], item['name']))
+        click.echo("\nReport: %s\nChrome trace: %s" % (
+            join(ep.get_build_dir(), BuildProfiler.REPORT_NAME),
+            join(ep.get_build_dir(), BuildProfiler.TRACE_NAME)))
 
 
-def print_header(label, is_error=False):
+def get_header(label):
     terminal_width, _ = click.get_terminal_size()
     width = len(click.unstyle(label))
     half_line = "=" * ((terminal_width - width - 2) / 2)
-    click.echo("%s %s %s" % (half_line, label, half_line), err=is_error)
+    return "%s %s %s" % (half_line, label, half_line)
+
+
+def print_header(label, is_error=False):
+    click.echo(get_header(label), err=is_error)
 
 
 def check_project_defopts(config):
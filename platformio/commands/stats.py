@@ -0,0 +1,91 @@
+# Copyright 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from datetime import datetime
+from os import getcwd
+
+import click
+
+from platformio import app
+from platformio.history import BuildHistory, get_environment_stats
+
+
+@click.command("stats", short_help="Build history trends and regressions")
+@click.option("-e", "--environment", multiple=True)
+@click.option(
+    "-d",
+    "--project-dir",
+    default=getcwd,
+    type=click.Path(
+        exists=True, file_okay=False, dir_okay=True, resolve_path=True))
+@click.option("--limit", type=click.IntRange(1), default=100)
+@click.option("--size-threshold", type=click.IntRange(0), default=0)
+@click.option("--json-output", is_flag=True)
+def cli(environment, project_dir, limit, size_threshold, json_output):
+    builds = {}
+    for build in BuildHistory().get_builds(project_dir, environment):
+        builds.setdefault(build['environment'], []).append(build)
+
+    result = {}
+    for name, env_builds in builds.items():
+        env_builds = env_builds[-limit:]
+        result[name] = get_environment_stats(env_builds, size_threshold)
+        result[name]['history'] = env_builds
+
+    if json_output:
+        return click.echo(json.dumps(result))
+
+    if not result:
+        click.secho("Build history of the project is empty", fg="yellow")
+        if not app.get_setting("enable_build_history"):
+            click.echo("Please enable it with `platformio settings set "
+                       "enable_build_history Yes`")
+        return
+
+    for name, stats in sorted(result.items()):
+        _print_environment_stats(name, stats)
+
+
+def _print_environment_stats(name, stats):
+    click.echo()
+    click.echo("Environment %s (%d builds, %d succeeded)" % (click.style(
+        name, fg="cyan", bold=True), stats['builds'], stats['succeeded']))
+    click.echo("-" * 40)
+
+    duration = stats['duration']
+    if duration['last'] is not None:
+        click.echo("Duration:        last %.2f, median %.2f, p90 %.2f, "
+                   "p95 %.2f, max %.2f seconds" %
+                   (duration['last'], duration['p50'], duration['p90'],
+                    duration['p95'], duration['max']))
+    if stats['cache_hit_rate'] is not None:
+        click.echo("Object cache:    %d%% hits, %d objects" %
+                   (stats['cache_hit_rate'] * 100, stats['objects'] or 0))
+    for key, title in (("program_size", "Program size"),
+                       ("data_size", "Data size")):
+        size = stats[key]
+        if size['last'] is None:
+            continue
+        click.echo("%-16s %d bytes (%+d since the first build, min %d, "
+                   "max %d)" % (title + ":", size['last'], size['change'],
+                                size['min'], size['max']))
+
+    if not stats['regressions']:
+        return
+    click.secho("Regressions:", fg="yellow")
+    for item in stats['regressions']:
+        click.echo("  %s  %s" % (datetime.fromtimestamp(
+            item['created']).strftime("%Y-%m-%d %H:%M"),
+                                 ", ".join(item['reasons'])))
@@ -14,17 +14,20 @@
 
 # pylint: disable=R0913,R0914
 
+import threading
 from fnmatch import fnmatch
 from os import getcwd, listdir
-from os.path import isdir, join
-from time import sleep, time
+from os.path import basename, isdir, isfile, join
+from shutil import copy2, rmtree
+from tempfile import mkdtemp
+from time import time
 
 import click
-import serial
 
-from platformio import exception, util
+from platformio import exception, testtransport, util
 from platformio.commands.run import cli as cmd_run
 from platformio.commands.run import check_project_envs, print_header
+from platformio.jobserver import get_total_jobs
 from platformio.managers.platform import PlatformFactory
 
 
@@ -42,9 +45,12 @@ from platformio.managers.platform import PlatformFactory
         dir_okay=True,
         writable=True,
         resolve_path=True))
+@click.option("--batch-build", is_flag=True)
+@click.option("--device-pool", is_flag=True)
 @click.option("--verbose", "-v", is_flag=True)
 @click.pass_context
-def cli(ctx, environment, skip, upload_port, project_dir, verbose):
+def cli(ctx, environment, skip, upload_port, project_dir, batch_build,
+        device_pool, verbose):
     with util.cd(project_dir):
         test_dir = util.get_projecttest_dir()
         if not isdir(test_dir):
@@ -56,35 +62,69 @@ def cli(ctx, environment, skip, upload_port, project_dir, verbose):
     click.echo("Collected %d items" % len(test_names))
     click.echo()
 
+    envnames = []
+    for section in projectconf.sections():
+        if not section.startswith("env:"):
+            continue
+        if environment and section[4:] not in environment:
+            continue
+        envnames.append(section[4:])
+
+    options = {
+        "project_config": projectconf,
+        "project_dir": project_dir,
+        "upload_port": upload_port,
+        "verbose": verbose,
+        # the first test of the batch is linked to the main program
+        "batch_heads": {}
+    }
     start_time = time()
     results = []
+    # the tests which are built already, see `--batch-build`
+    built = set()
+    if batch_build and test_names != ["*"]:
+        for envname in envnames:
+            batch = [n for n in test_names if not is_skipped(n, skip)]
+            if batch and build_batch(ctx, batch, envname, options):
+                built.update([(n, envname) for n in batch])
+                options['batch_heads'][envname] = batch[0]
+
+    jobs = []
     for testname in test_names:
-        for envname in projectconf.sections():
-            if not envname.startswith("env:"):
-                continue
-            envname = envname[4:]
-            if environment and envname not in environment:
-                continue
+        for envname in envnames:
+            if is_skipped(testname, skip):
+                results.append((None, testname, envname, None, 0))
+            else:
+                jobs.append((testname, envname))
 
-            # check skip patterns
-            if testname != "*" and any([fnmatch(testname, p) for p in skip]):
-                results.append((None, testname, envname))
-                continue
+    if device_pool:
+        results.extend(process_device_pool(ctx, jobs, built, options))
+    elif batch_build:
+        # the environments are built one by one, test them in this order
+        for envname in envnames:
+            for testname, _ in [j for j in jobs if j[1] == envname]:
+                results.append(
+                    _process_test(ctx, testname, envname, options,
+                                  (testname, envname) not in built))
+    else:
+        for testname, envname in jobs:
+            results.append(
+                _process_test(ctx, testname, envname, options, True))
 
-            tp = TestProcessor(ctx, testname, envname, {
-                "project_config": projectconf,
-                "project_dir": project_dir,
-                "upload_port": upload_port,
-                "verbose": verbose
-            })
-            results.append((tp.process(), testname, envname))
+    order = [(t, e) for t in test_names for e in envnames]
+    results.sort(key=lambda r: order.index((r[1], r[2])))
+    print_test_summary(results, start_time)
+
+    if not all([r[0] is not False for r in results]):
+        raise exception.ReturnErrorCode()
 
+
+def print_test_summary(results, start_time):
     click.echo()
     print_header("[%s]" % click.style("TEST SUMMARY"))
 
     passed = True
-    for result in results:
-        status, testname, envname = result
+    for status, testname, envname, port, duration in results:
         status_str = click.style("PASSED", fg="green")
         if status is False:
             passed = False
@@ -92,10 +132,15 @@ def cli(ctx, environment, skip, upload_port, project_dir, verbose):
         elif status is None:
             status_str = click.style("IGNORED", fg="yellow")
 
+        details = ""
+        if status is not None:
+            details = "\t%.2f seconds" % duration
+            if port:
+                details = "\t%s%s" % (port, details)
         click.echo(
-            "test:%s/env:%s\t%s" % (click.style(
+            "test:%s/env:%s\t%s%s" % (click.style(
                 testname, fg="yellow"), click.style(
-                    envname, fg="cyan"), status_str),
+                    envname, fg="cyan"), status_str, details),
             err=status is False)
 
     print_header(
@@ -104,106 +149,321 @@ def cli(ctx, environment, skip, upload_port, project_dir, verbose):
                 "FAILED", fg="red", bold=True)), time() - start_time),
         is_error=not passed)
 
-    if not passed:
-        raise exception.ReturnErrorCode()
+
+def is_skipped(testname, patterns):
+    return testname != "*" and any([fnmatch(testname, p) for p in patterns])
+
+
+def build_batch(ctx, test_names, envname, options):
+    """Build all tests of the environment at once.
+
+    Returns False when the batch could not be built, then each test is
+    built separately to find the failed tests.
+    """
+    print_header("[env:%s] Building %d tests..." % (click.style(
+        envname, fg="cyan", bold=True), len(test_names)))
+    click.echo()
+    ctx.meta['piotest_processor'] = True
+    ctx.meta['piotest'] = ",".join(test_names)
+    try:
+        ctx.invoke(
+            cmd_run,
+            project_dir=options['project_dir'],
+            verbose=options['verbose'],
+            environment=[envname],
+            target=["test"])
+    except exception.ReturnErrorCode:
+        click.secho(
+            "Could not build the tests at once, processing them "
+            "separately...", fg="yellow")
+        click.echo()
+        return False
+    return True
+
+
+def process_device_pool(ctx, jobs, built, options):
+    """Run the tests concurrently on all attached boards.
+
+    Each board takes the next test of its environment when it is free, so
+    the faster boards process more tests. The build system and the upload
+    are not concurrent (see `TestProcessor.BUILD_LOCK`), the boards run
+    the uploaded tests in parallel. The tests which are run on the host
+    machine (see `test_transport` option) use one slot per CPU instead.
+    """
+    ports = {}
+    for envname in set([j[1] for j in jobs]):
+        tp = TestProcessor(ctx, None, envname, options)
+        ports[envname] = tp.get_serial_ports()
+    devices = sorted(set(sum(ports.values(), [])))
+    click.echo("Device pool: %s" % ", ".join(
+        ["%s (%s)" % (port, ", ".join(sorted(
+            [e for e, p in ports.items() if port in p]))) for port in devices
+         ]))
+    click.echo()
+
+    queue = list(jobs)
+    results = []
+    lock = threading.Lock()
+
+    def _worker(port):
+        while True:
+            with lock:
+                job = None
+                for item in queue:
+                    if port in ports[item[1]]:
+                        job = item
+                        break
+                if not job:
+                    return
+                queue.remove(job)
+            testname, envname = job
+            results.append(
+                _process_test(ctx, testname, envname,
+                              dict(options, upload_port=port),
+                              job not in built, device=port))
+
+    workers = []
+    for port in devices:
+        t = threading.Thread(target=_worker, args=(port, ))
+        t.daemon = True
+        t.start()
+        workers.append(t)
+    for t in workers:
+        # join with timeout, allow to abort processing with Ctrl+C
+        while t.is_alive():
+            t.join(0.2)
+    return results
+
+
+def _process_test(  # pylint: disable=too-many-arguments
+        ctx, testname, envname, options, build, device=None):
+    start_time = time()
+    tp = TestProcessor(ctx, testname, envname, options, device)
+    try:
+        status = tp.process(build=build)
+    except exception.ReturnErrorCode:
+        if not device:
+            raise
+        status = False
+    except Exception as e:  # pylint: disable=broad-except
+        if not device:
+            raise
+        tp.echo("Error: %s" % e, err=True, fg="red")
+        status = False
+    return (status, testname, envname, device, time() - start_time)
 
 
 class TestProcessor(object):
 
-    SERIAL_TIMEOUT = 600
-    SERIAL_BAUDRATE = 9600
+    # seconds, see `test_timeout` option
+    TEST_TIMEOUT = 600
 
-    def __init__(self, cmd_ctx, testname, envname, options):
+    # the names of the program which is built for the host machine
+    HOST_PROGRAM_NAMES = ("program", "program.exe", "firmware", "firmware.exe")
+
+    # the build system and the upload run one at a time, they use
+    # the same build directory and the working directory of the process
+    BUILD_LOCK = threading.RLock()
+    ECHO_LOCK = threading.Lock()
+
+    def __init__(self, cmd_ctx, testname, envname, options, device=None):
         self.cmd_ctx = cmd_ctx
         self.cmd_ctx.meta['piotest_processor'] = True
         self.test_name = testname
         self.env_name = envname
         self.options = options
+        # the output is prefixed with the port when the tests are
+        # processed concurrently
+        self.device = device
 
-    def process(self):
-        self._progress("Building... (1/3)")
-        self._build_or_upload(["test"])
+    def process(self, build=True):
+        if self.is_host_test():
+            return self._process_host_test(build)
+        if build:
+            self._progress("Building... (1/3)")
+            self._build_or_upload(["test"])
         self._progress("Uploading... (2/3)")
         self._build_or_upload(["test", "upload"])
         self._progress("Testing... (3/3)")
-        sleep(1.0)  # wait while board is starting...
-        return self._run_hardware_test()
+        name = self.get_transport_name()
+        with testtransport.get_transport(
+                name,
+                serial_port=(self.get_serial_port()
+                             if name == "serial" else None)) as transport:
+            self.echo("If you don't see any output for the first 10 secs, "
+                      "please reset board (press reset button)")
+            return self._run_test(transport)
+
+    def _process_host_test(self, build):
+        """Run the program, which is built for the host machine.
+
+        The program is copied while the build system is locked, the next
+        test can be built while this one is running.
+        """
+        tmp_dir = mkdtemp()
+        try:
+            with self.BUILD_LOCK:
+                if build:
+                    self._progress("Building... (1/2)")
+                    self._build_or_upload(["test"])
+                program = self._get_host_program(build)
+                if not program:
+                    raise exception.PlatformioException(
+                        "Could not find the test program of `%s` environment"
+                        % self.env_name)
+                copy2(program, tmp_dir)
+                program = join(tmp_dir, basename(program))
+            self._progress("Testing... (2/2)")
+            with testtransport.get_transport(
+                    self.get_transport_name(), program=program) as transport:
+                return self._run_test(transport)
+        finally:
+            rmtree(tmp_dir, ignore_errors=True)
+
+    def _get_host_program(self, build):
+        with util.cd(self.options['project_dir']):
+            program_dir = join(util.get_projectpioenvs_dir(), self.env_name)
+        # the rest tests of `--batch-build` are linked to the own
+        # directories, see `BuildTestPrograms`
+        batch_head = self.options.get("batch_heads", {}).get(self.env_name)
+        if not build and batch_head not in (None, self.test_name):
+            program_dir = join(program_dir, "test", self.test_name)
+        for name in self.HOST_PROGRAM_NAMES:
+            if isfile(join(program_dir, name)):
+                return join(program_dir, name)
+        return None
+
+    def is_host_test(self):
+        return self.get_transport_name() in testtransport.HOST_TRANSPORTS
+
+    def get_transport_name(self):
+        return self._get_envdata().get("test_transport", "serial").strip()
+
+    def echo(self, message, **kwargs):
+        if self.device:
+            message = "[%s] %s" % (self.device, message)
+        with self.ECHO_LOCK:
+            click.secho(message, **kwargs)
 
     def _progress(self, text, is_error=False):
-        print_header(
-            "[test::%s] %s" % (click.style(
-                self.test_name, fg="yellow", bold=True), text),
-            is_error=is_error)
-        click.echo()
+        label = "[test::%s] %s" % (click.style(
+            self.test_name, fg="yellow", bold=True), text)
+        if self.device:
+            label = "%s on %s (env:%s)" % (label, self.device, self.env_name)
+        with self.ECHO_LOCK:
+            print_header(label, is_error=is_error)
+            click.echo()
 
     def _build_or_upload(self, target):
-        if self.test_name != "*":
-            self.cmd_ctx.meta['piotest'] = self.test_name
-        return self.cmd_ctx.invoke(
-            cmd_run,
-            project_dir=self.options['project_dir'],
-            upload_port=self.options['upload_port'],
-            verbose=self.options['verbose'],
-            environment=[self.env_name],
-            target=target)
-
-    def _run_hardware_test(self):
-        click.echo("If you don't see any output for the first 10 secs, "
-                   "please reset board (press reset button)")
-        click.echo()
-        ser = serial.Serial(
-            self.get_serial_port(),
-            self.SERIAL_BAUDRATE,
-            timeout=self.SERIAL_TIMEOUT)
+        with self.BUILD_LOCK:
+            self.cmd_ctx.meta.pop("piotest", None)
+            if self.test_name != "*":
+                self.cmd_ctx.meta['piotest'] = self.test_name
+            return self.cmd_ctx.invoke(
+                cmd_run,
+                project_dir=self.options['project_dir'],
+                upload_port=(None if self.is_host_test() else
+                             self.options['upload_port']),
+                verbose=self.options['verbose'],
+                environment=[self.env_name],
+                target=target)
+
+    def _run_test(self, transport):
         passed = True
+        timeout = int(self._get_envdata().get("test_timeout",
+                                              self.TEST_TIMEOUT))
+        deadline = time() + timeout
         while True:
-            line = ser.readline().strip()
+            if time() > deadline:
+                # the transport stops the program which is hanging
+                self.echo(
+                    "Error: the test has not finished in %d seconds" % timeout,
+                    err=True,
+                    fg="red")
+                return False
+            line = transport.readline()
+            if line is None:
+                # the output is finished before the summary of Unity
+                self.echo(
+                    "Error: the test program has exited without the result",
+                    err=True,
+                    fg="red")
+                return False
+            line = line.strip()
             if not line:
                 continue
             if line.endswith(":PASS"):
-                click.echo("%s\t%s" % (line[:-5], click.style(
+                self.echo("%s\t%s" % (line[:-5], click.style(
                     "PASSED", fg="green")))
             elif ":FAIL:" in line:
                 passed = False
-                click.echo("%s\t%s" % (line, click.style("FAILED", fg="red")))
+                self.echo("%s\t%s" % (line, click.style("FAILED", fg="red")))
             else:
-                click.echo(line)
+                self.echo(line)
             if all([l in line for l in ("Tests", "Failures", "Ignored")]):
                 break
-        ser.close()
         return passed
 
     def get_serial_port(self):
-        config = self.options['project_config']
-        envdata = {}
-        for k, v in config.items("env:" + self.env_name):
-            envdata[k] = v
+        envdata = self._get_envdata()
 
         # if upload port is specified manually
         if self.options.get("upload_port", envdata.get("upload_port")):
             return self.options.get("upload_port", envdata.get("upload_port"))
 
-        p = PlatformFactory.newPlatform(envdata['platform'])
-        bconfig = p.board_config(envdata['board'])
-
+        board_hwids = self._get_board_hwids(envdata)
         port = None
-        board_hwids = []
-        if "build.hwids" in bconfig:
-            board_hwids = bconfig.get("build.hwids")
         for item in util.get_serialports():
             if "VID:PID" not in item['hwid']:
                 continue
             port = item['port']
-            for hwid in board_hwids:
-                hwid_str = ("%s:%s" % (hwid[0], hwid[1])).replace("0x", "")
-                if hwid_str in item['hwid']:
-                    return port
+            if _match_hwids(item['hwid'], board_hwids):
+                return port
         if not port:
             raise exception.PlatformioException(
                 "Please specify `upload_port` for environment or use "
                 "global `--upload-port` option.")
         return port
 
+    def get_serial_ports(self):
+        """The ports of all attached boards of the environment."""
+        if self.is_host_test():
+            return ["host:%d" % i for i in range(get_total_jobs())]
+        envdata = self._get_envdata()
+        if self.options.get("upload_port", envdata.get("upload_port")):
+            return [self.get_serial_port()]
+        board_hwids = self._get_board_hwids(envdata)
+        ports = [
+            item['port'] for item in util.get_serialports()
+            if _match_hwids(item['hwid'], board_hwids)
+        ]
+        return ports or [self.get_serial_port()]
+
+    def _get_envdata(self):
+        envdata = {}
+        for k, v in self.options['project_config'].items(
+                "env:" + self.env_name):
+            envdata[k] = v
+        return envdata
+
+    @staticmethod
+    def _get_board_hwids(envdata):
+        p = PlatformFactory.newPlatform(envdata['platform'])
+        bconfig = p.board_config(envdata['board'])
+        if "build.hwids" in bconfig:
+            return bconfig.get("build.hwids")
+        return []
+
+
+def _match_hwids(port_hwid, board_hwids):
+    if "VID:PID" not in port_hwid:
+        return False
+    for hwid in board_hwids:
+        hwid_str = ("%s:%s" % (hwid[0], hwid[1])).replace("0x", "")
+        if hwid_str in port_hwid:
+            return True
+    return False
+
 
 def get_test_names(test_dir):
     names = []
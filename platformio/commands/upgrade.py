@@ -17,7 +17,6 @@ import re
 import sys
 
 import click
-import requests
 
 from platformio import VERSION, __version__, exception, util
 
@@ -100,10 +99,12 @@ def get_latest_version():
 
 
 def get_develop_latest_version():
+    import requests
     version = None
     r = requests.get("https://raw.githubusercontent.com/platformio/platformio"
                      "/develop/platformio/__init__.py",
-                     headers=util.get_request_defheaders())
+                     headers=util.get_request_defheaders(),
+                     timeout=10)
     r.raise_for_status()
     for line in r.text.split("\n"):
         line = line.strip()
@@ -121,7 +122,9 @@ def get_develop_latest_version():
 
 
 def get_pypi_latest_version():
+    import requests
     r = requests.get("https://pypi.python.org/pypi/platformio/json",
-                     headers=util.get_request_defheaders())
+                     headers=util.get_request_defheaders(),
+                     timeout=10)
     r.raise_for_status()
     return r.json()['info']['version']
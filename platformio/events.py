@@ -0,0 +1,88 @@
+# Copyright 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import re
+import sys
+from threading import Lock
+from time import time
+
+# the events of the build system are passed through its output
+BUILD_EVENT_PREFIX = "PIOEVENT:"
+
+DIAGNOSTIC_RE = re.compile(
+    r"^(?P<file>(?:[a-zA-Z]:)?[^:]+):(?P<line>\d+):(?:(?P<column>\d+):)?"
+    r"\s*(?P<severity>fatal error|error|warning|note):\s*(?P<message>.*)$")
+
+
+class EventStream(object):
+    """Newline-delimited JSON events, one event per line.
+
+    The regular output is redirected to ``stderr`` while the stream is
+    active, so ``stdout`` contains only the events.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self._lock = Lock()
+        self._stdout = None
+
+    def __enter__(self):
+        self._stdout = sys.stdout
+        sys.stdout = sys.stderr
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        sys.stdout = self._stdout
+
+    def emit(self, event, **data):
+        data['event'] = event
+        data['time'] = time()
+        line = json.dumps(data)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+    def emit_build_line(self, env_name, line, err=False):
+        """Emit the event or the compiler diagnostic from the output line.
+
+        Returns True when the line is the event of the build system, such
+        lines are not printed.
+        """
+        if line.startswith(BUILD_EVENT_PREFIX):
+            try:
+                data = json.loads(line[len(BUILD_EVENT_PREFIX):])
+            except ValueError:
+                return False
+            self.emit(data.pop("event"), env=env_name, **data)
+            return True
+        # compilers report the diagnostics to stderr
+        diagnostic = parse_diagnostic(line) if err else None
+        if diagnostic:
+            self.emit("diagnostic", env=env_name, **diagnostic)
+        return False
+
+
+def parse_diagnostic(line):
+    """Parse GCC-style ``file:line:column: severity: message`` line."""
+    match = DIAGNOSTIC_RE.match(line)
+    if not match:
+        return None
+    result = match.groupdict()
+    result['line'] = int(result['line'])
+    if result['column']:
+        result['column'] = int(result['column'])
+    if result['severity'] == "fatal error":
+        result['severity'] = "error"
+    return result
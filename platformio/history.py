@@ -0,0 +1,188 @@
+# Copyright 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sqlite3
+from math import ceil
+from os.path import join
+from time import time
+
+from platformio import __version__, util
+
+FIELDS = ("created", "project_dir", "environment", "platform", "targets",
+          "version", "duration", "succeeded", "objects_total",
+          "objects_built", "program_size", "data_size")
+
+
+class BuildHistory(object):
+    """Local database of the processed environments.
+
+    A record is created by ``platformio run`` before the build system is
+    launched, the build system updates it with the number of the objects and
+    the size of the program.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS builds (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created REAL NOT NULL,
+        project_dir TEXT NOT NULL,
+        environment TEXT NOT NULL,
+        platform TEXT,
+        targets TEXT,
+        version TEXT,
+        duration REAL,
+        succeeded INTEGER,
+        objects_total INTEGER,
+        objects_built INTEGER,
+        program_size INTEGER,
+        data_size INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS builds_environment
+        ON builds (project_dir, environment, created);
+    """
+
+    def __init__(self, path=None):
+        self.path = path or join(util.get_home_dir(), "history.db")
+
+    def _connect(self):
+        # concurrent environments and build systems wait for each other
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.executescript(self.SCHEMA)
+        return conn
+
+    def add(self, project_dir, environment, platform=None, targets=None):
+        conn = self._connect()
+        try:
+            with conn:
+                cursor = conn.execute(
+                    "INSERT INTO builds (created, project_dir, environment, "
+                    "platform, targets, version) VALUES (?, ?, ?, ?, ?, ?)",
+                    (time(), project_dir, environment, platform,
+                     " ".join(targets or []), __version__))
+            return cursor.lastrowid
+        finally:
+            conn.close()
+
+    def update(self, build_id, **fields):
+        assert set(fields.keys()) <= set(FIELDS)
+        if not fields:
+            return
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "UPDATE builds SET %s WHERE id = ?" % ", ".join(
+                        ["%s = ?" % k for k in fields.keys()]),
+                    fields.values() + [build_id])
+        finally:
+            conn.close()
+
+    def get_builds(self, project_dir=None, environments=None, limit=None):
+        """Return the builds in chronological order, the latest are kept."""
+        query = "SELECT * FROM builds"
+        conditions = []
+        params = []
+        if project_dir:
+            conditions.append("project_dir = ?")
+            params.append(project_dir)
+        if environments:
+            conditions.append("environment IN (%s)" % ", ".join(
+                ["?"] * len(environments)))
+            params.extend(environments)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY created DESC"
+        if limit:
+            query += " LIMIT %d" % int(limit)
+        conn = self._connect()
+        try:
+            rows = [dict(row) for row in conn.execute(query, params)]
+        finally:
+            conn.close()
+        return list(reversed(rows))
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of the values, None for empty list."""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = int(ceil(percent / 100.0 * len(values)))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+def get_environment_stats(builds, size_threshold=0, duration_factor=1.5):
+    """Trends and regressions of the builds of one environment.
+
+    A regression is a successful build whose program or data size grew by
+    more than ``size_threshold`` bytes in comparison with the previous
+    successful build, or which took ``duration_factor`` times longer than
+    the median duration.
+    """
+    succeeded = [b for b in builds if b['succeeded']]
+    durations = [b['duration'] for b in succeeded if b['duration']]
+    median = percentile(durations, 50)
+    objects_total = sum([b['objects_total'] or 0 for b in succeeded])
+    objects_built = sum([b['objects_built'] or 0 for b in succeeded])
+
+    regressions = []
+    previous = None
+    for build in succeeded:
+        reasons = []
+        for key in ("program_size", "data_size"):
+            if (previous and build[key] is not None and
+                    previous[key] is not None and
+                    build[key] - previous[key] > size_threshold):
+                reasons.append("%s +%d bytes" % (key.replace("_", " "),
+                                                 build[key] - previous[key]))
+        if (median and build['duration'] and
+                build['duration'] > median * duration_factor):
+            reasons.append("duration %.2f seconds (median %.2f)" %
+                           (build['duration'], median))
+        if reasons:
+            regressions.append({"id": build['id'],
+                                "created": build['created'],
+                                "reasons": reasons})
+        if build['program_size'] is not None:
+            previous = build
+
+    last = succeeded[-1] if succeeded else {}
+    return {
+        "builds": len(builds),
+        "succeeded": len(succeeded),
+        "duration": {
+            "last": last.get("duration"),
+            "p50": median,
+            "p90": percentile(durations, 90),
+            "p95": percentile(durations, 95),
+            "max": max(durations) if durations else None
+        },
+        "cache_hit_rate": (1 - float(objects_built) / objects_total
+                           if objects_total else None),
+        "objects": last.get("objects_total"),
+        "program_size": _get_size_trend(succeeded, "program_size"),
+        "data_size": _get_size_trend(succeeded, "data_size"),
+        "regressions": regressions
+    }
+
+
+def _get_size_trend(builds, key):
+    values = [b[key] for b in builds if b[key] is not None]
+    if not values:
+        return {"last": None, "change": None, "min": None, "max": None}
+    return {"last": values[-1],
+            "change": values[-1] - values[0],
+            "min": min(values),
+            "max": max(values)}
@@ -19,8 +19,6 @@ import sys
 from os.path import (abspath, basename, expanduser, isdir, isfile, join,
                      normpath, relpath)
 
-import bottle
-
 from platformio import app, exception, util
 
 
@@ -63,23 +61,7 @@ class ProjectGenerator(object):
         envdata = self.get_project_env()
         if "env_name" not in envdata:
             return data
-        cmd = [normpath(sys.executable), "-m", "platformio", "-f"]
-        if app.get_session_var("caller_id"):
-            cmd.extend(["-c", app.get_session_var("caller_id")])
-        cmd.extend(["run", "-t", "idedata", "-e", envdata['env_name']])
-        cmd.extend(["-d", self.project_dir])
-        result = util.exec_command(cmd)
-
-        if result['returncode'] != 0 or '"includes":' not in result['out']:
-            raise exception.PlatformioException("\n".join([result['out'],
-                                                           result['err']]))
-
-        output = result['out']
-        start_index = output.index('{"')
-        stop_index = output.rindex('}')
-        data = json.loads(output[start_index:stop_index + 1])
-
-        return data
+        return get_idedata(self.project_dir, envdata['env_name'])
 
     def get_project_name(self):
         return basename(self.project_dir)
@@ -119,6 +101,8 @@ class ProjectGenerator(object):
                 self._render_tpl(tpl_path).encode("utf8"))
 
     def _render_tpl(self, tpl_path):
+        # the template engine is loaded only when a project is generated
+        import bottle
         content = ""
         with open(tpl_path) as f:
             content = f.read()
@@ -161,3 +145,29 @@ class ProjectGenerator(object):
     def _fix_os_path(path):
         return (re.sub(r"[\\]+", '\\' * 4, path)
                 if "windows" in util.get_systype() else path)
+
+
+def get_idedata(project_dir, env_name):
+    # "run" command imports telemetry which depends on this module
+    from platformio.commands.run import load_cached_idedata
+
+    with util.cd(project_dir):
+        data = load_cached_idedata(env_name)
+    if data:
+        return data
+
+    cmd = [normpath(sys.executable), "-m", "platformio", "-f"]
+    if app.get_session_var("caller_id"):
+        cmd.extend(["-c", app.get_session_var("caller_id")])
+    cmd.extend(["run", "-t", "idedata", "-e", env_name])
+    cmd.extend(["-d", project_dir])
+    result = util.exec_command(cmd)
+
+    if result['returncode'] != 0 or '"includes":' not in result['out']:
+        raise exception.PlatformioException("\n".join([result['out'],
+                                                       result['err']]))
+
+    output = result['out']
+    start_index = output.index('{"')
+    stop_index = output.rindex('}')
+    return json.loads(output[start_index:stop_index + 1])
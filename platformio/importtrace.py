@@ -0,0 +1,80 @@
+# Copyright 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import __builtin__
+import atexit
+import sys
+from time import time
+
+
+class ImportTracer(object):
+    """Measure the time of the module imports.
+
+    Enabled by ``PLATFORMIO_TRACE_IMPORTS`` environment variable, the
+    slowest imports are printed to ``stderr`` at exit. The cumulative time
+    includes the nested imports, the self time does not.
+    """
+
+    def __init__(self, limit=30):
+        self.limit = limit
+        self.records = []
+        self._start_time = None
+        self._preloaded = 0
+        self._import = None
+        self._children = []
+
+    def install(self):
+        self._start_time = time()
+        self._preloaded = len([m for m in sys.modules.values() if m])
+        self._import = __builtin__.__import__
+        __builtin__.__import__ = self._traced_import
+        atexit.register(self.report)
+
+    def uninstall(self):
+        if self._import:
+            __builtin__.__import__ = self._import
+            self._import = None
+
+    def _traced_import(self, name, globals_=None, locals_=None,
+                       fromlist=None, level=-1):
+        if name in sys.modules:
+            return self._import(name, globals_, locals_, fromlist, level)
+        start = time()
+        self._children.append(0)
+        try:
+            return self._import(name, globals_, locals_, fromlist, level)
+        finally:
+            elapsed = time() - start
+            nested = self._children.pop()
+            if self._children:
+                self._children[-1] += elapsed
+            importer = (globals_ or {}).get("__name__", "")
+            self.records.append((name or ", ".join(fromlist or []),
+                                 importer, elapsed, elapsed - nested,
+                                 len(self._children)))
+
+    def report(self, stream=None):
+        self.uninstall()
+        stream = stream or sys.stderr
+        stream.write("\nImports: %d modules were loaded before tracing, "
+                     "%d imports took %.3f seconds of %.3f seconds\n" %
+                     (self._preloaded, len(self.records),
+                      sum([r[2] for r in self.records if r[4] == 0]),
+                      time() - self._start_time))
+        stream.write("%10s %10s  %s\n" %
+                     ("cumulative", "self", "module (imported by)"))
+        for name, importer, cumulative, self_time, _ in sorted(
+                self.records, key=lambda r: r[2], reverse=True)[:self.limit]:
+            stream.write("%10.4f %10.4f  %s (%s)\n" % (cumulative, self_time,
+                                                       name, importer))
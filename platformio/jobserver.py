@@ -0,0 +1,196 @@
+# Copyright 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+import select
+from multiprocessing import cpu_count
+from os.path import isdir, join
+from time import sleep, time
+
+from platformio import app, util
+
+# pylint: disable=wrong-import-order
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# the descriptors of GNU make jobserver's named pipes by path
+_FIFO_FDS = {}
+
+
+def get_total_jobs():
+    jobs = int(app.get_setting("build_jobs"))
+    if jobs > 0:
+        return jobs
+    try:
+        return cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+class JobTokens(object):
+
+    def __init__(self, implicit=False):
+        # a child of GNU make or PlatformIO owns one token implicitly
+        self.implicit = implicit
+        self.wait_time = 0
+        self._slots = []
+        self._make_tokens = []
+        self._make_fds = None
+        self._child_fds = None
+
+    def __len__(self):
+        return (int(self.implicit) + len(self._slots) +
+                len(self._make_tokens))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        self.release()
+
+    def add_slot(self, fp):
+        self._slots.append(fp)
+
+    def add_make_token(self, fds, token):
+        self._make_fds = fds
+        self._make_tokens.append(token)
+
+    def get_child_env(self, env=None):
+        """Export GNU make jobserver for the nested processes.
+
+        All acquired tokens are used by the build system, so the pipe is
+        empty and every nested PlatformIO or GNU make process works within
+        its implicit token.
+        """
+        env = dict(env or os.environ)
+        if "MAKEFLAGS" in env and parse_makeflags(env['MAKEFLAGS']):
+            return env
+        if fcntl and not self._child_fds:
+            self._child_fds = os.pipe()
+        if self._child_fds:
+            env['MAKEFLAGS'] = "-j%d --jobserver-fds=%d,%d" % (
+                len(self), self._child_fds[0], self._child_fds[1])
+        return env
+
+    def release(self):
+        for fp in self._slots:
+            util.unlock_file(fp)
+            fp.close()
+        self._slots = []
+        if self._make_fds:
+            for token in self._make_tokens:
+                os.write(self._make_fds[1], token)
+        self._make_tokens = []
+        if self._child_fds:
+            for fd in self._child_fds:
+                os.close(fd)
+            self._child_fds = None
+
+
+class JobServer(object):
+    """Pool of build job tokens shared by all PlatformIO processes.
+
+    Each token is an advisory lock on the slot file in PlatformIO home
+    directory, so tokens of a crashed process are released by OS. When
+    PlatformIO is launched by GNU make (or by another PlatformIO build) the
+    tokens are requested from the parent jobserver instead.
+    """
+
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, jobs=None, tokens_dir=None, makeflags=None):
+        self.jobs = jobs or get_total_jobs()
+        self.tokens_dir = tokens_dir or join(util.get_home_dir(),
+                                             ".jobserver")
+        if makeflags is None:
+            makeflags = os.getenv("MAKEFLAGS", "")
+        self._make_fds = parse_makeflags(makeflags)
+
+    def acquire(self, max_jobs=None):
+        max_jobs = min(max_jobs or self.jobs, self.jobs)
+        if self._make_fds:
+            return self._acquire_from_make(max_jobs)
+
+        if not isdir(self.tokens_dir):
+            try:
+                os.makedirs(self.tokens_dir)
+            except OSError:
+                pass
+
+        tokens = JobTokens()
+        start_time = time()
+        while not len(tokens):
+            self._lock_free_slots(tokens, 1)
+            if not len(tokens):
+                sleep(self.POLL_INTERVAL)
+        tokens.wait_time = time() - start_time
+        self._lock_free_slots(tokens, max_jobs - 1)
+        return tokens
+
+    def _lock_free_slots(self, tokens, nums):
+        for index in range(self.jobs):
+            if nums <= 0:
+                break
+            fp = open(join(self.tokens_dir, "slot-%d.lock" % index), "a")
+            if util.lock_file(fp, blocking=False):
+                tokens.add_slot(fp)
+                nums -= 1
+            else:
+                fp.close()
+
+    def _acquire_from_make(self, max_jobs):
+        tokens = JobTokens(implicit=True)
+        while len(tokens) < max_jobs:
+            try:
+                readable, _, _ = select.select([self._make_fds[0]], [], [], 0)
+            except (select.error, ValueError):
+                break
+            if not readable:
+                break
+            token = os.read(self._make_fds[0], 1)
+            if not token:
+                break
+            tokens.add_make_token(self._make_fds, token)
+        return tokens
+
+
+def parse_makeflags(makeflags):
+    if not makeflags:
+        return None
+    match = re.search(r"--jobserver-(?:auth|fds)=(\d+),(\d+)", makeflags)
+    if match:
+        fds = (int(match.group(1)), int(match.group(2)))
+        try:
+            for fd in fds:
+                os.fstat(fd)
+        except OSError:
+            # jobserver's file descriptors were not inherited
+            return None
+        return fds
+    match = re.search(r"--jobserver-auth=fifo:(\S+)", makeflags)
+    if match:
+        # the fifo is opened once per process and is reused by the
+        # jobservers and the checks of `JobTokens.get_child_env`
+        path = match.group(1)
+        if path not in _FIFO_FDS:
+            try:
+                _FIFO_FDS[path] = os.open(path, os.O_RDWR)
+            except OSError:
+                return None
+        return (_FIFO_FDS[path], _FIFO_FDS[path])
+    return None
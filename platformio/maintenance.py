@@ -16,19 +16,27 @@ import json
 import os
 from os import getenv
 from os.path import isdir, join
+from threading import Timer
 from time import time
 
 import click
 import semantic_version
 
 from platformio import __version__, app, exception, telemetry, util
-from platformio.commands.lib import lib_update as cmd_lib_update
-from platformio.commands.platform import \
-    platform_install as cmd_platform_install
-from platformio.commands.platform import platform_update as cmd_platform_update
-from platformio.commands.upgrade import get_latest_version
-from platformio.managers.lib import LibraryManager
-from platformio.managers.platform import PlatformManager
+
+# the commands and the managers are imported on demand, the most of the runs
+# do not need them and they slow down the start of CLI
+
+# the checks for the updates run in the background process, the results are
+# shown by the next command
+UPDATE_CHECKS = (("platformio_upgrade", "check_platformio_interval"),
+                 ("platforms_update", "check_platforms_interval"),
+                 ("libraries_update", "check_libraries_interval"))
+# the background process is killed after this time (seconds)
+UPDATE_CHECKS_TIMEOUT = 60
+# the checks are paused after the failure (seconds), the pause is doubled
+# after each next failure
+UPDATE_CHECKS_RETRY_DELAY = 3600
 
 
 def in_silence(ctx):
@@ -46,20 +54,16 @@ def on_platformio_start(ctx, force, caller):
     if not in_silence(ctx):
         after_upgrade(ctx)
 
+    # the build processes read the settings from the state file
+    app.flush_state()
+
 
 def on_platformio_end(ctx, result):  # pylint: disable=W0613
     if in_silence(ctx):
         return
 
-    try:
-        check_platformio_upgrade()
-        check_internal_updates(ctx, "platforms")
-        check_internal_updates(ctx, "libraries")
-    except (exception.GetLatestVersionError, exception.APIRequestError):
-        click.secho(
-            "Failed to check for PlatformIO upgrades. "
-            "Please check your Internet connection.",
-            fg="red")
+    show_update_checks(ctx)
+    schedule_update_checks()
 
 
 def on_platformio_exception(e):
@@ -108,6 +112,8 @@ class Upgrader(object):
         # re-install PlatformIO 2.0 development platforms
         installed_platforms = app.get_state_item("installed_platforms", [])
         if installed_platforms:
+            from platformio.commands.platform import \
+                platform_install as cmd_platform_install
             ctx.invoke(cmd_platform_install, platforms=installed_platforms)
 
         return True
@@ -128,6 +134,7 @@ def after_upgrade(ctx):
             app.set_state_item("last_version", __version__)
 
             # patch development platforms
+            from platformio.managers.platform import PlatformManager
             pm = PlatformManager()
             for manifest in pm.get_installed():
                 pm.update(manifest['name'], "^" + manifest['version'])
@@ -171,21 +178,116 @@ def after_upgrade(ctx):
     click.echo("")
 
 
-def check_platformio_upgrade():
+def schedule_update_checks():
+    results = app.get_state_item("update_checks", {})
+    if results.get("retry_after", 0) > time():
+        return
     last_check = app.get_state_item("last_check", {})
-    interval = int(app.get_setting("check_platformio_interval")) * 3600 * 24
-    if (time() - interval) < last_check.get("platformio_upgrade", 0):
+    names = []
+    for name, interval_setting in UPDATE_CHECKS:
+        interval = int(app.get_setting(interval_setting)) * 3600 * 24
+        if (time() - interval) < last_check.get(name, 0):
+            continue
+        last_check[name] = int(time())
+        names.append(name)
+    if not names:
         return
-
-    last_check['platformio_upgrade'] = int(time())
     app.set_state_item("last_check", last_check)
+    app.flush_state()
+    util.launch_detached(
+        "import sys; from platformio.maintenance import run_update_checks; "
+        "run_update_checks(sys.argv[1:])", names)
+
+
+def run_update_checks(names):
+    watchdog = Timer(UPDATE_CHECKS_TIMEOUT, os._exit, [1])
+    watchdog.daemon = True
+    watchdog.start()
+    try:
+        _run_update_checks(names)
+    finally:
+        watchdog.cancel()
+
+
+def _run_update_checks(names):
+    with open(join(util.get_home_dir(), "update_checks.lock"), "w") as fp:
+        if not util.lock_file(fp, blocking=False):
+            return
+        results = app.get_state_item("update_checks", {})
+        # the process which was killed by the watchdog is failed too
+        failures = results.get("failures", 0) + 1
+        results.update({
+            "failures": failures,
+            "retry_after": time() + UPDATE_CHECKS_RETRY_DELAY * 2 ** min(
+                failures - 1, 6)
+        })
+        app.set_state_item("update_checks", results)
+        app.flush_state()
+
+        failed = []
+        for name in names:
+            try:
+                if name == "platformio_upgrade":
+                    from platformio.commands.upgrade import \
+                        get_latest_version
+                    results[name] = {"latest_version": get_latest_version()}
+                else:
+                    results[name] = {
+                        "outdated": get_outdated_items(name.split("_")[0])
+                    }
+            except Exception:  # pylint: disable=broad-except
+                failed.append(name)
+        if failed:
+            # retry the failed checks when the pause is over
+            last_check = app.get_state_item("last_check", {})
+            for name in failed:
+                last_check.pop(name, None)
+            app.set_state_item("last_check", last_check)
+        else:
+            del results['retry_after']
+            results['failures'] = 0
+        app.set_state_item("update_checks", results)
+        app.flush_state()
+
+
+def get_outdated_items(what):
+    if what == "platforms":
+        from platformio.managers.platform import PlatformManager as Manager
+    else:
+        from platformio.managers.lib import LibraryManager as Manager
+    pm = Manager()
+    outdated_items = []
+    for manifest in pm.get_installed():
+        if manifest['name'] not in outdated_items and \
+                pm.is_outdated(manifest['name']):
+            outdated_items.append(manifest['name'])
+    return outdated_items
+
+
+def show_update_checks(ctx):
+    results = app.get_state_item("update_checks", {})
+    shown = {}
+    for name, _ in UPDATE_CHECKS:
+        if name in results:
+            shown[name] = results.pop(name)
+    if not shown:
+        return
+    # the results are shown once
+    app.set_state_item("update_checks", results)
+
+    if "platformio_upgrade" in shown:
+        show_platformio_upgrade(shown['platformio_upgrade']['latest_version'])
+    for what in ("platforms", "libraries"):
+        if what + "_update" in shown:
+            show_internal_updates(ctx, what,
+                                  shown[what + "_update"]['outdated'])
 
-    latest_version = get_latest_version()
+
+def show_platformio_upgrade(latest_version):
     if semantic_version.Version.coerce(util.pepver_to_semver(
             latest_version)) <= semantic_version.Version.coerce(
                 util.pepver_to_semver(__version__)):
         return
-
     terminal_width, _ = click.get_terminal_size()
 
     click.echo("")
@@ -213,22 +315,7 @@ def check_platformio_upgrade():
     click.echo("")
 
 
-def check_internal_updates(ctx, what):
-    last_check = app.get_state_item("last_check", {})
-    interval = int(app.get_setting("check_%s_interval" % what)) * 3600 * 24
-    if (time() - interval) < last_check.get(what + "_update", 0):
-        return
-
-    last_check[what + '_update'] = int(time())
-    app.set_state_item("last_check", last_check)
-
-    pm = PlatformManager() if what == "platforms" else LibraryManager()
-    outdated_items = []
-    for manifest in pm.get_installed():
-        if manifest['name'] not in outdated_items and \
-                pm.is_outdated(manifest['name']):
-            outdated_items.append(manifest['name'])
-
+def show_internal_updates(ctx, what, outdated_items):
     if not outdated_items:
         return
 
@@ -263,10 +350,13 @@ def check_internal_updates(ctx, what):
     else:
         click.secho("Please wait while updating %s ..." % what, fg="yellow")
         if what == "platforms":
-            ctx.invoke(cmd_platform_update, platforms=outdated_items)
+            from platformio.commands.platform import platform_update
+            ctx.invoke(platform_update, platforms=outdated_items)
         elif what == "libraries":
-            ctx.obj = pm
-            ctx.invoke(cmd_lib_update, libraries=outdated_items)
+            from platformio.commands.lib import lib_update
+            from platformio.managers.lib import LibraryManager
+            ctx.obj = LibraryManager()
+            ctx.invoke(lib_update, libraries=outdated_items)
         click.echo()
 
         telemetry.on_event(
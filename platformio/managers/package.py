@@ -19,11 +19,9 @@ from shutil import copyfile, copytree
 from tempfile import mkdtemp
 
 import click
-import requests
 import semantic_version
 
 from platformio import exception, telemetry, util
-from platformio.downloader import FileDownloader
 from platformio.unpacker import FileUnpacker
 from platformio.vcsclient import VCSClientFactory
 
@@ -51,6 +49,7 @@ class PackageRepoIterator(object):
         elif repo in PackageRepoIterator._MANIFEST_CACHE:
             manifest = PackageRepoIterator._MANIFEST_CACHE[repo]
         else:
+            import requests
             r = None
             try:
                 r = requests.get(repo, headers=util.get_request_defheaders())
@@ -290,6 +289,8 @@ class BasePkgManager(PkgRepoMixin, PkgInstallerMixin):
 
     @staticmethod
     def download(url, dest_dir, sha1=None):
+        # `requests` is loaded only when something is downloaded
+        from platformio.downloader import FileDownloader
         fd = FileDownloader(url, dest_dir)
         fd.start()
         if sha1:
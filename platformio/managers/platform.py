@@ -17,13 +17,12 @@ import os
 import re
 import sys
 from imp import load_source
-from multiprocessing import cpu_count
 from os.path import basename, dirname, isdir, isfile, join
 
 import click
 import semantic_version
 
-from platformio import app, exception, util
+from platformio import app, exception, jobserver, util
 from platformio.managers.package import BasePkgManager, PackageManager
 
 
@@ -234,8 +233,11 @@ class PlatformPackagesMixin(object):
 class PlatformRunMixin(object):
 
     LINE_ERROR_RE = re.compile(r"(\s+error|error[:\s]+)", re.I)
+    # the last lines of the output are returned for the error context
+    OUTPUT_CONTEXT_LINES = 200
+    BUILD_LOG_MAX_BYTES = 10 * 1024 * 1024
 
-    def run(self, variables, targets, verbose):
+    def run(self, variables, targets, verbose, jobs=None):
         assert isinstance(variables, dict)
         assert isinstance(targets, list)
 
@@ -243,6 +245,7 @@ class PlatformRunMixin(object):
         self.install_packages(quiet=True)
 
         self._verbose = verbose or app.get_setting("force_verbose")
+        self._jobs = jobs or self.get_job_nums()
 
         if "clean" in targets:
             targets = ["-c", "."]
@@ -270,24 +273,51 @@ class PlatformRunMixin(object):
                 _PYTHONPATH.append(p)
         os.environ['PYTHONPATH'] = os.pathsep.join(_PYTHONPATH)
 
-        cmd = [
-            os.path.normpath(sys.executable),
-            join(self.get_package_dir("tool-scons"), "script", "scons"), "-Q",
-            "-j %d" % self.get_job_nums(), "--warn=no-no-parallel-support",
-            "-f", join(util.get_source_dir(), "builder", "main.py")
-        ]
-        if not self._verbose and "-c" not in targets:
-            cmd.append("--silent")
-        cmd += targets
-
-        # encode and append variables
-        for key, value in variables.items():
-            cmd.append("%s=%s" % (key.upper(), base64.b64encode(value)))
-
-        result = util.exec_command(
-            cmd,
-            stdout=util.AsyncPipe(self.on_run_out),
-            stderr=util.AsyncPipe(self.on_run_err))
+        with jobserver.JobServer().acquire(self._jobs) as tokens:
+            if self._verbose:
+                self._echo_line(
+                    "Acquired %d build job(s), waited %.2f seconds" %
+                    (len(tokens), tokens.wait_time),
+                    level=1)
+
+            cmd = [
+                os.path.normpath(sys.executable),
+                join(self.get_package_dir("tool-scons"), "script", "scons"),
+                "-Q", "-j %d" % len(tokens), "--warn=no-no-parallel-support",
+                "-f", join(util.get_source_dir(), "builder", "main.py")
+            ]
+            if not self._verbose and "-c" not in targets:
+                cmd.append("--silent")
+            cmd += targets
+
+            # encode and append variables
+            for key, value in variables.items():
+                cmd.append("%s=%s" % (key.upper(), base64.b64encode(value)))
+
+            log = None
+            if app.get_setting("enable_build_log"):
+                log = util.RotatingLog(
+                    join(util.get_projectpioenvs_dir(),
+                         variables['pioenv'], "build.log"),
+                    self.BUILD_LOG_MAX_BYTES)
+            try:
+                result = util.exec_command(
+                    cmd,
+                    stdout=util.AsyncPipe(
+                        linescallback=self.on_run_out_lines,
+                        max_lines=self.OUTPUT_CONTEXT_LINES,
+                        log=log),
+                    stderr=util.AsyncPipe(
+                        linescallback=self.on_run_err_lines,
+                        max_lines=self.OUTPUT_CONTEXT_LINES,
+                        log=log),
+                    env=tokens.get_child_env())
+            finally:
+                if log:
+                    log.close()
+
+        result['jobs'] = len(tokens)
+        result['jobs_wait_time'] = tokens.wait_time
         return result
 
     def on_run_out(self, line):
@@ -297,20 +327,53 @@ class PlatformRunMixin(object):
         is_error = self.LINE_ERROR_RE.search(line) is not None
         self._echo_line(line, level=3 if is_error else 2)
 
-    @staticmethod
-    def _echo_line(line, level):
+    def on_run_out_lines(self, lines):
+        self._echo_lines(lines, level=1)
+
+    def on_run_err_lines(self, lines):
+        # warnings are much more frequent, check the whole batch at once
+        if not self.LINE_ERROR_RE.search("\n".join(lines)):
+            return self._echo_lines(lines, level=2)
+        for line in lines:
+            self.on_run_err(line)
+
+    def set_output_callback(self, callback):
+        self._output_callback = callback
+
+    def _echo_line(self, line, level):
         assert 1 <= level <= 3
         fg = (None, "yellow", "red")[level - 1]
         if level == 1 and "is up to date" in line:
             fg = "green"
-        click.secho(line, fg=fg, err=level > 1)
+        if self._output_callback:
+            self._output_callback(line, fg=fg, err=level > 1)
+        else:
+            click.secho(line, fg=fg, err=level > 1)
+
+    def _echo_lines(self, lines, level):
+        if self._output_callback:
+            for line in lines:
+                self._echo_line(line, level)
+            return
+        # render consecutive lines of the same style by the single call
+        err = level > 1
+        fg = (None, "yellow", "red")[level - 1]
+        group = []
+        group_fg = None
+        for line in lines:
+            line_fg = "green" if (level == 1 and
+                                  "is up to date" in line) else fg
+            if group and line_fg != group_fg:
+                click.secho("\n".join(group), fg=group_fg, err=err)
+                group = []
+            group.append(line)
+            group_fg = line_fg
+        if group:
+            click.secho("\n".join(group), fg=group_fg, err=err)
 
     @staticmethod
     def get_job_nums():
-        try:
-            return cpu_count()
-        except NotImplementedError:
-            return 1
+        return jobserver.get_total_jobs()
 
 
 class PlatformBase(PlatformPackagesMixin, PlatformRunMixin):
@@ -327,6 +390,8 @@ class PlatformBase(PlatformPackagesMixin, PlatformRunMixin):
             self._manifest.get("packageRepositories"))
 
         self._verbose = False
+        self._jobs = 1
+        self._output_callback = None
 
     @property
     def name(self):
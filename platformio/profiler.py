@@ -0,0 +1,169 @@
+# Copyright 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from contextlib import contextmanager
+from os import remove
+from os.path import abspath, basename, isfile, join, relpath, sep, splitext
+from time import time
+
+from platformio import util
+
+# the categories of the events in the order of the build phases
+PHASES = [
+    ("packages", "Platform packages check"),
+    ("libdeps", "Library dependencies install"),
+    ("startup", "Build system startup"),
+    ("configure", "Build scripts"),
+    ("libbuilders", "Collect libraries"),
+    ("ldf", "Library dependency search"),
+    ("compile", "Compile"),
+    ("archive", "Archive"),
+    ("link", "Link"),
+    ("size", "Program size check"),
+    ("command", "Other commands")
+]  # yapf: disable
+
+
+class BuildProfiler(object):
+    """Timings of the environment processing.
+
+    The events of the build system are recorded by ``pioprofile`` builder
+    tool and merged with the events of the current process. The report is
+    saved to the build directory as JSON and in Chrome Trace Event format
+    (``chrome://tracing``).
+    """
+
+    REPORT_NAME = "profile.json"
+    TRACE_NAME = "profile.trace.json"
+    BUILD_EVENTS_NAME = "profile.build.json"
+
+    def __init__(self, env_name, enabled=False):
+        self.env_name = env_name
+        self.enabled = enabled
+        self.events = []
+
+    @contextmanager
+    def phase(self, name, category):
+        start = time()
+        try:
+            yield
+        finally:
+            self.add_event(name, category, start)
+
+    def add_event(self, name, category, start, end=None, tid=0):
+        if not self.enabled:
+            return
+        self.events.append({
+            "name": name,
+            "cat": category,
+            "ts": start,
+            "dur": (end or time()) - start,
+            "tid": tid
+        })
+
+    def load_build_events(self, path, spawn_time):
+        if not isfile(path):
+            return
+        try:
+            events = util.load_json(path)
+        except ValueError:
+            events = []
+        remove(path)
+        for event in events:
+            if event['cat'] == "startup":
+                # the interpreter and SCons were loading since the launch
+                event['dur'] += event['ts'] - spawn_time
+                event['ts'] = spawn_time
+            # thread 0 is reserved for the phases of the current process
+            event['tid'] += 1
+            self.events.append(event)
+
+    def get_summary(self, build_dir, limit=10):
+        phases = {}
+        units = []
+        libraries = {}
+        for event in self.events:
+            phase = phases.setdefault(event['cat'], {"duration": 0,
+                                                     "count": 0})
+            phase['duration'] += event['dur']
+            phase['count'] += 1
+            if event['cat'] not in ("compile", "archive"):
+                continue
+            if event['cat'] == "compile":
+                units.append({"name": relpath(abspath(event['name']),
+                                              abspath(build_dir)),
+                              "duration": event['dur']})
+            name = _get_library_name(build_dir, event['name'])
+            libraries[name] = libraries.get(name, 0) + event['dur']
+
+        return {
+            "phases": [dict(category=category, title=title, **phases[category])
+                       for category, title in PHASES if category in phases],
+            "translation_units": _get_slowest(units, limit),
+            "libraries": _get_slowest(
+                [{"name": k, "duration": v} for k, v in libraries.items()],
+                limit)
+        }
+
+    def save(self, build_dir):
+        """Save the report and the trace, the recorded events are reset."""
+        if not self.events:
+            return None
+        summary = self.get_summary(build_dir)
+        events = sorted(self.events, key=lambda event: event['ts'])
+        self.events = []
+        origin = events[0]['ts']
+
+        with open(join(build_dir, self.REPORT_NAME), "w") as fp:
+            json.dump({
+                "environment": self.env_name,
+                "started": origin,
+                "events": [dict(event, ts=event['ts'] - origin)
+                           for event in events],
+                "summary": summary
+            }, fp, indent=2)
+
+        trace = []
+        for event in events:
+            trace.append({
+                "name": event['name'],
+                "cat": event['cat'],
+                "ph": "X",
+                "ts": int((event['ts'] - origin) * 1000000),
+                "dur": int(event['dur'] * 1000000),
+                "pid": 0,
+                "tid": event['tid']
+            })
+        trace.append({"name": "process_name", "ph": "M", "pid": 0,
+                      "args": {"name": self.env_name}})
+        with open(join(build_dir, self.TRACE_NAME), "w") as fp:
+            json.dump({"traceEvents": trace}, fp)
+        return summary
+
+
+def _get_slowest(items, limit):
+    return sorted(
+        items, key=lambda item: item['duration'], reverse=True)[:limit]
+
+
+def _get_library_name(build_dir, path):
+    if path.endswith(".a"):
+        # archive of the library, libFoo.a
+        name = splitext(basename(path))[0]
+        return name[3:] if name.startswith("lib") else name
+    parts = relpath(abspath(path), abspath(build_dir)).split(sep)
+    if parts[0] == "lib" and len(parts) > 2:
+        return parts[1]
+    return parts[0]
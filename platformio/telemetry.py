@@ -13,21 +13,19 @@
 # limitations under the License.
 
 import atexit
+import json
+import os
 import platform
-import Queue
 import sys
-import threading
 import uuid
-from collections import deque
 from os import getenv
-from time import sleep, time
+from os.path import getmtime, getsize, isfile, join
+from time import time
 from traceback import format_exc
 
 import click
-import requests
 
 from platformio import __version__, app, exception, util
-from platformio.ide.projectgenerator import ProjectGenerator
 
 
 class TelemetryBase(object):
@@ -129,98 +127,106 @@ class MeasurementProtocol(TelemetryBase):
             return
 
         self['t'] = hittype
+        # the time of the hit, it is converted to the queue time on sending
+        if "qt" not in self._params:
+            self['qt'] = time()
 
-        # correct queue time
-        if "qt" in self._params and isinstance(self['qt'], float):
-            self['qt'] = int((time() - self['qt']) * 1000)
+        TelemetrySpool().append(self._params)
 
-        MPDataPusher().push(self._params)
 
+class TelemetrySpool(object):
+    """Hits which are waiting to be sent, one JSON object per line.
 
-@util.singleton
-class MPDataPusher(object):
+    The commands only append the hits to the spool file, they are sent in
+    batches by a detached process (see :func:`flush_spool`), so the exit
+    of PlatformIO is never delayed by the network.
+    """
 
-    MAX_WORKERS = 5
+    COLLECT_URL = "https://ssl.google-analytics.com/batch"
+    BATCH_SIZE = 20  # the limit of Measurement Protocol
+    MAX_SIZE = 512 * 1024
+    # the interval between the launches of the sender
+    FLUSH_INTERVAL = 60
 
-    def __init__(self):
-        self._queue = Queue.LifoQueue()
-        self._failedque = deque()
-        self._http_session = requests.Session()
-        self._http_offline = False
-        self._workers = []
-
-    def push(self, item):
-        # if network is off-line
-        if self._http_offline:
-            if "qt" not in item:
-                item['qt'] = time()
-            self._failedque.append(item)
-            return
-
-        self._queue.put(item)
-        self._tune_workers()
+    def __init__(self, path=None):
+        self.path = path or join(util.get_home_dir(), "telemetry.spool")
 
-    def in_wait(self):
-        return self._queue.unfinished_tasks
-
-    def get_items(self):
-        items = list(self._failedque)
+    def append(self, params):
         try:
-            while True:
-                items.append(self._queue.get_nowait())
-        except Queue.Empty:
+            if isfile(self.path) and getsize(self.path) > self.MAX_SIZE:
+                return
+            with open(self.path, "a") as fp:
+                fp.write(json.dumps(params) + "\n")
+        except (IOError, OSError):
             pass
-        return items
-
-    def _tune_workers(self):
-        for i, w in enumerate(self._workers):
-            if not w.is_alive():
-                del self._workers[i]
-
-        need_nums = min(self._queue.qsize(), self.MAX_WORKERS)
-        active_nums = len(self._workers)
-        if need_nums <= active_nums:
-            return
 
-        for i in range(need_nums - active_nums):
-            t = threading.Thread(target=self._worker)
-            t.daemon = True
-            t.start()
-            self._workers.append(t)
-
-    def _worker(self):
-        while True:
-            try:
-                item = self._queue.get()
-                _item = item.copy()
-                if "qt" not in _item:
-                    _item['qt'] = time()
-                self._failedque.append(_item)
-                if self._send_data(item):
-                    self._failedque.remove(_item)
-                self._queue.task_done()
-            except:  # pylint: disable=W0702
-                pass
-
-    def _send_data(self, data):
-        if self._http_offline:
+    def is_flush_due(self):
+        if not isfile(self.path):
             return False
+        lock_path = self.path + ".lock"
+        return (not isfile(lock_path) or
+                time() - getmtime(lock_path) > self.FLUSH_INTERVAL)
+
+    def flush(self, url=None):
+        """Send the spooled hits, returns the number of the sent hits.
+
+        The hits which were not sent are returned to the spool.
+        """
+        with open(self.path + ".lock", "w") as lockfp:
+            if not util.lock_file(lockfp, blocking=False):
+                return 0  # another sender is running
+            sending_path = self.path + ".sending"
+            # the new hits are appended to a new spool meanwhile
+            if isfile(self.path) and not isfile(sending_path):
+                os.rename(self.path, sending_path)
+            if not isfile(sending_path):
+                return 0
+            items = []
+            with open(sending_path) as fp:
+                for line in fp:
+                    try:
+                        items.append(json.loads(line))
+                    except ValueError:
+                        pass
+
+            sent = 0
+            for i in range(0, len(items), self.BATCH_SIZE):
+                if not self._send_batch(items[i:i + self.BATCH_SIZE], url or
+                                        self.COLLECT_URL):
+                    for item in items[i:]:
+                        self.append(item)
+                    break
+                sent += len(items[i:i + self.BATCH_SIZE])
+            os.remove(sending_path)
+            return sent
+
+    @staticmethod
+    def _send_batch(items, url):
+        import requests
+        from urllib import urlencode
+        lines = []
+        for item in items:
+            item = dict(item)
+            item['qt'] = max(0, int((time() - item['qt']) * 1000))
+            lines.append(urlencode(
+                [(k, unicode(v).encode("utf8")) for k, v in item.items()]))
         try:
-            r = self._http_session.post(
-                "https://ssl.google-analytics.com/collect",
-                data=data,
+            r = requests.post(
+                url,
+                data="\n".join(lines),
                 headers=util.get_request_defheaders(),
-                timeout=1)
+                timeout=5)
             r.raise_for_status()
             return True
         except:  # pylint: disable=W0702
-            self._http_offline = True
-        return False
+            return False
 
 
-def on_command():
-    resend_backuped_reports()
+def flush_spool(path, url=None):
+    TelemetrySpool(path).flush(url)
 
+
+def on_command():
     mp = MeasurementProtocol()
     mp.send("screenview")
 
@@ -252,6 +258,7 @@ def measure_ci():
 
 
 def measure_caller(calller_id):
+    from platformio.ide.projectgenerator import ProjectGenerator
     calller_id = str(calller_id)[:20].lower()
     event = {"category": "Caller", "action": "Misc", "label": calller_id}
     if calller_id in (["atom", "vim"] + ProjectGenerator.get_supported_ides()):
@@ -293,57 +300,11 @@ def on_exception(e):
 
 @atexit.register
 def _finalize():
-    timeout = 1000  # msec
-    elapsed = 0
     try:
-        while elapsed < timeout:
-            if not MPDataPusher().in_wait():
-                break
-            sleep(0.2)
-            elapsed += 200
-        backup_reports(MPDataPusher().get_items())
-    except KeyboardInterrupt:
+        spool = TelemetrySpool()
+        if spool.is_flush_due():
+            util.launch_detached(
+                "import sys; from platformio.telemetry import flush_spool; "
+                "flush_spool(sys.argv[1])", [spool.path])
+    except:  # pylint: disable=W0702
         pass
-
-
-def backup_reports(items):
-    if not items:
-        return
-
-    KEEP_MAX_REPORTS = 100
-    tm = app.get_state_item("telemetry", {})
-    if "backup" not in tm:
-        tm['backup'] = []
-
-    for params in items:
-        # skip static options
-        for key in params.keys():
-            if key in ("v", "tid", "cid", "cd1", "cd2", "sr", "an"):
-                del params[key]
-
-        # store time in UNIX format
-        if "qt" not in params:
-            params['qt'] = time()
-        elif not isinstance(params['qt'], float):
-            params['qt'] = time() - (params['qt'] / 1000)
-
-        tm['backup'].append(params)
-
-    tm['backup'] = tm['backup'][KEEP_MAX_REPORTS * -1:]
-    app.set_state_item("telemetry", tm)
-
-
-def resend_backuped_reports():
-    tm = app.get_state_item("telemetry", {})
-    if "backup" not in tm or not tm['backup']:
-        return False
-
-    for report in tm['backup']:
-        mp = MeasurementProtocol()
-        for key, value in report.items():
-            mp[key] = value
-        mp.send(report['t'])
-
-    # clean
-    tm['backup'] = []
-    app.set_state_item("telemetry", tm)
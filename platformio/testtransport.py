@@ -0,0 +1,238 @@
+# Copyright 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+import select
+import socket
+import subprocess
+from Queue import Empty, Queue
+from threading import Thread
+from time import sleep, time
+
+from platformio import exception
+
+# the transports which run the test program on the host machine
+HOST_TRANSPORTS = ("subprocess", "pty")
+
+
+class TestTransport(object):
+    """The output of the test program, line by line.
+
+    :meth:`readline` returns an empty string when there is no output during
+    ``READ_TIMEOUT`` seconds and ``None`` when the output is finished, so
+    the caller can stop the test which is hanging.
+    """
+
+    READ_TIMEOUT = 1
+
+    def __init__(self):
+        self._buffer = ""
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        self.close()
+
+    def open(self):
+        pass
+
+    def readline(self):
+        while "\n" not in self._buffer:
+            data = self._read()
+            if data is None:
+                # the incomplete line is kept for the next call
+                return ""
+            if not data:
+                line, self._buffer = self._buffer, ""
+                return line or None
+            self._buffer += data
+        line, self._buffer = self._buffer.split("\n", 1)
+        return line + "\n"
+
+    def _read(self):
+        """Returns the data, an empty string at the end of the output or
+        ``None`` when there is no data during ``READ_TIMEOUT`` seconds."""
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class SerialTransport(TestTransport):
+
+    def __init__(self, port, baudrate=9600, open_timeout=5):
+        TestTransport.__init__(self)
+        self.port = port
+        self.baudrate = baudrate
+        # the board is restarted after the upload, wait for its port
+        self.open_timeout = open_timeout
+        self._serial = None
+
+    def open(self):
+        import serial
+        deadline = time() + self.open_timeout
+        while True:
+            try:
+                self._serial = serial.Serial(
+                    self.port, self.baudrate, timeout=self.READ_TIMEOUT)
+                return
+            except serial.SerialException:
+                if time() > deadline:
+                    raise
+                sleep(0.1)
+
+    def _read(self):
+        # the board does not close the port
+        return self._serial.readline() or None
+
+    def close(self):
+        if self._serial:
+            self._serial.close()
+
+
+class ProcessTransport(TestTransport):
+    """Run the test program, which was built for the host machine."""
+
+    def __init__(self, args):
+        TestTransport.__init__(self)
+        self.args = args
+        self._process = None
+        self._queue = Queue()
+
+    def open(self):
+        self._process = subprocess.Popen(
+            self.args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        # the pipes can not be polled on Windows, read them in the thread
+        reader = Thread(target=self._read_pipe)
+        reader.daemon = True
+        reader.start()
+
+    def _read_pipe(self):
+        for line in iter(self._process.stdout.readline, ""):
+            self._queue.put(line)
+        self._queue.put("")
+
+    def _read(self):
+        try:
+            return self._queue.get(timeout=self.READ_TIMEOUT)
+        except Empty:
+            return None
+
+    def close(self):
+        if self._process:
+            if self._process.poll() is None:
+                self._process.kill()
+            self._process.wait()
+
+
+class PtyTransport(ProcessTransport):
+    """Run the test program with the output to the pseudo-terminal.
+
+    The program writes to the terminal as to the serial port of the board,
+    the output is line buffered by the C library.
+    """
+
+    READ_SIZE = 4096
+
+    def __init__(self, args):
+        ProcessTransport.__init__(self, args)
+        self._master_fd = None
+
+    def open(self):
+        if not hasattr(os, "openpty"):
+            raise exception.PlatformioException(
+                "`pty` test transport is not supported by this operating "
+                "system, please use `subprocess`")
+        self._master_fd, slave_fd = os.openpty()
+        try:
+            self._process = subprocess.Popen(
+                self.args, stdin=slave_fd, stdout=slave_fd, stderr=slave_fd)
+        finally:
+            os.close(slave_fd)
+
+    def _read(self):
+        if not select.select([self._master_fd], [], [],
+                             self.READ_TIMEOUT)[0]:
+            return None
+        try:
+            return os.read(self._master_fd, self.READ_SIZE)
+        except OSError:
+            # EIO, all descriptors of the terminal are closed
+            return ""
+
+    def close(self):
+        ProcessTransport.close(self)
+        if self._master_fd is not None:
+            os.close(self._master_fd)
+            self._master_fd = None
+
+
+class TcpTransport(TestTransport):
+    """Read the output of the board from the TCP socket."""
+
+    READ_SIZE = 4096
+
+    def __init__(self, host, port, open_timeout=5):
+        TestTransport.__init__(self)
+        self.host = host
+        self.port = port
+        self.open_timeout = open_timeout
+        self._socket = None
+
+    def open(self):
+        deadline = time() + self.open_timeout
+        while True:
+            try:
+                self._socket = socket.create_connection(
+                    (self.host, self.port), self.open_timeout)
+                break
+            except socket.error:
+                if time() > deadline:
+                    raise
+                sleep(0.1)
+        self._socket.settimeout(self.READ_TIMEOUT)
+
+    def _read(self):
+        try:
+            return self._socket.recv(self.READ_SIZE)
+        except socket.timeout:
+            return None
+
+    def close(self):
+        if self._socket:
+            self._socket.close()
+
+
+def get_transport(name, serial_port=None, program=None):
+    """Create the transport by the value of `test_transport` option.
+
+    The values are ``serial`` (default), ``subprocess``, ``pty`` and
+    ``tcp://host:port``.
+    """
+    name = (name or "serial").strip()
+    if name == "serial":
+        return SerialTransport(serial_port)
+    elif name == "subprocess":
+        return ProcessTransport([program])
+    elif name == "pty":
+        return PtyTransport([program])
+    match = re.match(r"^tcp://([^:/]+):(\d+)/?$", name)
+    if match:
+        return TcpTransport(match.group(1), int(match.group(2)))
+    raise exception.PlatformioException(
+        "Unknown test transport `%s`, use `serial`, `subprocess`, `pty` or "
+        "`tcp://host:port`" % name)
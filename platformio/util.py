@@ -25,7 +25,7 @@ from os.path import (abspath, basename, dirname, expanduser, isdir, isfile,
                      join, splitdrive)
 from platform import system, uname
 from shutil import rmtree
-from threading import Thread
+from threading import Lock, Thread
 
 from platformio import __apiip__, __apiurl__, __version__, exception
 
@@ -35,40 +35,117 @@ try:
 except ImportError:
     from ConfigParser import ConfigParser
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
 
 class AsyncPipe(Thread):
+    """Read the output of the process in the background.
+
+    Lines are passed to ``outcallback`` one by one, or to ``linescallback``
+    in the batches which were read from the pipe at once. Only the last
+    ``max_lines`` lines are kept in the buffer when it is specified, the
+    whole output is written to ``log`` file (see :class:`RotatingLog`).
+    """
 
-    def __init__(self, outcallback=None):
+    READ_SIZE = 65536
+
+    def __init__(self,
+                 outcallback=None,
+                 linescallback=None,
+                 max_lines=None,
+                 log=None):
         Thread.__init__(self)
         self.outcallback = outcallback
+        self.linescallback = linescallback
+        self.log = log
 
         self._fd_read, self._fd_write = os.pipe()
-        self._pipe_reader = os.fdopen(self._fd_read)
-        self._buffer = []
+        self._buffer = collections.deque(maxlen=max_lines)
 
         self.start()
 
     def get_buffer(self):
-        return self._buffer
+        return list(self._buffer)
 
     def fileno(self):
         return self._fd_write
 
     def run(self):
-        for line in iter(self._pipe_reader.readline, ""):
-            line = line.strip()
-            self._buffer.append(line)
-            if self.outcallback:
+        tail = ""
+        while True:
+            data = os.read(self._fd_read, self.READ_SIZE)
+            if not data:
+                break
+            lines = (tail + data).split("\n")
+            tail = lines.pop()
+            if lines:
+                self._process_lines([l.strip() for l in lines])
+        if tail:
+            self._process_lines([tail.strip()])
+        os.close(self._fd_read)
+
+    def _process_lines(self, lines):
+        self._buffer.extend(lines)
+        if self.log:
+            self.log.write_lines(lines)
+        if self.linescallback:
+            self.linescallback(lines)
+        elif self.outcallback:
+            for line in lines:
                 self.outcallback(line)
-            else:
-                print line
-        self._pipe_reader.close()
+        else:
+            print "\n".join(lines)
 
     def close(self):
         os.close(self._fd_write)
         self.join()
 
 
+class RotatingLog(object):
+    """Thread-safe log file, the previous logs are kept as ``.1``, ``.2``..."""
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backups=1):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = Lock()
+        self._fp = None
+        self._size = 0
+
+    def write_lines(self, lines):
+        data = "\n".join(lines) + "\n"
+        with self._lock:
+            if not self._fp or (self._size and
+                                self._size + len(data) > self.max_bytes):
+                self._rotate()
+            self._fp.write(data)
+            self._size += len(data)
+
+    def _rotate(self):
+        if self._fp:
+            self._fp.close()
+        elif not isdir(dirname(self.path)):
+            os.makedirs(dirname(self.path))
+        for index in range(self.backups, 0, -1):
+            src = self.path + (".%d" % (index - 1) if index > 1 else "")
+            if isfile(src):
+                if isfile("%s.%d" % (self.path, index)):
+                    os.remove("%s.%d" % (self.path, index))
+                os.rename(src, "%s.%d" % (self.path, index))
+        self._fp = open(self.path, "w")
+        self._size = 0
+
+    def close(self):
+        with self._lock:
+            if self._fp:
+                self._fp.close()
+                self._fp = None
+
+
 class cd(object):
 
     def __init__(self, new_path):
@@ -288,6 +365,73 @@ def exec_command(*args, **kwargs):
     return result
 
 
+def lock_file(fp, blocking=True):
+    """Acquire the advisory lock of the open file.
+
+    Returns False when ``blocking`` is disabled and the file is locked by
+    another process.
+    """
+    try:
+        if fcntl:
+            fcntl.flock(fp.fileno(), fcntl.LOCK_EX |
+                        (0 if blocking else fcntl.LOCK_NB))
+        else:
+            msvcrt.locking(fp.fileno(), msvcrt.LK_LOCK
+                           if blocking else msvcrt.LK_NBLCK, 1)
+    except (IOError, OSError):
+        if blocking:
+            raise
+        return False
+    return True
+
+
+def unlock_file(fp):
+    try:
+        if fcntl:
+            fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+        else:
+            msvcrt.locking(fp.fileno(), msvcrt.LK_UNLCK, 1)
+    except (IOError, OSError):
+        pass
+
+
+def replace_file(src, dst):
+    """Rename ``src`` to the existing ``dst`` atomically."""
+    if system() != "Windows":
+        os.rename(src, dst)
+        return
+    import ctypes
+    # MOVEFILE_REPLACE_EXISTING | MOVEFILE_WRITE_THROUGH
+    if not ctypes.windll.kernel32.MoveFileExW(
+            unicode(src), unicode(dst), 0x1 | 0x8):
+        raise ctypes.WinError()
+
+
+def launch_detached(code, args=None):
+    """Run Python ``code`` in the process which outlives PlatformIO.
+
+    The arguments are available to the code as ``sys.argv[1:]``.
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [dirname(get_source_dir())] +
+        ([env['PYTHONPATH']] if env.get("PYTHONPATH") else []))
+    kwargs = {}
+    if "windows" in get_systype():
+        # DETACHED_PROCESS | CREATE_NEW_PROCESS_GROUP
+        kwargs['creationflags'] = 0x00000008 | 0x00000200
+    else:
+        kwargs.update({"close_fds": True, "preexec_fn": os.setsid})
+    with open(os.devnull, "r+") as devnull:
+        subprocess.Popen(
+            [sys.executable, "-c", code] + (args or []),
+            stdin=devnull,
+            stdout=devnull,
+            stderr=devnull,
+            env=env,
+            **kwargs)
+
+
 def get_serialports():
     try:
         from serial.tools.list_ports import comports
@@ -335,8 +479,23 @@ def get_logicaldisks():
     return disks
 
 
-def get_request_defheaders():
+@memoized
+def _import_requests():
+    # `requests` is imported on demand, it slows down the start of CLI
     import requests
+    # https://urllib3.readthedocs.org
+    # /en/latest/security.html#insecureplatformwarning
+    try:
+        requests.packages.urllib3.disable_warnings()
+    except AttributeError:
+        raise exception.PlatformioException(
+            "Invalid installation of Python `requests` package`. See "
+            "< https://github.com/platformio/platformio/issues/252 >")
+    return requests
+
+
+def get_request_defheaders():
+    requests = _import_requests()
     data = (__version__, int(is_ci()), requests.utils.default_user_agent())
     return {"User-Agent": "PlatformIO/%s CI/%d %s" % data}
 
@@ -0,0 +1,169 @@
+# Copyright 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import ctypes
+import ctypes.util
+import os
+import select
+from os.path import dirname, isdir, isfile, join
+from time import sleep
+
+# inotify(7) events
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_CLOEXEC = 0x80000
+IN_WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+                 IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+
+
+class Watcher(object):
+    """Wait for the changes of the files in the watched paths.
+
+    The state of the files (size and modification time) is compared with
+    the snapshot, so the temporary files which were created and removed in
+    the meantime are not treated as changes. On Linux the watcher sleeps
+    on inotify between the checks, other systems fall back to polling.
+    """
+
+    POLL_INTERVAL = 0.5
+    DEBOUNCE_INTERVAL = 0.3
+    # re-check the paths which did not exist when the watches were added
+    RESCAN_INTERVAL = 5
+
+    def __init__(self, paths, debounce=None):
+        self.paths = [p for p in paths if p]
+        if debounce is not None:
+            self.DEBOUNCE_INTERVAL = debounce
+        self._inotify = _Inotify.create()
+
+    @property
+    def backend(self):
+        return "inotify" if self._inotify else "polling"
+
+    def snapshot(self):
+        result = {}
+        for path in self.paths:
+            if isfile(path):
+                _stat_file(result, path)
+                continue
+            for root, dirs, files in os.walk(path):
+                dirs[:] = [d for d in dirs if not _is_ignored(d)]
+                for f in files:
+                    if not _is_ignored(f):
+                        _stat_file(result, join(root, f))
+        return result
+
+    def wait(self, snapshot):
+        """Block until the files differ from the snapshot.
+
+        Returns the new snapshot and the list of changed paths when the
+        files stay unchanged during the debounce interval.
+        """
+        current = self.snapshot()
+        while current == snapshot:
+            if self._inotify:
+                self._inotify.watch(self.paths)
+                self._inotify.wait(self.RESCAN_INTERVAL)
+            else:
+                sleep(self.POLL_INTERVAL)
+            current = self.snapshot()
+
+        while True:
+            sleep(self.DEBOUNCE_INTERVAL)
+            stable = self.snapshot()
+            if stable == current:
+                break
+            current = stable
+
+        changes = sorted([
+            path for path in set(snapshot.keys()) | set(current.keys())
+            if snapshot.get(path) != current.get(path)
+        ])
+        return current, changes
+
+    def close(self):
+        if self._inotify:
+            self._inotify.close()
+            self._inotify = None
+
+
+class _Inotify(object):
+
+    def __init__(self, libc, fd):
+        self._libc = libc
+        self._fd = fd
+        self._watched = set()
+
+    @staticmethod
+    def create():
+        libname = ctypes.util.find_library("c")
+        if not libname:
+            return None
+        try:
+            libc = ctypes.CDLL(libname, use_errno=True)
+            fd = libc.inotify_init1(IN_CLOEXEC)
+        except (AttributeError, OSError):
+            return None
+        if fd < 0:
+            return None
+        return _Inotify(libc, fd)
+
+    def watch(self, paths):
+        # sub-directories could be created after the previous call
+        for path in paths:
+            if isfile(path):
+                # editors replace files, watch the parent directory
+                self._add_watch(dirname(path))
+            elif isdir(path):
+                self._add_watch(path)
+                for root, dirs, _ in os.walk(path):
+                    dirs[:] = [d for d in dirs if not _is_ignored(d)]
+                    for d in dirs:
+                        self._add_watch(join(root, d))
+
+    def _add_watch(self, path):
+        if path in self._watched:
+            return
+        if self._libc.inotify_add_watch(self._fd, path, IN_WATCH_MASK) >= 0:
+            self._watched.add(path)
+
+    def wait(self, timeout):
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if readable:
+            # drain the queue, the changes are detected by the snapshots
+            os.read(self._fd, 65536)
+        # the watches of the removed directories are dropped by kernel
+        self._watched = set([p for p in self._watched if isdir(p)])
+
+    def close(self):
+        os.close(self._fd)
+
+
+def _is_ignored(name):
+    # hidden files, VCS folders and temporary files of the editors
+    return name.startswith((".", "#")) or name.endswith(("~", ".swp"))
+
+
+def _stat_file(result, path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return
+    result[path] = (st.st_size, st.st_mtime)
@@ -0,0 +1,66 @@
+# Copyright 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare cold build time of per-file and unity build modes.
+
+Usage: python unitybench.py <project_dir> [<environment>] [<repeats>]
+"""
+
+import os
+import subprocess
+import sys
+from time import time
+
+MODES = (("per-file", "no"), ("unity", "yes"))
+
+
+def build(project_dir, environment, unity):
+    env = os.environ.copy()
+    env['PLATFORMIO_BUILD_UNITY'] = unity
+    args = ["platformio", "run", "-d", project_dir]
+    if environment:
+        args.extend(["-e", environment])
+    with open(os.devnull, "w") as devnull:
+        subprocess.check_call(
+            args + ["-t", "clean"], env=env, stdout=devnull)
+        start_time = time()
+        subprocess.check_call(args, env=env, stdout=devnull)
+    return time() - start_time
+
+
+def main():
+    if len(sys.argv) < 2:
+        print __doc__
+        return 1
+    project_dir = sys.argv[1]
+    environment = sys.argv[2] if len(sys.argv) > 2 else None
+    repeats = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+
+    results = {}
+    for _ in range(repeats):
+        for name, unity in MODES:
+            results.setdefault(name, []).append(
+                build(project_dir, environment, unity))
+
+    base = min(results['per-file'])
+    for name, _ in MODES:
+        best = min(results[name])
+        print "%-10s best %7.2fs  avg %7.2fs  speedup %.2fx" % (
+            name, best, sum(results[name]) / len(results[name]),
+            base / best if best else 0)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
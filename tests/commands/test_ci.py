@@ -0,0 +1,84 @@
+# Copyright 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from xml.etree import ElementTree
+
+from platformio.commands.ci import (_get_results, _mirror_contents,
+                                    get_examples, write_junit_report)
+from platformio.commands.run import EnvironmentProcessor
+
+
+def test_mirror_contents(tmpdir):
+    src_dir = tmpdir.mkdir("project").mkdir("src")
+    src_dir.join("main.cpp").write("int main() {}")
+    src_dir.mkdir("module").join("module.cpp").write("void module() {}")
+    build_dir = tmpdir.join("build")
+
+    _mirror_contents(str(build_dir.join("src")), [str(src_dir)])
+    assert (os.stat(str(build_dir.join("src", "main.cpp"))).st_ino ==
+            os.stat(str(src_dir.join("main.cpp"))).st_ino)
+    build_dir.join("src", ".pioenvs_marker").write("")
+
+    # the editors replace the file instead of writing to it
+    src_dir.join("main.cpp").remove()
+    src_dir.join("main.cpp").write("int main() { return 0; }")
+    src_dir.join("module").remove()
+    src_dir.join("new.cpp").write("")
+    _mirror_contents(str(build_dir.join("src")), [str(src_dir)])
+    assert sorted(os.listdir(str(build_dir.join("src")))) == [
+        "main.cpp", "new.cpp"
+    ]
+    assert build_dir.join("src", "main.cpp").read() == (
+        "int main() { return 0; }")
+
+    # standalone files are the library
+    _mirror_contents(str(build_dir.join("lib")),
+                     [str(src_dir.join("new.cpp"))])
+    assert build_dir.join("lib", "__ci_files", "new.cpp").check()
+
+
+def test_junit_report(tmpdir):
+    processors = []
+    for name, succeeded in (("uno", True), ("due", False), ("zero", None)):
+        ep = EnvironmentProcessor(None, name, {"platform": "atmelavr"}, [],
+                                  None, False)
+        ep.succeeded = succeeded
+        ep.duration = 1.5
+        ep.error_output = "main.cpp:1: error: 'x' was not declared"
+        processors.append(ep)
+    write_junit_report(str(tmpdir.join("report.xml")),
+                       _get_results(processors))
+
+    suite = ElementTree.parse(str(tmpdir.join("report.xml"))).getroot()
+    assert suite.get("tests") == "3" and suite.get("failures") == "1"
+    cases = suite.findall("testcase")
+    assert [c.get("name") for c in cases] == ["uno", "due", "zero"]
+    assert cases[0].find("failure") is None
+    assert "was not declared" in cases[1].find("failure").text
+    assert cases[2].find("skipped") is not None
+
+
+def test_get_examples(tmpdir):
+    examples_dir = tmpdir.mkdir("MyLib").mkdir("examples")
+    examples_dir.mkdir("Blink").join("Blink.ino").write("")
+    basics_dir = examples_dir.mkdir("Basics")
+    basics_dir.mkdir("Echo").join("Echo.ino").write("")
+    basics_dir.join("Echo", "util").mkdir().join("util.cpp").write("")
+    basics_dir.join("readme.txt").write("")
+
+    assert get_examples([str(tmpdir.join("MyLib"))]) == [
+        ("Basics/Echo", str(basics_dir.join("Echo"))),
+        ("Blink", str(examples_dir.join("Blink")))
+    ]
@@ -0,0 +1,33 @@
+# Copyright 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from platformio.commands.idedata import JsonRpcServer
+
+
+def test_json_rpc_errors(tmpdir):
+    server = JsonRpcServer(str(tmpdir))
+    responses = []
+    server._send = responses.append
+
+    # the directory is not a project
+    assert server._process_request({"id": 1, "method": "idedata"})
+    assert server._process_request(
+        {"id": 2, "method": "idedata", "params": ["uno"]})
+    assert server._process_request(
+        {"id": 3, "method": "idedata", "params": "uno"})
+    assert server._process_request({"id": 4, "method": "foo"})
+    assert not server._process_request({"id": 5, "method": "shutdown"})
+    assert [(r['id'], r.get("error", {}).get("code"))
+            for r in responses] == [(1, -32000), (2, -32602), (3, -32602),
+                                    (4, -32601), (5, None)]
@@ -0,0 +1,48 @@
+# Copyright 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from hashlib import sha1
+
+from platformio import util
+from platformio.commands import run as cmd_run
+
+
+def test_include_dirs():
+    assert cmd_run._get_include_dirs(
+        '-DFOO -I/opt/inc -I "/opt/my inc" -Iinclude -I$PROJECT_DIR/x') == [
+            "/opt/inc", "/opt/my inc"
+        ]
+
+
+def test_dir_state(tmpdir):
+    project_dir = tmpdir.mkdir("project")
+    project_dir.join("platformio.ini").write("")
+    shared_dir = tmpdir.mkdir("shared")
+    header = shared_dir.join("config.h")
+    header.write("#define A 1")
+    header.setmtime(1000000000.1)
+    os.symlink(str(shared_dir), str(project_dir.join("shared")))
+
+    def _get_state():
+        state = sha1()
+        with util.cd(str(project_dir)):
+            cmd_run._update_dir_state(state, str(project_dir))
+        return state.hexdigest()
+
+    state = _get_state()
+    # the change in the same second under the linked directory
+    header.write("#define A 2")
+    header.setmtime(1000000000.6)
+    assert _get_state() != state
@@ -0,0 +1,110 @@
+# Copyright 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+from time import sleep, time
+
+import pytest
+from click import Context
+
+from platformio.commands import test as cmd_test
+
+
+def test_device_pool(monkeypatch):
+    ports = {"uno": ["/dev/ttyA", "/dev/ttyB"], "zero": ["/dev/ttyC"]}
+    monkeypatch.setattr(cmd_test.TestProcessor, "get_serial_ports",
+                        lambda self: ports[self.env_name])
+
+    def process(self, build=True):
+        assert not build
+        # the slow board processes less tests
+        sleep(1.0 if self.device == "/dev/ttyB" else 0.1)
+        return self.test_name != "t3"
+
+    monkeypatch.setattr(cmd_test.TestProcessor, "process", process)
+
+    jobs = [("t%d" % i, "uno") for i in range(5)] + [("t0", "zero")]
+    results = cmd_test.process_device_pool(
+        Context(cmd_test.cli), jobs, set(jobs), {"upload_port": None})
+    assert sorted([r[:4] for r in results], key=lambda r: r[1:3]) == [
+        (True, "t0", "uno", "/dev/ttyA"),
+        (True, "t0", "zero", "/dev/ttyC"),
+        (True, "t1", "uno", "/dev/ttyB"),
+        (True, "t2", "uno", "/dev/ttyA"),
+        (False, "t3", "uno", "/dev/ttyA"),
+        (True, "t4", "uno", "/dev/ttyA"),
+    ]
+
+
+def test_match_hwids():
+    hwids = [["0x2341", "0x0043"]]
+    assert cmd_test._match_hwids("USB VID:PID=2341:0043 SNR=1", hwids)
+    assert not cmd_test._match_hwids("USB VID:PID=2341:0042 SNR=1", hwids)
+    assert not cmd_test._match_hwids("n/a", hwids)
+
+
+@pytest.mark.skipif(sys.platform.startswith("win"), reason="shell script")
+def test_host_test(monkeypatch, tmpdir):
+    program = tmpdir.mkdir(".pioenvs").mkdir("native").join("program")
+    program.write("#!/bin/sh\n"
+                  "echo 'test/test_main.c:10:test_a:PASS'\n"
+                  "echo '1 Tests 0 Failures 0 Ignored'\n")
+    program.chmod(0o755)
+    monkeypatch.setattr(cmd_test.TestProcessor, "_get_envdata",
+                        lambda self: {"test_transport": "subprocess"})
+    options = {"project_dir": str(tmpdir), "upload_port": None}
+    tp = cmd_test.TestProcessor(
+        Context(cmd_test.cli), "test_main", "native", options)
+    assert tp.get_serial_ports()[0] == "host:0"
+    assert tp.process(build=False)
+
+    # the program exits before the summary of the tests
+    program.write("#!/bin/sh\necho 'test/test_main.c:10:test_a:PASS'\n")
+    assert not tp.process(build=False)
+
+
+def test_host_program_of_batch(tmpdir):
+    build_dir = tmpdir.mkdir(".pioenvs").mkdir("native")
+    build_dir.join("program").write("")
+    build_dir.mkdir("test").mkdir("test_b").join("program").write("")
+    options = {"project_dir": str(tmpdir), "batch_heads": {"native": "test_a"}}
+
+    def _get_program(testname, build):
+        tp = cmd_test.TestProcessor(
+            Context(cmd_test.cli), testname, "native", options)
+        return tp._get_host_program(build)
+
+    assert _get_program("test_a", False) == str(build_dir.join("program"))
+    assert _get_program("test_b", False) == str(
+        build_dir.join("test", "test_b", "program"))
+    # the test which is built separately after the failed batch
+    assert _get_program("test_b", True) == str(build_dir.join("program"))
+
+
+@pytest.mark.skipif(sys.platform.startswith("win"), reason="shell script")
+def test_host_test_timeout(monkeypatch, tmpdir):
+    program = tmpdir.mkdir(".pioenvs").mkdir("native").join("program")
+    program.write("#!/bin/sh\n"
+                  "echo 'test/test_main.c:10:test_a:PASS'\n"
+                  "sleep 60\n")
+    program.chmod(0o755)
+    monkeypatch.setattr(cmd_test.TestProcessor, "_get_envdata",
+                        lambda self: {"test_transport": "subprocess",
+                                      "test_timeout": "1"})
+    options = {"project_dir": str(tmpdir), "upload_port": None}
+    tp = cmd_test.TestProcessor(
+        Context(cmd_test.cli), "test_main", "native", options)
+    start_time = time()
+    assert not tp.process(build=False)
+    assert time() - start_time < 10
@@ -0,0 +1,69 @@
+# Copyright 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+from platformio.app import State
+
+
+def test_state(tmpdir):
+    path = str(tmpdir.join("appstate.json"))
+    tmpdir.join("appstate.json").write(json.dumps({"cid": "1", "foo": [1]}))
+
+    state = State(path)
+    for _ in range(10):
+        assert state.get("cid") == "1"
+        state.get("foo").append(2)
+        state.set("counter", state.get("counter", 0) + 1)
+    assert state.get("foo") == [1]
+    state.delete("cid")
+    assert state.get("cid") is None
+
+    # the changes of the concurrent process are kept
+    other = State(path)
+    other.set("last_version", "3.0.0")
+    other.flush()
+
+    state.flush()
+    state.flush()
+    assert state.io_stats == {"reads": 2, "writes": 1}
+    assert json.loads(tmpdir.join("appstate.json").read()) == {
+        "foo": [1],
+        "counter": 10,
+        "last_version": "3.0.0"
+    }
+
+
+def test_state_items(tmpdir):
+    path = str(tmpdir.join("appstate.json"))
+    tmpdir.join("appstate.json").write(
+        json.dumps({"settings": {"a": 1, "b": 2}}))
+
+    # the processes change the different settings concurrently
+    state = State(path)
+    other = State(path)
+    state.set_item("settings", "a", 10)
+    assert state.get("settings") == {"a": 10, "b": 2}
+    other.set_item("settings", "b", 20)
+    other.set_item("settings", "c", 30)
+    other.flush()
+    state.flush()
+    assert json.loads(tmpdir.join("appstate.json").read()) == {
+        "settings": {"a": 10, "b": 20, "c": 30}
+    }
+
+    state.delete("settings")
+    state.set_item("settings", "a", 1)
+    state.flush()
+    assert State(path).get("settings") == {"a": 1}
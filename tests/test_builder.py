@@ -0,0 +1,131 @@
+# Copyright 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+# the build system is a package of PlatformIO, not a Python dependency
+SCons = pytest.importorskip("SCons.Script")
+
+from platformio.builder.tools import piomisc  # noqa
+from platformio.builder.tools import platformio as piotool  # noqa
+
+
+@pytest.fixture
+def env(tmpdir):
+    env = SCons.Environment(
+        tools=["default"], BUILD_DIR=str(tmpdir.join("build")))
+    piotool.generate(env)
+    piomisc.generate(env)
+    return env
+
+
+def _make_sources(env, src_dir, files):
+    sources = []
+    for name, contents in sorted(files.items()):
+        src_dir.join(name).write(contents)
+        sources.append(env.File(str(src_dir.join(name))))
+    return sources
+
+
+def _get_batches(sources):
+    """Names of the sources per translation unit"""
+    result = []
+    for node in sources:
+        if not node.name.startswith("unity_"):
+            result.append([node.name])
+            continue
+        result.append([
+            line.split("/")[-1][:-1]
+            for line in open(node.get_abspath()).read().splitlines()
+        ])
+    return sorted(result)
+
+
+def test_unity_static_names(env, tmpdir):
+    env.Replace(BUILD_UNITY="yes")
+    sources = _make_sources(env, tmpdir.mkdir("src"), {
+        "a.c": "static int counter;\nvoid a(void) {}\n",
+        "b.c": "static int counter = 1;\nvoid b(void) {}\n",
+        "c.c": "static void helper(void) {}\nvoid c(void) {}\n",
+        "d.c": "static void helper(void) {}\nvoid d(void) {}\n",
+        "e.c": "void e(void) {}\n"
+    })
+    assert _get_batches(
+        env.MakeUnitySources("$BUILD_DIR/src", sources)) == [
+            ["a.c", "c.c", "e.c"], ["b.c"], ["d.c"]
+        ]
+
+
+def test_unity_anonymous_namespace(env, tmpdir):
+    env.Replace(BUILD_UNITY="yes")
+    sources = _make_sources(env, tmpdir.mkdir("src"), {
+        "a.cpp": "namespace {\nint counter;\n}\n",
+        "b.cpp": "void b() {}\n",
+        "c.cpp": "void c() {}\n"
+    })
+    assert _get_batches(
+        env.MakeUnitySources("$BUILD_DIR/src", sources)) == [
+            ["a.cpp"], ["b.cpp", "c.cpp"]
+        ]
+
+
+def test_unity_ignore(env, tmpdir):
+    env.Replace(BUILD_UNITY="yes", BUILD_UNITY_IGNORE=["FrameworkArduino"])
+    sources = _make_sources(env, tmpdir.mkdir("src"), {
+        "a.c": "void a(void) {}\n",
+        "b.c": "void b(void) {}\n"
+    })
+    assert env.GetUnityBatchSize("$BUILD_DIR/FrameworkArduino") == 0
+    assert env.MakeUnitySources("$BUILD_DIR/FrameworkArduino",
+                                sources) == sources
+    assert len(env.MakeUnitySources("$BUILD_DIR/src", sources)) == 1
+
+
+def test_unity_batch_size(env, tmpdir):
+    files = dict([("f%d.c" % i, "void f%d(void) {}\n" % i)
+                  for i in range(5)])
+    sources = _make_sources(env, tmpdir.mkdir("src"), files)
+    for value, size in (("no", 0), ("yes", piotool.UNITY_BATCH_SIZE),
+                        ("2", 2), ("foo", 0)):
+        env.Replace(BUILD_UNITY=value)
+        assert env.GetUnityBatchSize("$BUILD_DIR/src") == size
+
+    env.Replace(BUILD_UNITY="2")
+    assert _get_batches(
+        env.MakeUnitySources("$BUILD_DIR/src", sources)) == [
+            ["f0.c", "f1.c"], ["f2.c", "f3.c"], ["f4.c"]
+        ]
+
+
+def test_pch_project_sources(env, tmpdir):
+    include_dir = tmpdir.mkdir("framework")
+    include_dir.join("Arduino.h").write("#define ARDUINO 1\n")
+    env.Replace(PIOFRAMEWORK="arduino", CPPPATH=[str(include_dir)])
+    env.AddMethod(lambda _: "gcc", "GetCompilerType")
+
+    # the libraries are declared before the header is precompiled
+    lib_env = env.Clone()
+    env.BuildFrameworkPCH()
+    assert env['CPPPATH'][0] == "$BUILD_DIR/pch"
+    assert "$BUILD_DIR/pch" not in lib_env['CPPPATH']
+    assert "PIOPCH" not in lib_env
+
+    sources = _make_sources(env, tmpdir.mkdir("src"), {
+        "main.cpp": "#include <Arduino.h>\n",
+        "util.c": "void util(void) {}\n"
+    })
+    objects = piotool._depend_on_pch(env, list(sources))
+    assert env['PIOPCH'][0] in objects[0][0].depends
+    assert objects[1] == sources[1]
+    assert piotool._depend_on_pch(lib_env, list(sources)) == sources
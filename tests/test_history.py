@@ -0,0 +1,46 @@
+# Copyright 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from platformio.history import (BuildHistory, get_environment_stats,
+                                percentile)
+
+
+def test_build_history(tmpdir):
+    history = BuildHistory(str(tmpdir.join("history.db")))
+    builds = ((2.0, 1000), (2.2, 1000), (9.0, 1200), (2.1, 1100))
+    for duration, size in builds:
+        build_id = history.add("/project", "uno", "atmelavr")
+        history.update(build_id, duration=duration, succeeded=True,
+                       objects_total=10, objects_built=1,
+                       program_size=size, data_size=100)
+    history.add("/project", "uno", "atmelavr")
+    history.add("/project", "due", "atmelsam")
+    history.add("/other", "uno", "atmelavr")
+
+    builds = history.get_builds("/project", ["uno"])
+    assert len(builds) == 5
+    assert history.get_builds("/project", ["uno"], limit=2)[-1] == builds[-1]
+
+    stats = get_environment_stats(builds, size_threshold=50)
+    assert stats['builds'] == 5 and stats['succeeded'] == 4
+    assert stats['duration']['p50'] == 2.1
+    assert stats['cache_hit_rate'] == 0.9
+    assert stats['program_size'] == {"last": 1100, "change": 100,
+                                     "min": 1000, "max": 1200}
+    assert len(stats['regressions']) == 1
+    assert len(stats['regressions'][0]['reasons']) == 2
+
+    assert percentile([], 50) is None
+    assert percentile([3, 1, 2, 4], 50) == 2
+    assert percentile([3, 1, 2, 4], 95) == 4
@@ -0,0 +1,87 @@
+# Copyright 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from threading import Thread
+from time import sleep
+
+import pytest
+
+from platformio.jobserver import JobServer, JobTokens, parse_makeflags
+
+
+def test_shared_tokens(tmpdir):
+    js = JobServer(jobs=3, tokens_dir=str(tmpdir), makeflags="")
+    first = js.acquire(2)
+    assert len(first) == 2 and first.wait_time < 1
+
+    second = js.acquire(4)
+    assert len(second) == 1
+
+    waited = []
+
+    def _acquire():
+        with js.acquire(1) as tokens:
+            waited.append(tokens.wait_time)
+
+    t = Thread(target=_acquire)
+    t.start()
+    sleep(0.5)
+    assert not waited
+    first.release()
+    t.join()
+    assert waited and waited[0] >= 0.4
+
+    second.release()
+    with js.acquire() as tokens:
+        assert len(tokens) == 3
+
+
+def test_gnu_make_jobserver():
+    assert parse_makeflags("") is None
+    assert parse_makeflags("-j4 --jobserver-fds=9999,9998") is None
+
+    rfd, wfd = os.pipe()
+    os.write(wfd, "++")
+    makeflags = " -j4 --jobserver-auth=%d,%d" % (rfd, wfd)
+    assert parse_makeflags(makeflags) == (rfd, wfd)
+
+    js = JobServer(jobs=8, makeflags=makeflags)
+    tokens = js.acquire(4)
+    # implicit token + 2 tokens from the pipe
+    assert len(tokens) == 3
+    assert js.acquire(2).implicit
+    tokens.release()
+    assert os.read(rfd, 2) == "++"
+
+    # nested processes reuse parent's jobserver
+    env = tokens.get_child_env({"MAKEFLAGS": makeflags})
+    assert env['MAKEFLAGS'] == makeflags
+
+    os.close(rfd)
+    os.close(wfd)
+
+
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="named pipes")
+def test_gnu_make_fifo_jobserver(tmpdir):
+    fifo = str(tmpdir.join("fifo"))
+    os.mkfifo(fifo)
+    makeflags = "-j4 --jobserver-auth=fifo:%s" % fifo
+    fds = parse_makeflags(makeflags)
+    # the descriptor is not opened again by the checks
+    assert parse_makeflags(makeflags) == fds
+    assert JobTokens().get_child_env({"MAKEFLAGS": makeflags}) == {
+        "MAKEFLAGS": makeflags
+    }
+    assert parse_makeflags(makeflags) == fds
@@ -0,0 +1,68 @@
+# Copyright 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from time import time
+
+from platformio import app, exception, maintenance, util
+from platformio.commands import upgrade
+
+
+def test_update_checks(isolated_pio_home, monkeypatch, capsys):
+    launched = []
+    monkeypatch.setattr(util, "launch_detached",
+                        lambda code, args: launched.append(args))
+
+    def get_latest_version_offline():
+        raise exception.GetLatestVersionError()
+
+    monkeypatch.setattr(upgrade, "get_latest_version",
+                        get_latest_version_offline)
+    maintenance.schedule_update_checks()
+    assert launched == [["platformio_upgrade", "platforms_update",
+                         "libraries_update"]]
+    maintenance.run_update_checks(["platformio_upgrade"])
+    results = app.get_state_item("update_checks")
+    assert results['failures'] == 1 and results['retry_after'] > time()
+    assert "platformio_upgrade" not in app.get_state_item("last_check")
+
+    # the circuit breaker is open
+    maintenance.schedule_update_checks()
+    assert len(launched) == 1
+
+    results['retry_after'] = 0
+    app.set_state_item("update_checks", results)
+    monkeypatch.setattr(upgrade, "get_latest_version", lambda: "100.0.0")
+    maintenance.schedule_update_checks()
+    assert launched[-1] == ["platformio_upgrade"]
+    maintenance.run_update_checks(["platformio_upgrade"])
+    assert app.get_state_item("update_checks") == {
+        "failures": 0,
+        "platformio_upgrade": {"latest_version": "100.0.0"}
+    }
+
+    # the results are shown once
+    maintenance.show_update_checks(None)
+    assert "new version 100.0.0" in capsys.readouterr()[0]
+    maintenance.show_update_checks(None)
+    assert not capsys.readouterr()[0]
+
+    # the unexpected errors of the managers are the failures too
+    def get_outdated_items_broken(_):
+        raise ValueError("Invalid manifest")
+
+    monkeypatch.setattr(maintenance, "get_outdated_items",
+                        get_outdated_items_broken)
+    maintenance.run_update_checks(["platforms_update"])
+    assert app.get_state_item("update_checks")['failures'] == 1
+    assert "platforms_update" not in app.get_state_item("last_check")
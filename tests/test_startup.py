@@ -0,0 +1,82 @@
+# Copyright 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import subprocess
+import sys
+from time import time
+
+import pytest
+
+from platformio import __version__
+
+# the budget includes the start of Python interpreter
+STARTUP_BUDGET = 1.0
+# network client and template engine are loaded only when they are used
+HEAVY_MODULES = ("requests", "bottle")
+MANAGER_MODULES = ("platformio.managers.platform", "platformio.managers.lib",
+                   "platformio.ide.projectgenerator")
+
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.time()
+from platformio.__main__ import main
+sys.argv = ["platformio"] + json.loads(sys.argv[1])
+try:
+    main()
+except SystemExit:
+    pass
+sys.stderr.write(json.dumps({
+    "time": time.time() - start,
+    "modules": [n for n, m in sys.modules.items() if m]
+}))
+"""
+
+
+@pytest.mark.parametrize("args,unused_modules", [
+    (["--version"], HEAVY_MODULES + MANAGER_MODULES),
+    (["settings", "get"], HEAVY_MODULES + MANAGER_MODULES),
+    (["--help"], HEAVY_MODULES),
+    (["boards", "--help"], HEAVY_MODULES),
+    (["init", "--help"], HEAVY_MODULES),
+])
+def test_startup_time(tmpdir, args, unused_modules):
+    # the periodic checks for the updates are not a part of the startup
+    now = int(time())
+    tmpdir.join("appstate.json").write(json.dumps({
+        "last_version": __version__,
+        "last_check": {"platformio_upgrade": now,
+                       "platforms_update": now,
+                       "libraries_update": now}
+    }))
+    env = dict(os.environ)
+    env.update({
+        "PLATFORMIO_HOME_DIR": str(tmpdir),
+        "PLATFORMIO_SETTING_ENABLE_TELEMETRY": "No",
+        "PLATFORMIO_SETTING_ENABLE_PROMPTS": "No",
+        "PYTHONPATH": os.pathsep.join(sys.path)
+    })
+    times = []
+    for _ in range(3):
+        p = subprocess.Popen(
+            [sys.executable, "-c", STARTUP_SCRIPT, json.dumps(args)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env)
+        _, err = p.communicate()
+        result = json.loads(err.strip().splitlines()[-1])
+        times.append(result['time'])
+        assert not set(unused_modules) & set(result['modules'])
+    assert min(times) < STARTUP_BUDGET
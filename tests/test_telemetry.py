@@ -0,0 +1,73 @@
+# Copyright 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+from time import time
+from urlparse import parse_qs
+
+import pytest
+
+from platformio.telemetry import TelemetrySpool
+
+
+@pytest.fixture
+def collector(request):
+    """Stand-in for Measurement Protocol collector, records the batches."""
+
+    class CollectorHandler(BaseHTTPRequestHandler):
+
+        def do_POST(self):  # pylint: disable=invalid-name
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            if server.offline:
+                self.send_response(503)
+            else:
+                server.batches.append(
+                    [parse_qs(line) for line in body.split("\n")])
+                self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):  # pylint: disable=arguments-differ
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), CollectorHandler)
+    server.batches = []
+    server.offline = False
+    server.url = "http://127.0.0.1:%d/batch" % server.server_port
+    thread = Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    request.addfinalizer(server.shutdown)
+    return server
+
+
+def test_spool_flush(tmpdir, collector):
+    spool = TelemetrySpool(str(tmpdir.join("telemetry.spool")))
+    assert not spool.is_flush_due()
+    for i in range(25):
+        spool.append({"t": "event", "ea": "action%d" % i, "qt": time() - 1})
+    assert spool.is_flush_due()
+
+    collector.offline = True
+    assert spool.flush(collector.url) == 0
+    assert len(tmpdir.join("telemetry.spool").readlines()) == 25
+    assert not spool.is_flush_due()
+
+    collector.offline = False
+    assert spool.flush(collector.url) == 25
+    assert [len(b) for b in collector.batches] == [20, 5]
+    hit = collector.batches[1][-1]
+    assert hit['ea'] == ["action24"] and int(hit['qt'][0]) >= 1000
+    assert not tmpdir.join("telemetry.spool").check()
+    assert spool.flush(collector.url) == 0
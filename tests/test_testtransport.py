@@ -0,0 +1,79 @@
+# Copyright 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import socket
+import sys
+import threading
+from time import sleep
+
+import pytest
+
+from platformio import exception, testtransport
+
+UNITY_OUTPUT = ("test/test_main.c:10:test_a:PASS\n"
+                "test/test_main.c:11:test_b:FAIL: Expected 1 Was 2\n"
+                "-----------------------\n"
+                "2 Tests 1 Failures 0 Ignored\n")
+
+
+def _read_lines(transport):
+    lines = []
+    with transport:
+        while True:
+            line = transport.readline()
+            if line is None:
+                break
+            if line:
+                lines.append(line.strip())
+    return lines
+
+
+@pytest.mark.parametrize("name", ["subprocess", "pty"])
+def test_host_transport(name):
+    if name == "pty" and not hasattr(os, "openpty"):
+        pytest.skip("no pseudo-terminals")
+    transport = testtransport.get_transport(name, program=sys.executable)
+    transport.args += ["-c", "import sys; sys.stdout.write(%r)" % UNITY_OUTPUT]
+    assert _read_lines(transport) == UNITY_OUTPUT.strip().split("\n")
+
+
+def test_tcp_transport():
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+
+    def _serve():
+        conn, _ = server.accept()
+        # the line is split by the timeout of the transport
+        conn.sendall(UNITY_OUTPUT[:10])
+        sleep(0.3)
+        conn.sendall(UNITY_OUTPUT[10:])
+        conn.close()
+
+    t = threading.Thread(target=_serve)
+    t.start()
+    transport = testtransport.get_transport(
+        "tcp://127.0.0.1:%d" % server.getsockname()[1])
+    transport.READ_TIMEOUT = 0.1
+    try:
+        assert _read_lines(transport) == UNITY_OUTPUT.strip().split("\n")
+    finally:
+        t.join()
+        server.close()
+
+
+def test_unknown_transport():
+    with pytest.raises(exception.PlatformioException):
+        testtransport.get_transport("usb")
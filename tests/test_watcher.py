@@ -0,0 +1,67 @@
+# Copyright 2014-present PlatformIO <contact@platformio.org>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from threading import Timer
+
+from platformio import exception
+from platformio.commands.run import cli as cmd_run
+from platformio.watcher import Watcher
+
+
+def test_watch_changes(tmpdir):
+    src_dir = tmpdir.mkdir("src")
+    src_dir.join("main.c").write("int main() {}")
+    config = tmpdir.join("platformio.ini")
+    config.write("[env:native]")
+
+    watcher = Watcher([str(src_dir), str(config)], debounce=0.1)
+    snapshot = watcher.snapshot()
+    assert str(src_dir.join("main.c")) in snapshot
+
+    # temporary and hidden files are ignored
+    src_dir.join("tmp.cpp").write("")
+    src_dir.join("tmp.cpp").remove()
+    src_dir.join(".main.c.swp").write("")
+
+    def _change():
+        src_dir.mkdir("sub").join("foo.c").write("")
+        config.write("[env:native]\nbuild_flags = -DFOO")
+
+    Timer(0.3, _change).start()
+    snapshot, changes = watcher.wait(snapshot)
+    watcher.close()
+    assert changes == [str(config), str(src_dir.join("sub", "foo.c"))]
+    assert str(src_dir.join(".main.c.swp")) not in snapshot
+
+
+def test_watch_broken_config(clirunner, monkeypatch, tmpdir):
+    tmpdir.join("platformio.ini").write("[foo]\n")
+    iterations = []
+
+    def _wait(self, snapshot):
+        config = tmpdir.join("platformio.ini")
+        iterations.append(self.paths)
+        if len(iterations) == 1:
+            # the option without the value can not be parsed
+            config.write("[env:native]\nplatform\n")
+            return snapshot, [str(config)]
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(Watcher, "wait", _wait)
+    result = clirunner.invoke(cmd_run, ["-d", str(tmpdir), "--watch"])
+    # the last iteration has failed
+    assert isinstance(result.exception, exception.ReturnErrorCode)
+    assert "Invalid environment 'foo'" in result.output
+    assert "contains parsing errors" in result.output
+    assert iterations[1] == [str(tmpdir.join("platformio.ini"))]